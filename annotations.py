@@ -0,0 +1,210 @@
+import argparse
+import csv
+import json
+import os
+import shapely
+from shapely import STRtree
+from classes import Elevator, Stairs
+from svg_parser import parse_svg
+from autosave import settings_path, read_settings, write_settings
+from values import MARKER_MATCH_DISTANCE
+
+MARKER_TYPES = {"elevator": Elevator, "stairs": Stairs}
+
+def shape_centroid(shape):
+    """
+    Calculates the centroid of a shape outline.
+
+    Parameters:
+        shape: List of (x, y) tuples
+
+    Returns:
+        (x, y) tuple
+    """
+    if len(shape) >= 3:
+        centroid = shapely.Polygon(shape).centroid
+        if not centroid.is_empty:
+            return (centroid.x, centroid.y)
+    xs, ys = zip(*shape)
+    return (sum(xs) / len(xs), sum(ys) / len(ys))
+
+def detect_markers(circles, squares, elevators=(), stairs=(), distance=MARKER_MATCH_DISTANCE):
+    """
+    Turns the shapes group into markers: polygons (circles) become elevators and
+    polylines (squares) become stairs, placed at their centroids. Shapes that already
+    have a marker within distance are skipped.
+
+    Parameters:
+        circles: List of polygons from the shapes group
+        squares: List of polylines from the shapes group
+        elevators: Elevators already placed on the floor
+        stairs: Stairs already placed on the floor
+        distance: Distance under which a shape counts as already annotated
+
+    Returns:
+        (new_elevators, new_stairs) tuple, IDs are assigned by match_marker_ids
+    """
+    def new_markers(shapes, existing, marker_class):
+        centroids = [shape_centroid(shape) for shape in shapes if shape]
+        if existing and centroids:
+            tree = STRtree(shapely.points([m.position for m in existing]))
+            covered, _ = tree.query(shapely.points(centroids), predicate="dwithin", distance=distance)
+            covered = set(covered.tolist())
+            centroids = [c for i, c in enumerate(centroids) if i not in covered]
+        return [marker_class(c, None) for c in centroids]
+
+    return new_markers(circles, list(elevators), Elevator), new_markers(squares, list(stairs), Stairs)
+
+def match_marker_ids(markers, reference_markers, taken_ids=(), distance=MARKER_MATCH_DISTANCE):
+    """
+    Gives each marker the ID of the nearest reference marker (usually the same shaft on
+    another floor) within distance, or a new unused ID when nothing matches.
+
+    Parameters:
+        markers: Markers to assign IDs to, modified in place
+        reference_markers: Markers of the same type on other floors
+        taken_ids: IDs already used on this floor
+        distance: Largest distance at which two markers are the same shaft
+
+    Returns:
+        Number of markers that matched a reference marker
+    """
+    used = set(taken_ids)
+    next_id = max([m.id for m in reference_markers] + list(used) + [0]) + 1
+    matched = 0
+
+    nearest = {}
+    if markers and reference_markers:
+        tree = STRtree(shapely.points([m.position for m in reference_markers]))
+        marker_indices, reference_indices = tree.query_nearest(
+            shapely.points([m.position for m in markers]), max_distance=distance, all_matches=False)
+        nearest = dict(zip(marker_indices.tolist(), reference_indices.tolist()))
+
+    for i, marker in enumerate(markers):
+        reference_id = reference_markers[nearest[i]].id if i in nearest else None
+        if reference_id is not None and reference_id not in used:
+            marker.id = reference_id
+            matched += 1
+        else:
+            while next_id in used:
+                next_id += 1
+            marker.id = next_id
+        used.add(marker.id)
+    return matched
+
+def read_annotations(file_path):
+    """
+    Reads marker placements from a CSV or JSON file.
+
+    CSV files need floor, type, x and y columns, with an optional id column. JSON
+    files hold a list of objects with the same keys. type is elevator or stairs, and
+    positions are in the same model coordinates as the settings file.
+
+    Parameters:
+        file_path: Path to a .csv or .json file
+
+    Returns:
+        Dictionary mapping floor name to {"elevators": [...], "stairs": [...]} marker lists
+    """
+    with open(file_path, newline="") as file:
+        if file_path.lower().endswith(".json"):
+            rows = json.load(file)
+        else:
+            rows = list(csv.DictReader(file))
+
+    floors = {}
+    for row in rows:
+        marker_type = str(row["type"]).strip().lower()
+        if marker_type not in MARKER_TYPES:
+            raise ValueError(f"Unknown marker type '{row['type']}' for floor {row['floor']}")
+        marker_id = int(row["id"]) if row.get("id") not in (None, "") else None
+        marker = MARKER_TYPES[marker_type]((float(row["x"]), float(row["y"])), marker_id)
+        group = floors.setdefault(str(row["floor"]), {"elevators": [], "stairs": []})
+        group["elevators" if marker_type == "elevator" else "stairs"].append(marker)
+    return floors
+
+def read_settings_markers(map_name):
+    """
+    Reads the markers saved in a floor's settings file.
+
+    Returns:
+        (elevators, stairs) tuple, empty when the floor has no settings file
+    """
+    data = read_settings(map_name)
+    if data is None:
+        return [], []
+
+    def markers(records, marker_class):
+        result = []
+        for record in records:
+            marker = marker_class(tuple(record["position"]), record.get("id", 1))
+            marker.selected = record.get("selected", False)
+            result.append(marker)
+        return result
+
+    return markers(data.get("elevators", []), Elevator), markers(data.get("stairs", []), Stairs)
+
+def write_settings_markers(map_name, elevators, stairs):
+    """
+    Replaces the markers in a floor's settings file, keeping everything else in it.
+    Pending autosave records are folded in first, and the file is replaced atomically.
+    """
+    data = read_settings(map_name) or {}
+    data["elevators"] = [{"position": e.position, "id": e.id, "selected": e.selected} for e in elevators]
+    data["stairs"] = [{"position": s.position, "id": s.id, "selected": s.selected} for s in stairs]
+    write_settings(map_name, data)
+
+def assign_missing_ids(floors):
+    """
+    Matches markers imported without an ID to markers on the floors before them.
+
+    Parameters:
+        floors: Ordered dictionary of floor name to {"elevators": [...], "stairs": [...]}
+    """
+    for key in ("elevators", "stairs"):
+        reference = []
+        for markers in floors.values():
+            missing = [m for m in markers[key] if m.id is None]
+            if missing:
+                match_marker_ids(missing, reference, [m.id for m in markers[key] if m.id is not None])
+            reference.extend(markers[key])
+
+def detect_building(svg_paths):
+    """
+    Detects markers on every floor of a building and matches their IDs floor to floor.
+    Markers already saved for a floor are kept and used as references.
+
+    Parameters:
+        svg_paths: SVG files of the floors, in floor order
+
+    Returns:
+        Dictionary of floor name to {"elevators": [...], "stairs": [...]}
+    """
+    floors = {}
+    for svg_path in svg_paths:
+        map_name = os.path.splitext(os.path.basename(svg_path))[0]
+        _, _, _, _, _, _, circles, squares = parse_svg(svg_path)
+        saved_elevators, saved_stairs = read_settings_markers(map_name)
+        elevators, stairs = detect_markers(circles, squares, saved_elevators, saved_stairs)
+        floors[map_name] = {"elevators": saved_elevators + elevators, "stairs": saved_stairs + stairs}
+    assign_missing_ids(floors)
+    return floors
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk elevator and stairs annotation")
+    parser.add_argument("files", nargs="+", help="SVG floors to auto-detect (in floor order), or a CSV/JSON import")
+    args = parser.parse_args()
+
+    if len(args.files) == 1 and not args.files[0].lower().endswith(".svg"):
+        floors = read_annotations(args.files[0])
+        assign_missing_ids(floors)
+    else:
+        floors = detect_building(args.files)
+
+    for map_name, markers in floors.items():
+        write_settings_markers(map_name, markers["elevators"], markers["stairs"])
+        print(f"{map_name}: {len(markers['elevators'])} elevators, {len(markers['stairs'])} stairs "
+              f"saved to {settings_path(map_name)}")
+
+if __name__ == "__main__":
+    main()
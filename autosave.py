@@ -0,0 +1,194 @@
+import json
+import os
+import numpy as np
+from history import occurrence_keys, midline_key
+from selection import pack_selection, unpack_selection
+from values import AUTOSAVE_COMPACT_RECORDS
+
+def settings_path(map_name):
+    """Snapshot of a floor's settings, the file save_settings/load_settings have always used"""
+    return f"./output/{map_name}_settings.json"
+
+def journal_path(map_name):
+    """Append-only change records made since the snapshot"""
+    return f"./output/{map_name}_settings.journal"
+
+def atomic_write_json(file_path, data):
+    """
+    Writes JSON so that a crash leaves either the old file or the new one, never a mix:
+    the data goes to a temporary file that is flushed to disk and renamed over the target.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
+def marker_record(marker):
+    return {"position": list(marker.position), "id": marker.id, "selected": marker.selected}
+
+def midline_record(item):
+    path, color = item
+    return {"path": [list(p) for p in path], "color": list(color)}
+
+def apply_list_change(items, change):
+    # Same index convention as history.ListChange: drop old indices, insert at new ones
+    removed = set(change.get("removed", ()))
+    result = [item for i, item in enumerate(items) if i not in removed]
+    for i, item in change.get("added", ()):
+        result.insert(i, item)
+    return result
+
+def replay(data, record):
+    """Applies one journal record to settings data in its JSON form"""
+    if "selected_spaces" in record:
+        packed = data.get("selected_spaces")
+        selected = unpack_selection(packed, packed["count"]) if packed else None
+        if selected is not None:
+            selected[np.asarray(record["selected_spaces"], dtype=int)] ^= True
+            data["selected_spaces"] = pack_selection(selected)
+    for name in ("elevators", "stairs", "midlines"):
+        if name in record:
+            data[name] = apply_list_change(data.get(name, []), record[name])
+
+def read_settings(map_name):
+    """
+    Reads a floor's settings: the snapshot with the journal records written after it
+    replayed on top. A record torn by a crash mid-append is skipped.
+
+    Returns:
+        Settings dictionary, or None when the floor has never been saved
+    """
+    data = None
+    if os.path.exists(settings_path(map_name)):
+        with open(settings_path(map_name)) as file:
+            data = json.load(file)
+    if not os.path.exists(journal_path(map_name)):
+        return data
+
+    data = data if data is not None else {}
+    seq = data.get("seq", 0)
+    with open(journal_path(map_name)) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["seq"] > seq:  # Older records are already in the snapshot
+                replay(data, record)
+                seq = record["seq"]
+    data["seq"] = seq
+    return data
+
+def write_settings(map_name, data):
+    """Replaces a floor's snapshot atomically and drops the journal it now includes"""
+    atomic_write_json(settings_path(map_name), data)
+    if os.path.exists(journal_path(map_name)):
+        os.remove(journal_path(map_name))
+
+def append_record(map_name, record):
+    os.makedirs(os.path.dirname(journal_path(map_name)), exist_ok=True)
+    line = (json.dumps(record) + "\n").encode()
+    with open(journal_path(map_name), "ab+") as file:
+        # Start on a fresh line if the last append was torn by a crash
+        if file.seek(0, os.SEEK_END):
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                line = b"\n" + line
+        file.write(line)
+        file.flush()
+        os.fsync(file.fileno())
+
+def list_diff(old_items, old_keys, new_items, new_keys, to_record):
+    # Indices of the removed old items and (index, record) pairs of the added new ones
+    new_set, old_set = set(new_keys), set(old_keys)
+    removed = [i for i, k in enumerate(old_keys) if k not in new_set]
+    added = [[i, to_record(item)] for i, (item, k) in enumerate(zip(new_items, new_keys)) if k not in old_set]
+    return {"removed": removed, "added": added} if removed or added else None
+
+def marker_key(marker):
+    # Any change to a marker shows up as the old version removed and the new one added
+    return (id(marker), marker.id, marker.selected, tuple(marker.position))
+
+
+class FloorJournal:
+    """
+    Autosave of one floor. Each sync diffs the floor against what was last persisted and
+    appends only the difference to the journal; every AUTOSAVE_COMPACT_RECORDS records the
+    journal is folded into a new snapshot. Disk writes run on the workspace's writer thread,
+    in submission order.
+
+    The state passed in is a dictionary with "selected_spaces" (boolean array), "elevators",
+    "stairs" (marker lists) and "midlines" (list of (path, color) pairs).
+    """
+    KEYS = {"elevators": marker_key, "stairs": marker_key, "midlines": midline_key}
+    RECORDS = {"elevators": marker_record, "stairs": marker_record, "midlines": midline_record}
+
+    def __init__(self, map_name, writer, compact_records=AUTOSAVE_COMPACT_RECORDS):
+        self.map_name = map_name
+        self.writer = writer
+        self.compact_records = compact_records
+        self.seq = 0
+        self.pending_records = 0  # Journal records since the last snapshot
+        self.version = 0  # History version last synced
+        self.base = None  # What the files hold: selection copy and (items, keys) per list
+
+    def remember(self, state):
+        # Items are kept alive so their ids cannot be reused by new objects
+        self.base = {"selected_spaces": np.array(state["selected_spaces"], dtype=bool, copy=True)}
+        for name, key in self.KEYS.items():
+            items = list(state[name])
+            self.base[name] = (items, occurrence_keys(items, key))
+
+    def loaded(self, state, seq):
+        """Marks state, just read with read_settings, as what is on disk"""
+        self.seq = seq
+        self.remember(state)
+
+    def snapshot_data(self, state):
+        data = {name: [self.RECORDS[name](item) for item in state[name]] for name in self.KEYS}
+        data["selected_spaces"] = pack_selection(state["selected_spaces"])
+        data["seq"] = self.seq
+        return data
+
+    def sync(self, state):
+        """
+        Queues the changes since the last sync for the journal, compacting when it is due.
+
+        Returns:
+            Future of the write, or None when nothing changed
+        """
+        if self.base is None or self.pending_records >= self.compact_records:
+            return self.compact(state)
+
+        record = {}
+        old_selected = self.base["selected_spaces"]
+        selected = np.asarray(state["selected_spaces"], dtype=bool)
+        if len(old_selected) != len(selected):
+            return self.compact(state)
+        flipped = np.flatnonzero(old_selected != selected)
+        if len(flipped):
+            record["selected_spaces"] = flipped.tolist()
+        for name, key in self.KEYS.items():
+            old_items, old_keys = self.base[name]
+            items = list(state[name])
+            change = list_diff(old_items, old_keys, items, occurrence_keys(items, key), self.RECORDS[name])
+            if change is not None:
+                record[name] = change
+        if not record:
+            return None
+
+        self.seq += 1
+        record["seq"] = self.seq
+        self.pending_records += 1
+        self.remember(state)
+        return self.writer.submit(append_record, self.map_name, record)
+
+    def compact(self, state):
+        """Queues a full snapshot of the state, replacing the snapshot and journal on disk"""
+        data = self.snapshot_data(state)
+        self.pending_records = 0
+        self.remember(state)
+        return self.writer.submit(write_settings, self.map_name, data)
@@ -0,0 +1,73 @@
+"""
+Benchmark: marker click lookup and box selection, linear scan against the grid index.
+
+Usage:
+    python -m benchmarks.bench_markers [marker_count ...]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from classes import Elevator, MarkerLayer
+
+DEFAULT_COUNTS = (100, 1000, 10000)
+QUERIES = 2000
+
+
+def make_markers(count, seed=0):
+    """Elevators spread uniformly over the 800x600 model space."""
+    rng = random.Random(seed)
+    return [Elevator((rng.uniform(0, 800), rng.uniform(0, 600)), i + 1) for i in range(count)]
+
+
+def bytes_per_marker(count):
+    """Traced allocation per marker, position tuples included."""
+    tracemalloc.start()
+    markers = make_markers(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del markers
+    return size / count
+
+
+def time_clicks(lookup, points):
+    start = time.perf_counter()
+    for point in points:
+        lookup(point)
+    return time.perf_counter() - start
+
+
+def main(counts):
+    rng = random.Random(1)
+    points = [(rng.uniform(0, 800), rng.uniform(0, 600)) for _ in range(QUERIES)]
+    boxes = []
+    for x, y in points[:200]:
+        boxes.append((x, y, x + 100, y + 75))
+
+    print(f"{'markers':>8} {'B/marker':>9} {'scan click us':>14} {'grid click us':>14} "
+          f"{'scan box us':>12} {'grid box us':>12}")
+    for count in counts:
+        markers = make_markers(count)
+        layer = MarkerLayer(markers)
+
+        def scan_click(point):
+            for marker in markers:
+                if marker.is_clicked(point, 1.0, (0, 0)):
+                    return marker
+            return None
+
+        def scan_box(box):
+            return [m for m in markers
+                    if box[0] <= m.position[0] <= box[2] and box[1] <= m.position[1] <= box[3]]
+
+        scan = time_clicks(scan_click, points) / len(points) * 1e6
+        grid = time_clicks(layer.at, points) / len(points) * 1e6
+        scan_boxes = time_clicks(scan_box, boxes) / len(boxes) * 1e6
+        grid_boxes = time_clicks(layer.in_box, boxes) / len(boxes) * 1e6
+        print(f"{count:>8} {bytes_per_marker(count):>9.0f} {scan:>14.1f} {grid:>14.1f} "
+              f"{scan_boxes:>12.1f} {grid_boxes:>12.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_COUNTS)
@@ -0,0 +1,45 @@
+"""
+Benchmark: tiered midline engine against pygeoops on every space.
+
+Usage:
+    python -m benchmarks.bench_midlines [rooms_per_side ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_floor, write_floor_svg
+from geometry_utils import find_midline_path, rectangle_midline
+from svg_parser import parse_svg
+
+DEFAULT_SIZES = (8, 16, 32)
+
+
+def time_midlines(spaces, fast_path):
+    """Returns the seconds taken to compute the midline of every space."""
+    start = time.perf_counter()
+    for space in spaces:
+        find_midline_path(space, fast_path=fast_path)
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    print(f"{'floor':>7} {'spaces':>7} {'analytic':>9} {'pygeoops s':>11} {'tiered s':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rooms in sizes:
+            bands = max(1, rooms // 4)
+            label = f"{rooms}x{bands}"
+            file_path = os.path.join(tmp, f"floor_{label}.svg")
+            write_floor_svg(file_path, make_floor(rooms, bands=bands))
+            _, _, _, spaces, _, _, _, _ = parse_svg(file_path)
+
+            analytic = sum(1 for space in spaces if rectangle_midline(space) is not None)
+            full_time = time_midlines(spaces, fast_path=False)
+            tiered_time = time_midlines(spaces, fast_path=True)
+            print(f"{label:>7} {len(spaces):>7} {analytic:>9} {full_time:>11.3f} {tiered_time:>9.3f} "
+                  f"{full_time / tiered_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
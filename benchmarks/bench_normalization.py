@@ -0,0 +1,102 @@
+"""
+Benchmark: connectivity and merge stability of precise vs truncated normalization.
+
+Runs the full 'a' pipeline (all midlines + merge) on synthetic floors of
+growing size and reports, for each normalization mode, how many vertices
+collapsed during normalization, how many connected components the merged
+network has and how much of it ends up in the largest one.
+
+Usage:
+    python -m benchmarks.bench_normalization [rooms_per_side ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_floor, write_floor_svg
+from pipeline import handle_all_midlines
+from geometry_utils import snap_point
+from svg_parser import parse_svg
+
+DEFAULT_SIZES = (4, 8, 16, 32)
+UNIT_SCALE = 10.0  # Source coordinates in CAD-like units
+
+
+def count_components(midline_paths):
+    """Counts connected components of midlines sharing a snapped coordinate."""
+    parent = {}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for path in midline_paths:
+        keys = [snap_point(p) for p in path]
+        for key in keys:
+            parent.setdefault(key, key)
+        for key in keys[1:]:
+            parent[find(key)] = find(keys[0])
+    return len({find(key) for key in parent})
+
+
+def count_collapsed(shapes):
+    """Counts consecutive vertices that became identical after normalization."""
+    return sum(1 for shape in shapes for a, b in zip(shape, shape[1:]) if a == b)
+
+
+def run_case(file_path, precise):
+    """
+    Parses a floor and runs the all-midlines pipeline.
+
+    Returns:
+        Dictionary with collapse, connectivity and timing figures
+    """
+    start = time.perf_counter()
+    _, _, entrances, spaces, walls, _, _, _ = parse_svg(file_path, precise=precise)
+    parse_time = time.perf_counter() - start
+    collapsed = count_collapsed(entrances + spaces + walls)
+
+    start = time.perf_counter()
+    try:
+        color_array, midline_paths = handle_all_midlines(spaces, entrances, [], [])
+    except Exception as e:
+        return {"error": type(e).__name__, "collapsed": collapsed}
+    midline_time = time.perf_counter() - start
+
+    connected = sum(1 for color in color_array if color == (0, 255, 0))
+    return {
+        "spaces": len(spaces),
+        "collapsed": collapsed,
+        "midlines": len(midline_paths),
+        "components": count_components(midline_paths),
+        "connected": connected / len(midline_paths) if midline_paths else 0.0,
+        "parse_time": parse_time,
+        "midline_time": midline_time,
+    }
+
+
+def main(sizes):
+    print(f"{'floor':>7} {'mode':>9} {'spaces':>7} {'collapsed':>9} {'midlines':>9} "
+          f"{'components':>10} {'connected':>9} {'parse s':>8} {'midline s':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rooms in sizes:
+            # Grow both dimensions so the floor keeps its aspect ratio
+            bands = max(1, rooms // 4)
+            label = f"{rooms}x{bands}"
+            file_path = os.path.join(tmp, f"floor_{label}.svg")
+            write_floor_svg(file_path, make_floor(rooms, bands=bands, unit_scale=UNIT_SCALE))
+            for mode, precise in (("precise", True), ("truncated", False)):
+                result = run_case(file_path, precise)
+                if "error" in result:
+                    print(f"{label:>7} {mode:>9} {'':>7} {result['collapsed']:>9} failed: {result['error']}")
+                    continue
+                print(f"{label:>7} {mode:>9} {result['spaces']:>7} {result['collapsed']:>9} {result['midlines']:>9} "
+                      f"{result['components']:>10} {result['connected']:>9.1%} "
+                      f"{result['parse_time']:>8.3f} {result['midline_time']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,100 @@
+"""
+Benchmark: single-pass parse_svg against the former one-search-per-group parser.
+
+Each floor is written twice: flat, with every shape a direct child of its layer group,
+and nested the way CAD exports often are, with each layer's shapes split into untitled
+subgroups and a few paths inside groups. The former parser misses everything nested.
+
+Usage:
+    python -m benchmarks.bench_parsing [rooms_per_side ...]
+"""
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from benchmarks.synthetic import SVG_NS, make_floor, write_floor_svg
+from svg_parser import parse_svg, parse_path
+
+DEFAULT_SIZES = (32, 64, 128)
+SUBGROUP_SIZE = 50  # Shapes per untitled subgroup in the nested variant
+REPEAT = 5
+
+
+def former_extract_shapes(root, group_id, tag):
+    """The parser before single-pass classification: a document search per group, direct children only."""
+    group = root if group_id == "*" else root.find(f".//{{{SVG_NS}}}g[@id='{group_id}']")
+    shapes = []
+    if group is not None:
+        for element in group.findall(f"{{{SVG_NS}}}{tag}"):
+            if tag == 'path':
+                points = parse_path(element.get('d', ''), shapes)
+            else:
+                points = [(float(x), float(y)) for x, y in (p.split(',') for p in element.get('points', '').split())]
+            if points:
+                shapes.append(points)
+    return shapes
+
+
+def former_parse_svg(file_path, screen_width=800, screen_height=600):
+    root = ET.parse(file_path).getroot()
+    layers = [former_extract_shapes(root, group_id, tag) for group_id, tag in (
+        ("entrances", "polyline"), ("spaces", "polygon"), ("walls", "polyline"), ("*", "path"),
+        ("shapes", "polygon"), ("shapes", "polyline"))]
+    svg_width, svg_height = int(root.get('width', screen_width)), int(root.get('height', screen_height))
+    all_points = [p for shapes in layers for shape in shapes for p in shape]
+    max_x = max((p[0] for p in all_points), default=svg_width)
+    max_y = max((p[1] for p in all_points), default=svg_height)
+    return (screen_width, screen_height,
+            *([[(x / max_x * screen_width, y / max_y * screen_height) for x, y in s] for s in shapes] for shapes in layers))
+
+
+def nest_groups(file_path):
+    """Rewrites a floor with each layer's shapes in untitled subgroups and a path in every subgroup."""
+    ET.register_namespace("", SVG_NS)
+    tree = ET.parse(file_path)
+    for group in list(tree.getroot()):
+        children = list(group)
+        for child in children:
+            group.remove(child)
+        for start in range(0, len(children), SUBGROUP_SIZE):
+            subgroup = ET.SubElement(group, f"{{{SVG_NS}}}g")
+            subgroup.extend(children[start:start + SUBGROUP_SIZE])
+            ET.SubElement(subgroup, f"{{{SVG_NS}}}path", d="M 0 0 L 1 1")
+    tree.write(file_path)
+
+
+def best_time(parse, file_path):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = parse(file_path, precise=True) if parse is parse_svg else parse(file_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(sizes):
+    print(f"{'floor':>8} {'layout':>7} {'MB':>6} {'shapes':>7} {'former s':>9} {'former shapes':>14} "
+          f"{'single s':>9} {'speedup':>8} {'same':>5}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rooms in sizes:
+            bands = max(1, rooms // 4)
+            label = f"{rooms}x{bands}"
+            file_path = os.path.join(tmp, f"floor_{label}.svg")
+            write_floor_svg(file_path, make_floor(rooms, bands=bands))
+            for layout in ("flat", "nested"):
+                if layout == "nested":
+                    nest_groups(file_path)
+                former_time, former = best_time(former_parse_svg, file_path)
+                single_time, single = best_time(parse_svg, file_path)
+                count = sum(len(layer) for layer in single[2:])
+                former_count = sum(len(layer) for layer in former[2:])
+                print(f"{label:>8} {layout:>7} {os.path.getsize(file_path) / 2 ** 20:>6.1f} {count:>7} "
+                      f"{former_time:>9.3f} {former_count:>14} {single_time:>9.3f} "
+                      f"{former_time / single_time:>7.1f}x {'yes' if former == single else 'no':>5}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
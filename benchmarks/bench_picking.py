@@ -0,0 +1,61 @@
+"""
+Benchmark: hover lookup of the innermost space, linear scan against the space index and the hit map.
+
+A building outline enclosing every room is added to the floor, so every lookup has to
+pick the innermost of overlapping spaces.
+
+Usage:
+    python -m benchmarks.bench_picking [rooms_per_side ...]
+"""
+import random
+import sys
+import time
+
+from benchmarks.synthetic import make_floor
+from geometry_utils import find_innermost_polygon, shape_bounds
+from selection import SpaceIndex, HitMap
+
+DEFAULT_SIZES = (8, 16, 32)
+QUERIES = 5000
+
+
+def time_lookups(lookup, points):
+    start = time.perf_counter()
+    results = [lookup(point) for point in points]
+    return time.perf_counter() - start, results
+
+
+def main(sizes):
+    print(f"{'floor':>7} {'spaces':>7} {'scan us':>8} {'index us':>9} {'cold map us':>12} {'map us':>7} "
+          f"{'edge %':>7} {'tiles':>6} {'agree':>6}")
+    for rooms in sizes:
+        bands = max(1, rooms // 4)
+        spaces = make_floor(rooms, bands=bands)["spaces"]
+        min_x, min_y, max_x, max_y = shape_bounds([p for space in spaces for p in space])
+        spaces.append([(min_x - 10, min_y - 10), (max_x + 10, min_y - 10), (max_x + 10, max_y + 10),
+                       (min_x - 10, max_y + 10)])
+        rng = random.Random(rooms)
+        points = [(rng.uniform(min_x, max_x), rng.uniform(min_y, max_y)) for _ in range(QUERIES)]
+
+        def scan(point):
+            innermost = find_innermost_polygon(point, spaces)
+            return None if innermost is None else next(i for i, s in enumerate(spaces) if s is innermost)
+
+        index = SpaceIndex(spaces)
+        hit_map = HitMap(index)
+        scan_time, expected = time_lookups(scan, points[:500])
+        index_time, indexed = time_lookups(index.innermost, points)
+        cold_time, _ = time_lookups(hit_map.innermost, points)
+        map_time, mapped = time_lookups(hit_map.innermost, points)
+
+        edges = sum(1 for labels in hit_map.tiles.values() for label in labels.flat if label == HitMap.EDGE)
+        cells = sum(labels.size for labels in hit_map.tiles.values())
+        agree = mapped == indexed and mapped[:500] == expected
+        print(f"{f'{rooms}x{bands}':>7} {len(spaces):>7} {scan_time / 500 * 1e6:>8.1f} "
+              f"{index_time / QUERIES * 1e6:>9.1f} {cold_time / QUERIES * 1e6:>12.1f} "
+              f"{map_time / QUERIES * 1e6:>7.1f} {edges / cells * 100:>7.1f} {len(hit_map.tiles):>6} "
+              f"{'yes' if agree else 'NO':>6}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,398 @@
+"""
+Golden-output regression and performance harness for the headless pipeline.
+
+Each floor of the corpus is parsed and repaired, gets its elevators and stairs from the
+shapes group, and goes through all midlines ('a'), optimization ('p') and export ('e').
+The midline network topology and the exported SVG structure are compared with the
+floor's golden record within tolerances, and stage timings and peak memory are
+compared with the recorded ones. Timings are compared relative to a calibration
+workload that uses none of this repository's code, timed next to every run, so a
+machine that is busier or slower than when the goldens were recorded scales them. The
+run fails when an output differs or a stage got slower or bigger than --threshold
+times its (scaled) golden figure. Doorway stitching is also
+checked on every floor and on STITCH_FLOORS, with and without a wall index: it must
+add no connector through a wall, into a space the door does not open into or
+repeating a door's connector, and must join the thick-walled floor into one network.
+
+The corpus is the synthetic floors below plus INPUT_PATH and any SVG passed on the
+command line. Golden records live in benchmarks/golden/; --update rewrites them (do
+that on the machine the performance figures should be compared on).
+
+Usage:
+    python -m benchmarks.regression [floors/*.svg] [--threshold 1.5] [--repeat N] [--no-memory] [--update]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import shapely
+
+from annotations import detect_markers
+from benchmarks.synthetic import make_floor, write_floor_svg
+from collision import WallIndex
+from geometry_utils import snap_point
+from network import door_tolerances, entrance_midpoint, midline_components, stitch_networks
+from pipeline import handle_all_midlines, handle_midline_path, handle_optimize_midlines
+from svg_parser import export_svg
+from validation import load_svg
+from values import INPUT_PATH
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "golden")
+SYNTHETIC_FLOORS = {  # Case name to make_floor arguments
+    "synthetic_4x1": dict(rooms_per_side=4),
+    "synthetic_4x1_square": dict(rooms_per_side=4, room_depth=40.0),  # Rooms normalize to squares
+    "synthetic_8x2": dict(rooms_per_side=8, bands=2),
+    "synthetic_8x2_cad": dict(rooms_per_side=8, bands=2, unit_scale=10.0),
+    "synthetic_16x4": dict(rooms_per_side=16, bands=4),
+    "synthetic_32x8": dict(rooms_per_side=32, bands=8),
+}
+STITCH_FLOORS = {  # Stitching checked only: make_floor arguments and whether stitching must join the floor
+    "synthetic_64x16": (dict(rooms_per_side=64, bands=16), False),  # Rooms smaller than a fixed reach
+    "synthetic_2x1_thick": (dict(rooms_per_side=2, wall_thickness=5), True),  # Doors beyond the connector reach
+}
+STAGES = ("parse", "midlines", "optimize", "export")
+POSITION_TOLERANCE = 0.5  # Junctions and endpoints this close to their golden position match
+LENGTH_TOLERANCE = 0.01  # Allowed relative change of the total network length
+COUNT_TOLERANCE = 0.02  # Allowed relative change of path, vertex and edge counts
+MIN_SECONDS = 0.05  # Stages faster than this in the golden run are not checked for speed
+MIN_PEAK_MB = 1.0  # Peaks smaller than this in the golden run are not checked for memory
+CALIBRATION_POINTS = 10000  # Size of the calibration workload
+
+
+def network_summary(midline_paths):
+    """
+    Topology of a midline network: vertices snapped to SNAP_TOLERANCE, the degree of each,
+    connected components and total length.
+
+    Returns:
+        JSON-serializable dictionary; junctions are [x, y, degree] for degree 3 and up
+    """
+    neighbours = {}
+    length = 0.0
+    for path in midline_paths:
+        keys = [snap_point(p) for p in path]
+        for key in keys:
+            neighbours.setdefault(key, set())
+        for (a, b), p, q in zip(zip(keys, keys[1:]), path, path[1:]):
+            if a != b:
+                neighbours[a].add(b)
+                neighbours[b].add(a)
+                length += math.dist(p, q)
+
+    parent = {key: key for key in neighbours}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for key, others in neighbours.items():
+        for other in others:
+            parent[find(other)] = find(key)
+    return {
+        "paths": len(midline_paths),
+        "vertices": sum(len(path) for path in midline_paths),
+        "edges": sum(len(others) for others in neighbours.values()) // 2,
+        "components": len({find(key) for key in neighbours}),
+        "length": round(length, 3),
+        "junctions": sorted([round(x, 3), round(y, 3), len(n)] for (x, y), n in neighbours.items() if len(n) >= 3),
+        "endpoints": sorted([round(x, 3), round(y, 3)] for (x, y), n in neighbours.items() if len(n) == 1),
+    }
+
+
+def export_summary(file_path):
+    """Structure of an exported SVG: per group id, element counts by tag and the number of points"""
+    groups = {}
+    for group in ET.parse(file_path).getroot():
+        tags, points = {}, 0
+        for element in group:
+            tag = element.tag.split("}")[-1]
+            tags[tag] = tags.get(tag, 0) + 1
+            points += len(element.get("points", "").split())
+        groups[group.get("id")] = {"elements": tags, "points": points}
+    return groups
+
+
+def unmatched(points, golden, tolerance=POSITION_TOLERANCE):
+    """Counts points with no golden point of the same kind within tolerance, in either direction"""
+    a = np.array(points, dtype=float).reshape(-1, len(points[0]) if points else 2)
+    b = np.array(golden, dtype=float).reshape(-1, len(golden[0]) if golden else 2)
+    if not len(a) or not len(b):
+        return len(a), len(b)
+    close = np.zeros((len(a), len(b)), dtype=bool)
+    for start in range(0, len(a), 1024):
+        chunk = a[start:start + 1024]
+        near = np.hypot(chunk[:, None, 0] - b[None, :, 0], chunk[:, None, 1] - b[None, :, 1]) <= tolerance
+        if a.shape[1] > 2:  # Junction degrees must agree too
+            near &= chunk[:, None, 2] == b[None, :, 2]
+        close[start:start + 1024] = near
+    return int((~close.any(axis=1)).sum()), int((~close.any(axis=0)).sum())
+
+
+def relative_change(value, golden):
+    return abs(value - golden) / max(abs(golden), 1)
+
+
+def diff_network(name, summary, golden):
+    """Differences between two network summaries that exceed the tolerances"""
+    problems = []
+    if summary["components"] != golden["components"]:
+        problems.append(f"{name}: {summary['components']} components, golden {golden['components']}")
+    for key in ("paths", "vertices", "edges"):
+        if relative_change(summary[key], golden[key]) > COUNT_TOLERANCE:
+            problems.append(f"{name}: {summary[key]} {key}, golden {golden[key]}")
+    if relative_change(summary["length"], golden["length"]) > LENGTH_TOLERANCE:
+        problems.append(f"{name}: length {summary['length']:.1f}, golden {golden['length']:.1f}")
+    for key in ("junctions", "endpoints"):
+        extra, missing = unmatched(summary[key], golden[key])
+        if extra or missing:
+            problems.append(f"{name}: {extra} {key} not in golden, {missing} golden {key} missing")
+    return problems
+
+
+def diff_export(summary, golden):
+    """Export groups must hold the same elements; midline counts may move within COUNT_TOLERANCE"""
+    problems = []
+    for group in sorted(set(summary) | set(golden)):
+        if group not in summary or group not in golden:
+            problems.append(f"export: group '{group}' {'missing' if group in golden else 'added'}")
+            continue
+        tolerance = COUNT_TOLERANCE if group == "midlines" else 0
+        ours, theirs = summary[group], golden[group]
+        for tag in sorted(set(ours["elements"]) | set(theirs["elements"])):
+            count, expected = ours["elements"].get(tag, 0), theirs["elements"].get(tag, 0)
+            if relative_change(count, expected) > tolerance:
+                problems.append(f"export: {count} {tag} in '{group}', golden {expected}")
+        if relative_change(ours["points"], theirs["points"]) > tolerance:
+            problems.append(f"export: {ours['points']} points in '{group}', golden {theirs['points']}")
+    return problems
+
+
+def check_stitching(file_path, must_join=False):
+    """
+    Runs doorway stitching without a wall index, as callers with no walls do, and with
+    the floor's, as the a key does, and checks what it adds: no connector may cross a
+    wall, and a doorway connector must end in a space within its door's reach that the
+    door has no other connector into. With must_join, stitching must also leave one
+    network.
+
+    Returns:
+        (added_counts, problems) tuple, added_counts without and with a wall index
+    """
+    (_, _, entrances, spaces, walls, _, _, _), _ = load_svg(file_path, cache_dir=None)
+    entrances = [e for e in entrances if len(e) >= 2]
+    tolerances = dict(zip((entrance_midpoint(e) for e in entrances), door_tolerances(entrances).tolist()))
+    polygons = [shapely.Polygon(s) if len(s) >= 3 else shapely.Point(s[0]) for s in spaces]
+    space_tree = shapely.STRtree(polygons)
+    floor_walls = WallIndex(walls) if walls else None
+    added_counts, problems = [], []
+
+    for label, wall_index in (("without walls", None), ("with walls", floor_walls)):
+        space_midlines = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = handle_midline_path([True] * len(spaces), spaces, entrances, [], [], [], None, space_midlines,
+                                        wall_index)
+        stitched, added_count = stitch_networks(paths, spaces, entrances, space_midlines, wall_index=wall_index)
+        added = stitched[len(paths):]
+        added_counts.append(added_count)
+
+        crossing = int(floor_walls.crossing_mask(added).sum()) if floor_walls and added else 0
+        if crossing:
+            problems.append(f"stitching {label}: {crossing} of {len(added)} added connectors cross a wall")
+
+        # Door and space pairs of the connectors handle_midline_path made, then of the added ones
+        connected = {(tuple(path[0]), i) for path in paths if len(path) == 2 and tuple(path[0]) in tolerances
+                     for i in space_tree.query(shapely.Point(path[-1]), predicate="intersects").tolist()}
+        foreign = duplicate = 0
+        for path in added:
+            door = tuple(path[0])
+            if door not in tolerances:
+                continue  # A bridge between loose ends, not a doorway connector
+            ends_in = space_tree.query(shapely.Point(path[-1]), predicate="intersects").tolist()
+            if not any(polygons[i].distance(shapely.Point(door)) <= tolerances[door] for i in ends_in):
+                foreign += 1
+            if any((door, i) in connected for i in ends_in):
+                duplicate += 1
+            connected.update((door, i) for i in ends_in)
+        if foreign:
+            problems.append(f"stitching {label}: {foreign} doorway connectors end in a space their door "
+                            "does not open into")
+        if duplicate:
+            problems.append(f"stitching {label}: {duplicate} doorway connectors repeat a door's connector "
+                            "into the same space")
+
+        components = midline_components(stitched)
+        networks = len({components.find(snap_point(path[0])) for path in stitched if path})
+        if must_join and networks != 1:
+            problems.append(f"stitching {label}: {networks} networks left, the floor should be one")
+    return added_counts, problems
+
+
+def run_pipeline(file_path, output_path, timings):
+    """Runs parse, all midlines, optimize and export, adding each stage's seconds to timings"""
+    start = time.perf_counter()
+    (_, _, entrances, spaces, walls, _, circles, squares), _ = load_svg(file_path, cache_dir=None)
+    elevators, stairs = detect_markers(circles, squares)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, midline_paths = handle_all_midlines(spaces, entrances, elevators, stairs, None, WallIndex(walls))
+    timings["midlines"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, optimized_paths, _ = handle_optimize_midlines(midline_paths)
+    timings["optimize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    export_svg(output_path, entrances, spaces, walls, optimized_paths, False, None, elevators, stairs)
+    timings["export"] = time.perf_counter() - start
+    return midline_paths, optimized_paths
+
+
+def calibration_run():
+    """
+    Times a fixed workload in the pipeline's mix of Python loops, numpy and shapely that
+    uses none of this repository's code, as a measure of the machine's current speed.
+
+    Returns:
+        Seconds taken
+    """
+    coords = np.random.default_rng(0).random((CALIBRATION_POINTS, 2)) * 100
+    start = time.perf_counter()
+    points = shapely.points(coords)
+    shapely.STRtree(points).query(points, predicate="dwithin", distance=1.0)
+    shapely.buffer(points[:CALIBRATION_POINTS // 10], 1.0)
+    sum(x * y for x, y in coords.tolist())
+    return time.perf_counter() - start
+
+
+def run_case(file_path, repeat, memory=True):
+    """
+    Runs one floor: the best of repeat timed runs, each after a calibration run, then
+    with memory one traced run for peak memory (tracing makes that run several times
+    slower).
+
+    Returns:
+        Record with "midlines", "optimized" and "export" summaries and "perf" figures
+    """
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        output_path = os.path.join(tmp, "export.svg")
+        best = {}
+        for _ in range(repeat):
+            timings = {"calibration": calibration_run()}
+            midline_paths, optimized_paths = run_pipeline(file_path, output_path, timings)
+            best = {stage: min(seconds, best.get(stage, math.inf)) for stage, seconds in timings.items()}
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            try:
+                run_pipeline(file_path, output_path, {})
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        exported = export_summary(output_path)
+
+    perf = {f"{stage}_seconds": round(best[stage], 4) for stage in ("calibration",) + STAGES}
+    perf["peak_mb"] = None if peak is None else round(peak / 2 ** 20, 2)
+    return {"midlines": network_summary(midline_paths), "optimized": network_summary(optimized_paths),
+            "export": exported, "perf": perf}
+
+
+def diff_perf(perf, golden, threshold):
+    # Golden timings scaled by how much slower the calibration workload runs now
+    scale = perf["calibration_seconds"] / golden["calibration_seconds"] if "calibration_seconds" in golden else 1.0
+    problems = []
+    for stage in STAGES:
+        key = f"{stage}_seconds"
+        if golden[key] >= MIN_SECONDS and perf[key] > golden[key] * scale * threshold:
+            problems.append(f"perf: {stage} {perf[key]:.3f}s, golden {golden[key]:.3f}s "
+                            f"({golden[key] * scale:.3f}s at the calibrated speed)")
+    if None in (perf["peak_mb"], golden["peak_mb"]):
+        return problems
+    if golden["peak_mb"] >= MIN_PEAK_MB and perf["peak_mb"] > golden["peak_mb"] * threshold:
+        problems.append(f"perf: peak {perf['peak_mb']:.1f} MB, golden {golden['peak_mb']:.1f} MB")
+    return problems
+
+
+def corpus(files, tmp):
+    """(case name, SVG path) pairs: the synthetic floors, then the sample floors"""
+    cases = []
+    for name, arguments in SYNTHETIC_FLOORS.items():
+        file_path = os.path.join(tmp, f"{name}.svg")
+        write_floor_svg(file_path, make_floor(**arguments))
+        cases.append((name, file_path))
+    samples = list(files) or ([INPUT_PATH] if os.path.exists(INPUT_PATH) else [])
+    for file_path in samples:
+        cases.append((os.path.splitext(os.path.basename(file_path))[0], file_path))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-output regression and performance harness")
+    parser.add_argument("files", nargs="*", help="Sample SVG floors (default: INPUT_PATH if it exists)")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="Fail when a stage takes or a run allocates this many times its golden figure")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per floor, the fastest counts")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced run that measures peak memory")
+    parser.add_argument("--update", action="store_true", help="Rewrite the golden records")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'floor':>18} {'parse s':>8} {'midline s':>9} {'optimize s':>10} {'export s':>8} {'peak MB':>8}  result")
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = corpus(args.files, tmp)
+        for name, file_path in cases:
+            record = run_case(file_path, max(args.repeat, 1), not args.no_memory)
+            perf = record["perf"]
+            golden_path = os.path.join(GOLDEN_DIR, f"{name}.json")
+            if args.update:
+                os.makedirs(GOLDEN_DIR, exist_ok=True)
+                with open(golden_path, "w") as file:
+                    json.dump(record, file, indent=1)
+                result, problems = "updated", []
+            elif not os.path.exists(golden_path):
+                result, problems = "no golden, run with --update", []
+            else:
+                with open(golden_path) as file:
+                    golden = json.load(file)
+                problems = (diff_network("midlines", record["midlines"], golden["midlines"])
+                            + diff_network("optimized", record["optimized"], golden["optimized"])
+                            + diff_export(record["export"], golden["export"])
+                            + diff_perf(perf, golden["perf"], args.threshold))
+                result = "FAIL" if problems else "ok"
+            print(f"{name:>18} {perf['parse_seconds']:>8.3f} {perf['midlines_seconds']:>9.3f} "
+                  f"{perf['optimize_seconds']:>10.3f} {perf['export_seconds']:>8.3f} {perf['peak_mb'] or 0:>8.1f}  {result}")
+            for problem in problems:
+                print(f"{'':>20}{problem}")
+            failed = failed or bool(problems)
+
+        joined = set()
+        for name, (arguments, must_join) in STITCH_FLOORS.items():
+            file_path = os.path.join(tmp, f"{name}.svg")
+            write_floor_svg(file_path, make_floor(**arguments))
+            cases.append((name, file_path))
+            if must_join:
+                joined.add(name)
+        print(f"\n{'floor':>19} {'no walls':>8} {'walls':>6}  doorway stitching")
+        for name, file_path in cases:
+            (bare_count, walled_count), problems = check_stitching(file_path, name in joined)
+            print(f"{name:>19} {bare_count:>8} {walled_count:>6}  {'FAIL' if problems else 'ok'}")
+            for problem in problems:
+                print(f"{'':>20}{problem}")
+            failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
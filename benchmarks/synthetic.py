@@ -0,0 +1,115 @@
+"""
+Synthetic floor plans for benchmarks.
+
+Floors are corridor bands with rooms on both sides, one door per room, an
+elevator shape in the first room and a stairs shape in the last.
+"""
+import math
+import xml.etree.ElementTree as ET
+
+SVG_NS = "http://www.w3.org/2000/svg"
+
+
+def _points(points):
+    return " ".join(f"{x},{y}" for x, y in points)
+
+
+def make_floor(rooms_per_side, bands=1, room_width=100.0, room_depth=80.0, corridor_height=40.0,
+               door_width=20.0, unit_scale=1.0, wall_thickness=0.0):
+    """
+    Builds the geometry of a synthetic floor.
+
+    Bands are stacked vertically and joined by a spine corridor on the right,
+    with one doorway between the spine and each band's corridor. With a wall_thickness
+    the rooms stop short of the corridor by that much and their doors lie on the room
+    face of the wall, the way doors in thick CAD walls are often drawn.
+
+    Parameters:
+        rooms_per_side: Number of rooms above and below each corridor
+        bands: Number of corridor bands
+        room_width: Width of each room
+        room_depth: Depth of each room
+        corridor_height: Height of the corridor
+        door_width: Width of each door
+        unit_scale: Factor applied to every coordinate (simulates CAD units)
+        wall_thickness: Thickness of the walls between rooms and corridors
+
+    Returns:
+        Dictionary of layer name to list of shapes
+    """
+    s = unit_scale
+    width = rooms_per_side * room_width
+    band_height = 2 * room_depth + corridor_height
+    spaces, walls, entrances = [], [], []
+
+    for band in range(bands):
+        y0 = band * band_height
+        top, bottom = y0 + room_depth, y0 + room_depth + corridor_height
+        spaces.append([(0, top), (width, top), (width, bottom), (0, bottom)])
+        for i in range(rooms_per_side):
+            x0, x1 = i * room_width, (i + 1) * room_width
+            door_x0 = x0 + (room_width - door_width) / 2
+            door_x1 = door_x0 + door_width
+            for y_face, y_back, side in ((top, y0, -1), (bottom, bottom + room_depth, 1)):
+                y_wall = y_face + side * wall_thickness
+                spaces.append([(x0, y_back), (x1, y_back), (x1, y_wall), (x0, y_wall)])
+                walls.append([(x0, y_wall), (x0, y_back), (x1, y_back), (x1, y_wall)])
+                walls.append([(x0, y_wall), (door_x0, y_wall)])
+                walls.append([(door_x1, y_wall), (x1, y_wall)])
+                entrances.append([(door_x0, y_wall), (door_x1, y_wall)])
+                if wall_thickness:
+                    walls.append([(x0, y_face), (door_x0, y_face)])
+                    walls.append([(door_x1, y_face), (x1, y_face)])
+        if bands > 1:
+            door_y0 = top + (corridor_height - door_width) / 2
+            entrances.append([(width, door_y0), (width, door_y0 + door_width)])
+
+    if bands > 1:
+        spine = width + corridor_height
+        height = bands * band_height
+        spaces.append([(width, 0), (spine, 0), (spine, height), (width, height)])
+        walls.append([(width, 0), (spine, 0), (spine, height), (width, height)])
+
+    cx, cy, r = room_width / 2, room_depth / 2, 10.0
+    circle = [(cx + r * math.cos(a * math.pi / 4), cy + r * math.sin(a * math.pi / 4)) for a in range(8)]
+    sx, sy = width - room_width / 2, room_depth / 2
+    square = [(sx - r, sy - r), (sx + r, sy - r), (sx + r, sy + r), (sx - r, sy + r), (sx - r, sy - r)]
+
+    layers = {
+        "spaces": spaces,
+        "walls": walls,
+        "entrances": entrances,
+        "circles": [circle],
+        "squares": [square],
+    }
+    return {name: [[(x * s, y * s) for x, y in shape] for shape in shapes] for name, shapes in layers.items()}
+
+
+def write_floor_svg(file_path, layers):
+    """
+    Writes synthetic floor layers to an SVG file using the input group layout.
+
+    Parameters:
+        file_path: Path where the SVG will be saved
+        layers: Dictionary returned by make_floor
+    """
+    all_points = [p for shapes in layers.values() for shape in shapes for p in shape]
+    width = int(math.ceil(max(x for x, _ in all_points)))
+    height = int(math.ceil(max(y for _, y in all_points)))
+    svg = ET.Element("svg", xmlns=SVG_NS, width=str(width), height=str(height))
+
+    groups = (("spaces", "polygon", layers["spaces"]),
+              ("walls", "polyline", layers["walls"]),
+              ("entrances", "polyline", layers["entrances"]))
+    for group_id, tag, shapes in groups:
+        group = ET.SubElement(svg, "g", id=group_id)
+        for shape in shapes:
+            ET.SubElement(group, tag, points=_points(shape))
+
+    shapes_group = ET.SubElement(svg, "g", id="shapes")
+    for shape in layers["circles"]:
+        ET.SubElement(shapes_group, "polygon", points=_points(shape))
+    for shape in layers["squares"]:
+        ET.SubElement(shapes_group, "polyline", points=_points(shape))
+
+    ET.ElementTree(svg).write(file_path)
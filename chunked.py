@@ -0,0 +1,379 @@
+"""
+Memory-bounded midline network computation for campus-scale floors.
+
+Spaces are processed in spatial tiles. Each finished tile's midlines and connectors are
+appended to temporary column files (vertex coordinates, path offsets, component ids),
+so only one tile's paths are in memory at a time. Connectivity across tiles is found out
+of core: every tile writes its snapped vertices, tagged with their component, to hash
+buckets on disk, and the buckets are joined one at a time into a union-find whose table
+is itself a memory-mapped file.
+
+Usage:
+    python chunked.py floors/campus.svg output/campus.svg [--tile-size 100]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import shapely
+from shapely import STRtree
+from annotations import read_settings_markers
+from collision import WallIndex
+from geometry_utils import shape_bounds
+from network import door_tolerances, midline_components, stitch_networks
+from pipeline import handle_midline_path
+from svg_parser import export_svg
+from validation import load_svg
+from values import SNAP_TOLERANCE, CONNECTOR_DISTANCE, STITCH_ENDPOINT_DISTANCE, WALL_CROSSING_COLOR
+from values import CHUNK_TILE_SIZE, CHUNK_BUCKETS
+
+class DiskUnionFind:
+    """
+    Union-find over integer ids whose (parent, size) table is a memory-mapped file, so
+    only the pages in use stay in memory.
+    """
+    def __init__(self, directory, capacity=1024):
+        self.file_path = os.path.join(directory, "components.bin")
+        self.count = 0
+        self.capacity = 0
+        self.table = None
+        self.reserve(capacity)
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        if self.table is not None:
+            self.table.flush()
+            del self.table
+        with open(self.file_path, "ab") as file:
+            file.truncate(capacity * 16)
+        self.table = np.memmap(self.file_path, dtype=np.int64, mode="r+", shape=(capacity, 2))
+        self.capacity = capacity
+
+    def add(self, sizes):
+        """Adds one set per entry of sizes, returning the id of the first"""
+        first = self.count
+        self.reserve(first + len(sizes))
+        ids = np.arange(first, first + len(sizes))
+        self.table[ids, 0] = ids
+        self.table[ids, 1] = sizes
+        self.count += len(sizes)
+        return first
+
+    def find(self, key):
+        table = self.table
+        while table[key, 0] != key:
+            table[key, 0] = table[table[key, 0], 0]
+            key = int(table[key, 0])
+        return key
+
+    def union(self, a, b):
+        # Returns False when a and b were already connected
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return False
+        if self.table[root_a, 1] < self.table[root_b, 1]:
+            root_a, root_b = root_b, root_a
+        self.table[root_b, 0] = root_a
+        self.table[root_a, 1] += self.table[root_b, 1]
+        return True
+
+    def roots(self, ids):
+        """Roots of many ids at once, by pointer jumping"""
+        roots = self.table[np.asarray(ids, dtype=np.int64), 0]
+        while True:
+            parents = self.table[roots, 0]
+            if np.array_equal(parents, roots):
+                return roots
+            roots = parents
+
+
+class ColumnSpill:
+    """Append-only column files in a directory, read back as memory maps once writing is done"""
+    COLUMNS = {"coords": np.float64, "path_ends": np.int64, "path_components": np.int64, "path_flags": np.uint8,
+               "endpoints": np.float64, "endpoint_components": np.int64}
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name in self.COLUMNS}
+        self.lengths = dict.fromkeys(self.COLUMNS, 0)
+
+    def append(self, name, values):
+        values = np.ascontiguousarray(values, dtype=self.COLUMNS[name])
+        self.files[name].write(values.tobytes())
+        self.lengths[name] += values.size  # Values, not rows
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+    def column(self, name, width=1):
+        if not self.files[name].closed:
+            self.files[name].flush()
+        if not self.lengths[name]:
+            return np.empty((0, width) if width > 1 else 0, dtype=self.COLUMNS[name])
+        shape = (self.lengths[name] // width, width) if width > 1 else (self.lengths[name],)
+        return np.memmap(os.path.join(self.directory, f"{name}.bin"), dtype=self.COLUMNS[name], mode="r", shape=shape)
+
+
+def space_tiles(spaces, tile_size):
+    """Groups space indices by the tile their bounding box center falls in, in row order"""
+    tiles = {}
+    for i, space in enumerate(spaces):
+        if not space:
+            continue
+        min_x, min_y, max_x, max_y = shape_bounds(space)
+        key = (int((min_y + max_y) / 2 // tile_size), int((min_x + max_x) / 2 // tile_size))
+        tiles.setdefault(key, []).append(i)
+    return [tiles[key] for key in sorted(tiles)]
+
+def vertex_bucket(keys, buckets):
+    # Spreads snapped vertex keys over the bucket files
+    return ((keys[:, 0] * 73856093) ^ (keys[:, 1] * 19349663)) % buckets
+
+
+class ChunkedNetwork:
+    """
+    Midline network spilled to disk by chunked_all_midlines. Iterate chunks() to read it
+    back one tile at a time, and close() (or use it as a context manager) to delete it.
+    """
+    def __init__(self, directory, spill, components, chunk_paths):
+        self.directory = directory
+        self.spill = spill
+        self.components = components
+        self.chunk_paths = chunk_paths  # (first path, end path) of each chunk
+        self.largest_root = None
+        self.component_count = 0
+        self.path_count = chunk_paths[-1][1] if chunk_paths else 0
+
+    def chunks(self):
+        """
+        Yields the paths of each chunk with their colors: green in the largest network,
+        red elsewhere, orange for paths through a wall (the colors the a key draws).
+
+        Returns:
+            Generator of (paths, colors) tuples
+        """
+        coords = self.spill.column("coords", 2)
+        ends = self.spill.column("path_ends")
+        roots = self.spill.column("path_components")
+        flags = self.spill.column("path_flags")
+        for first, end in self.chunk_paths:
+            chunk_roots = self.components.roots(roots[first:end])
+            paths, colors = [], []
+            for i, root in zip(range(first, end), chunk_roots.tolist()):
+                start = ends[i - 1] if i else 0
+                paths.append([tuple(p) for p in coords[start:ends[i]].tolist()])
+                if flags[i]:
+                    colors.append(WALL_CROSSING_COLOR)
+                else:
+                    colors.append((0, 255, 0) if root == self.largest_root else (255, 0, 0))
+            yield paths, colors
+
+    def close(self):
+        self.spill.close()
+        self.components.table = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def chunked_all_midlines(spaces, entrances, elevators=(), stairs=(), cache=None, wall_index=None,
+                         tile_size=CHUNK_TILE_SIZE, buckets=CHUNK_BUCKETS, directory=None):
+    """
+    Computes the same network as handle_all_midlines one spatial tile at a time, keeping
+    finished tiles on disk.
+
+    Doorways between tiles are joined through their shared door point. Loose ends are
+    bridged within each tile as handle_all_midlines does, and across neighbouring tiles
+    in a final pass, so a bridge can differ from the in-memory result where several
+    candidates of equal length compete.
+
+    Parameters:
+        spaces, entrances, elevators, stairs, cache, wall_index: As for handle_all_midlines
+        tile_size: Side of the spatial tiles in model units
+        buckets: Number of vertex hash buckets joined one at a time
+        directory: Where the temporary files go (default: the system temporary directory)
+
+    Returns:
+        ChunkedNetwork
+    """
+    directory = tempfile.mkdtemp(prefix="pather_chunks_", dir=directory)
+    spill = ColumnSpill(directory)
+    components = DiskUnionFind(directory)
+    bucket_files = [open(os.path.join(directory, f"vertices_{b}.bin"), "wb") for b in range(buckets)]
+    entrance_tree = STRtree([shapely.LineString(e) if len(e) >= 2 else shapely.Point(e[0]) for e in entrances])
+    chunk_paths, chunk_endpoints, chunk_extents = [], [], []
+    doors = [e for e in entrances if len(e) >= 2]
+    margin = max(CONNECTOR_DISTANCE, door_tolerances(doors).max(initial=0)) + STITCH_ENDPOINT_DISTANCE
+
+    try:
+        for tile in space_tiles(spaces, tile_size):
+            tile_spaces = [spaces[i] for i in tile]
+            bounds = shape_bounds([p for space in tile_spaces for p in space])
+            region = shapely.box(*bounds).buffer(margin)
+            tile_entrances = [entrances[i] for i in sorted(entrance_tree.query(region).tolist())]
+            x0, y0, x1, y1 = region.bounds
+            near = lambda marker: x0 <= marker.position[0] <= x1 and y0 <= marker.position[1] <= y1
+
+            # The a key's pipeline on this tile's spaces alone
+            space_midlines = {}
+            paths = handle_midline_path([True] * len(tile_spaces), tile_spaces, tile_entrances, [],
+                                        [m for m in elevators if near(m)], [m for m in stairs if near(m)],
+                                        cache, space_midlines, wall_index, verbose=False)
+            paths, _ = stitch_networks(paths, tile_spaces, tile_entrances, space_midlines, wall_index=wall_index)
+            paths = [path for path in paths if path]
+            if not paths:
+                continue
+            spill_chunk(paths, spill, components, bucket_files, wall_index, chunk_paths, chunk_endpoints,
+                        chunk_extents)
+    finally:
+        for file in bucket_files:
+            file.close()
+
+    join_buckets(directory, buckets, components)
+    bridges = bridge_chunks(spill, components, chunk_endpoints, chunk_extents, wall_index)
+    if bridges:
+        first = chunk_paths[-1][1]
+        a_components = [component for _, _, component in bridges]
+        append_paths([[a, b] for a, b, _ in bridges], np.array(a_components), np.zeros(len(bridges)), spill)
+        chunk_paths.append((first, first + len(bridges)))
+    spill.close()
+
+    network = ChunkedNetwork(directory, spill, components, chunk_paths)
+    roots = components.roots(np.arange(components.count))
+    unique_roots = np.unique(roots)
+    network.component_count = len(unique_roots)
+    if len(unique_roots):
+        network.largest_root = int(unique_roots[np.argmax(components.table[unique_roots, 1])])
+    return network
+
+def append_paths(paths, path_components, flags, spill):
+    counts = np.fromiter((len(path) for path in paths), dtype=np.int64, count=len(paths))
+    spill.append("coords", np.array([p for path in paths for p in path], dtype=float))
+    offset = spill.lengths["coords"] // 2 - counts.sum()
+    spill.append("path_ends", offset + np.cumsum(counts))
+    spill.append("path_components", path_components)
+    spill.append("path_flags", flags)
+
+def spill_chunk(paths, spill, components, bucket_files, wall_index, chunk_paths, chunk_endpoints, chunk_extents):
+    """Writes one tile's paths, its components and its snapped vertices to disk"""
+    # Components within the tile, each given a global id
+    local = midline_components(paths)
+    coords = np.array([p for path in paths for p in path], dtype=float)
+    keys = np.round(coords / SNAP_TOLERANCE).astype(np.int64)
+    counts = np.fromiter((len(path) for path in paths), dtype=np.int64, count=len(paths))
+    starts = np.cumsum(counts) - counts
+    local_roots = {}
+    path_roots = [local_roots.setdefault(local.find(tuple(keys[s].tolist())), len(local_roots)) for s in starts]
+    sizes = np.zeros(len(local_roots), dtype=np.int64)
+    for root, index in local_roots.items():
+        sizes[index] = local.size[root]
+    first = components.add(sizes)
+    path_components = first + np.array(path_roots, dtype=np.int64)
+
+    flags = wall_index.crossing_mask(paths) if wall_index is not None else np.zeros(len(paths), dtype=bool)
+    first_path = chunk_paths[-1][1] if chunk_paths else 0
+    append_paths(paths, path_components, flags, spill)
+    chunk_paths.append((first_path, first_path + len(paths)))
+
+    # Every distinct (vertex, component) pair, to find vertices shared with other tiles
+    vertex_components = np.repeat(path_components, counts)
+    rows = np.unique(np.column_stack([keys, vertex_components]), axis=0)
+    row_buckets = vertex_bucket(rows, len(bucket_files))
+    for bucket in np.unique(row_buckets).tolist():
+        bucket_files[bucket].write(rows[row_buckets == bucket].tobytes())
+
+    # Loose ends for the bridges between tiles
+    ends = np.concatenate([starts, starts + counts - 1])
+    endpoint_rows = np.unique(np.column_stack([coords[ends], path_components[np.r_[:len(paths), :len(paths)]]]),
+                              axis=0)
+    first_endpoint = spill.lengths["endpoint_components"]
+    spill.append("endpoints", endpoint_rows[:, :2])
+    spill.append("endpoint_components", endpoint_rows[:, 2])
+    chunk_endpoints.append((first_endpoint, first_endpoint + len(endpoint_rows)))
+    chunk_extents.append(shapely.box(*coords.min(axis=0), *coords.max(axis=0)))
+
+def join_buckets(directory, buckets, components):
+    """Unions the components of every vertex key seen in more than one of them, one bucket at a time"""
+    for b in range(buckets):
+        file_path = os.path.join(directory, f"vertices_{b}.bin")
+        rows = np.fromfile(file_path, dtype=np.int64).reshape(-1, 3)
+        os.remove(file_path)
+        if len(rows) < 2:
+            continue
+        rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+        same = (rows[1:, :2] == rows[:-1, :2]).all(axis=1) & (rows[1:, 2] != rows[:-1, 2])
+        for i in np.flatnonzero(same).tolist():
+            components.union(int(rows[i, 2]), int(rows[i + 1, 2]))
+
+def bridge_chunks(spill, components, chunk_endpoints, chunk_extents, wall_index, distance=STITCH_ENDPOINT_DISTANCE):
+    """
+    Bridges loose ends of neighbouring tiles, closest pairs first, like the last step of
+    stitch_networks.
+
+    Returns:
+        List of (a, b, component) bridges added
+    """
+    endpoints = spill.column("endpoints", 2)
+    endpoint_components = spill.column("endpoint_components")
+    extent_tree = STRtree(chunk_extents)
+    candidates = []  # (length, a, b, component of a, component of b)
+    for chunk, (first, end) in enumerate(chunk_endpoints):
+        for other in sorted(extent_tree.query(chunk_extents[chunk].buffer(distance)).tolist()):
+            if other <= chunk:
+                continue
+            other_first, other_end = chunk_endpoints[other]
+            points, other_points = np.array(endpoints[first:end]), np.array(endpoints[other_first:other_end])
+            left, right = STRtree(shapely.points(other_points)).query(shapely.points(points), predicate="dwithin",
+                                                                      distance=distance)
+            for i, j in zip(left.tolist(), right.tolist()):
+                a, b = tuple(points[i].tolist()), tuple(other_points[j].tolist())
+                if a != b:
+                    candidates.append((float(np.hypot(*(points[i] - other_points[j]))), a, b,
+                                       int(endpoint_components[first + i]), int(endpoint_components[other_first + j])))
+
+    candidates.sort()
+    blocked = np.zeros(len(candidates), dtype=bool)
+    if wall_index is not None and candidates:
+        blocked = wall_index.crossing_mask([[a, b] for _, a, b, _, _ in candidates])
+    bridges = []
+    for (_, a, b, component_a, component_b), is_blocked in zip(candidates, blocked.tolist()):
+        if not is_blocked and components.union(component_a, component_b):
+            bridges.append((a, b, component_a))
+    return bridges
+
+def export_chunked_svg(file_path, entrances, spaces, walls, network, elevators=None, stairs=None):
+    """
+    Writes the same SVG as export_svg, streaming the midlines out of a ChunkedNetwork one
+    chunk at a time instead of building them all into the document.
+    """
+    export_svg(file_path, entrances, spaces, walls, [], False, None, elevators, stairs,
+               midline_chunks=(paths for paths, _ in network.chunks()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-bounded midline network and export")
+    parser.add_argument("file", help="SVG floor")
+    parser.add_argument("output", help="Exported SVG")
+    parser.add_argument("--tile-size", type=float, default=CHUNK_TILE_SIZE, help="Tile side in model units")
+    args = parser.parse_args()
+
+    map_name = os.path.splitext(os.path.basename(args.file))[0]
+    (_, _, entrances, spaces, walls, _, _, _), _ = load_svg(args.file)
+    elevators, stairs = read_settings_markers(map_name)
+    start = time.perf_counter()
+    with chunked_all_midlines(spaces, entrances, elevators, stairs, None, WallIndex(walls), args.tile_size) as network:
+        export_chunked_svg(args.output, entrances, spaces, walls, network, elevators, stairs)
+        print(f"{network.path_count} midlines in {len(network.chunk_paths)} chunks, "
+              f"{network.component_count} networks, exported to {args.output} "
+              f"in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -2,37 +2,35 @@ import pygame
 from geometry_utils import transform_point
 from values import ELEVATOR_COLOR, ELEVATOR_SELECTED_COLOR
 from values import STAIRS_COLOR, STAIRS_SELECTED_COLOR
+from values import MARKER_GRID_CELL
 from xml.etree import ElementTree as ET
 
-class Elevator:
-    def __init__(self, position, elevator_id=1):
+class Marker:
+    """Shared storage and behaviour of elevators and stairs, slotted to keep many markers small"""
+    __slots__ = ("position", "id", "selected")
+    radius = 8  # Radius for drawing
+    hit_radius = 8  # Click distance in model units
+
+    def __init__(self, position, marker_id=1):
         self.position = position  # (x, y) tuple
-        self.id = elevator_id
+        self.id = marker_id
         self.selected = False
-        self.radius = 8  # Radius for drawing
     
     def is_clicked(self, point, scale, offset):
-        # Check if a point is within the elevator's circle
-        x1, y1 = self.position
+        # Check if a screen point is within the marker's click area
+        x1, y1 = transform_point(self.position, scale, offset)
         x2, y2 = point
-        x1, y1 = transform_point((x1, y1), scale, offset)
         distance = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
-        return distance <= self.radius * scale
+        return distance <= self.hit_radius * scale
 
-    def draw(self, screen, scale, offset):
-        # Draw elevator circle
+    def screen_rect(self, scale, offset):
+        # Screen area covered by the marker and its ID text
         x, y = transform_point(self.position, scale, offset)
-        color = ELEVATOR_SELECTED_COLOR if self.selected else ELEVATOR_COLOR
-        pygame.draw.circle(screen, color, (int(x), int(y)), int(self.radius * scale))
-        
-        # Draw elevator ID text
-        font = pygame.font.SysFont('Arial', int(12 * scale))
-        text = font.render(str(self.id), True, (255, 255, 255))
-        text_rect = text.get_rect(center=(int(x), int(y)))
-        screen.blit(text, text_rect)
+        size = self.radius * 2 * scale
+        return pygame.Rect(int(x - size), int(y - size), int(size * 2) + 2, int(size * 2) + 2)
 
     def export(self):
-        """Creates an SVG circle element at the specified position with the given radius and color."""
+        """Creates an SVG circle element at the marker's position, with a text element for its ID."""
         cx, cy = self.position
         attrs = {
             'cx': str(cx),
@@ -59,20 +57,31 @@ class Elevator:
         return (circle, text)
 
 
-class Stairs:
+class Elevator(Marker):
+    __slots__ = ()
+
+    def __init__(self, position, elevator_id=1):
+        super().__init__(position, elevator_id)
+
+    def draw(self, screen, scale, offset):
+        # Draw elevator circle
+        x, y = transform_point(self.position, scale, offset)
+        color = ELEVATOR_SELECTED_COLOR if self.selected else ELEVATOR_COLOR
+        pygame.draw.circle(screen, color, (int(x), int(y)), int(self.radius * scale))
+        
+        # Draw elevator ID text
+        font = pygame.font.SysFont('Arial', int(12 * scale))
+        text = font.render(str(self.id), True, (255, 255, 255))
+        text_rect = text.get_rect(center=(int(x), int(y)))
+        screen.blit(text, text_rect)
+
+
+class Stairs(Marker):
+    __slots__ = ()
+    hit_radius = 16  # Stairs are clickable over their whole square
+
     def __init__(self, position, stairs_id=1):
-        self.position = position  # (x, y) tuple
-        self.id = stairs_id
-        self.selected = False
-        self.radius = 8  # Radius for drawing
-    
-    def is_clicked(self, point, scale, offset):
-        # Check if a point is within the stairs' area (assuming a rectangular area)
-        x1, y1 = self.position
-        x2, y2 = point
-        x1, y1 = transform_point((x1, y1), scale, offset)
-        distance = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
-        return distance <= self.radius * 2 * scale
+        super().__init__(position, stairs_id)
 
     def draw(self, screen, scale, offset):
         # Draw stairs rectangle
@@ -87,29 +96,96 @@ class Stairs:
         text_rect = text.get_rect(center=(int(x), int(y)))
         screen.blit(text, text_rect)
 
-    def export(self):
-        """Creates an SVG circle element at the specified position with the given width, height, and color."""
-        cx, cy = self.position
-        attrs = {
-            'cx': str(cx),
-            'cy': str(cy),
-            'r': str(self.radius),
-            'adjacency': str(self.id)
-        }
-        
-        attrs['data-id'] = str(self.id)
-            
-        circle = ET.Element('circle', **attrs)
-        
-        # Create text element for the ID
-        text_attrs = {
-            'x': str(cx),
-            'y': str(cy),
-            'text-anchor': 'middle',
-            'dy': '.3em',  # Adjust vertical alignment
-            'style': 'font-size:12px; fill: white;'
-        }
-        text = ET.Element('text', **text_attrs)
-        text.text = str(self.id)
-        
-        return (circle, text)
\ No newline at end of file
+
+class MarkerLayer:
+    """
+    The elevators or stairs of a floor, bucketed in a uniform grid over model space.
+
+    Behaves like a list of markers. Since the grid cells are at least as large as a
+    marker's click area, a click only has to look at the 3x3 cells around it, and a
+    box only at the cells it overlaps.
+    """
+    __slots__ = ("markers", "cells", "cell_size")
+
+    def __init__(self, markers=(), cell_size=MARKER_GRID_CELL):
+        self.markers = []
+        self.cells = {}  # (column, row) to markers whose position is in that cell
+        self.cell_size = cell_size
+        self.extend(markers)
+
+    def cell(self, point):
+        return (int(point[0] // self.cell_size), int(point[1] // self.cell_size))
+
+    def append(self, marker):
+        self.markers.append(marker)
+        self.cells.setdefault(self.cell(marker.position), []).append(marker)
+
+    def extend(self, markers):
+        for marker in markers:
+            self.append(marker)
+
+    def __iter__(self):
+        return iter(self.markers)
+
+    def __len__(self):
+        return len(self.markers)
+
+    def __getitem__(self, index):
+        return self.markers[index]
+
+    def at(self, point):
+        """
+        Finds the marker under a model-space point.
+
+        Parameters:
+            point: (x, y) in model coordinates
+
+        Returns:
+            The closest marker whose click area contains the point, or None
+        """
+        column, row = self.cell(point)
+        best, best_distance = None, None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for marker in self.cells.get((column + dx, row + dy), ()):
+                    x, y = marker.position
+                    distance = (x - point[0]) ** 2 + (y - point[1]) ** 2
+                    if distance <= marker.hit_radius ** 2 and (best is None or distance < best_distance):
+                        best, best_distance = marker, distance
+        return best
+
+    def in_box(self, bounds):
+        """
+        Finds the markers whose position lies inside a model-space box.
+
+        Parameters:
+            bounds: (min_x, min_y, max_x, max_y) in model coordinates
+
+        Returns:
+            List of markers
+        """
+        min_x, min_y, max_x, max_y = bounds
+        min_column, min_row = self.cell((min_x, min_y))
+        max_column, max_row = self.cell((max_x, max_y))
+        found = []
+        # Walk whichever is smaller, the cells under the box or the occupied cells
+        if (max_column - min_column + 1) * (max_row - min_row + 1) <= len(self.cells):
+            keys = ((c, r) for c in range(min_column, max_column + 1) for r in range(min_row, max_row + 1))
+        else:
+            keys = [k for k in self.cells if min_column <= k[0] <= max_column and min_row <= k[1] <= max_row]
+        for key in keys:
+            for marker in self.cells.get(key, ()):
+                x, y = marker.position
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    found.append(marker)
+        return found
+
+    def remove_selected(self):
+        """Deletes the selected markers, returning how many were removed"""
+        kept = [m for m in self.markers if not m.selected]
+        removed = len(self.markers) - len(kept)
+        if removed:
+            self.markers = []
+            self.cells = {}
+            self.extend(kept)
+        return removed
@@ -0,0 +1,110 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+from geometry_utils import nearest_point_on_line
+
+class WallIndex:
+    """Prepared wall linework in an STRtree, built once per floor for bulk crossing tests"""
+    def __init__(self, walls):
+        lines = [shapely.LineString(wall) for wall in walls if len(wall) >= 2]
+        self.walls = np.array(lines, dtype=object)
+        shapely.prepare(self.walls)
+        self.tree = STRtree(self.walls)
+
+    def crossing_mask(self, paths):
+        """
+        Tests polylines against every wall at once.
+
+        A path only counts as crossing when it passes through a wall; touching a wall
+        (a door midpoint in the wall gap, a wall end) is allowed.
+
+        Parameters:
+            paths: List of polylines (each polyline is a list of points)
+
+        Returns:
+            Boolean numpy array, True where the path crosses a wall
+        """
+        mask = np.zeros(len(paths), dtype=bool)
+        if not len(self.walls) or not paths:
+            return mask
+        indices = [i for i, path in enumerate(paths) if len(path) >= 2]
+        if not indices:
+            return mask
+        lines = [shapely.LineString(paths[i]) for i in indices]
+        path_hits, _ = self.tree.query(lines, predicate="crosses")
+        mask[np.asarray(indices)[np.unique(path_hits)]] = True
+        return mask
+
+def midline_vertices(midline):
+    # A midline is either one polyline or a list of polylines
+    return midline if midline and not isinstance(midline[0], list) else [p for line in midline for p in line]
+
+def nearest_vertices(starts, owners, midlines):
+    """
+    Finds the nearest midline vertex of many start points at once, with the same result
+    as calling nearest_point_on_line for each.
+
+    Parameters:
+        starts: Sequence of n (x, y) start points
+        owners: Sequence of n keys into midlines, the midline each start point connects to
+        midlines: Dictionary of key to midline path
+
+    Returns:
+        List of n (x, y) tuples
+    """
+    if not len(owners):
+        return []
+    keys, owner_index = np.unique(np.asarray(owners), return_inverse=True)
+    vertices = [np.asarray(midline_vertices(midlines[key]), dtype=float).reshape(-1, 2) for key in keys.tolist()]
+    counts = np.array([len(v) for v in vertices])
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    coords = np.concatenate(vertices)
+
+    # Every (start, vertex of its midline) pair, grouped by start
+    pair_counts = counts[owner_index]
+    pair_starts = np.cumsum(pair_counts) - pair_counts
+    start_of = np.repeat(np.arange(len(owner_index)), pair_counts)
+    vertex = np.arange(pair_counts.sum()) - np.repeat(pair_starts - offsets[owner_index], pair_counts)
+    squared = ((coords[vertex] - np.asarray(starts, dtype=float)[start_of]) ** 2).sum(axis=1)
+
+    # Closest vertex of each group, the first one on ties
+    order = np.lexsort((squared, start_of))
+    return [tuple(p) for p in coords[vertex[order[pair_starts]]].tolist()]
+
+def route_connectors(connectors, wall_index=None, ends=None):
+    """
+    Builds straight connectors to the nearest midline vertex and reroutes the ones that
+    cross a wall to the nearest vertex of the same midline that can be reached directly.
+
+    Parameters:
+        connectors: List of (start_point, midline_path) tuples
+        wall_index: WallIndex of the floor, or None to skip validation
+        ends: Nearest midline vertex of each connector when already found (e.g. by
+              nearest_vertices), or None to search each midline
+
+    Returns:
+        (paths, flagged) tuple: one [start, end] path per connector, and the indices of
+        connectors that still cross a wall because no vertex could be reached
+    """
+    if ends is None:
+        ends = [nearest_point_on_line(start, midline) for start, midline in connectors]
+    paths = [[tuple(start), tuple(end)] for (start, _), end in zip(connectors, ends)]
+    if wall_index is None or not paths:
+        return paths, []
+
+    flagged = []
+    for i in np.flatnonzero(wall_index.crossing_mask(paths)).tolist():
+        start, midline = connectors[i]
+        start = tuple(start)
+
+        # Every other vertex of the midline, closest first, tested in one query
+        candidates = sorted({tuple(p) for p in midline_vertices(midline)},
+                            key=lambda p: (p[0] - start[0]) ** 2 + (p[1] - start[1]) ** 2)
+        candidate_paths = [[start, p] for p in candidates if p != start]
+        crossing = wall_index.crossing_mask(candidate_paths)
+        clear = np.flatnonzero(~crossing)
+        if len(clear):
+            paths[i] = candidate_paths[clear[0]]
+        else:
+            flagged.append(i)
+    return paths, flagged
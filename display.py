@@ -1,12 +1,23 @@
 import pygame
 import os
-import json
+import numpy as np
+import shapely
 from shapely import Polygon
 from geometry_utils import transform_shapes, inverse_transform_point, zoom_at, is_point_near_line
 from geometry_utils import find_innermost_polygon, is_point_inside_polygon, shapely_to_pygame
 from geometry_utils import find_midline_path, nearest_point_on_line, transform_point
+from geometry_utils import shape_bounds, bounds_intersect, transform_bounds, inverse_transform_bounds
 from svg_parser import parse_svg, export_svg
-from classes import Elevator, Stairs
+from classes import Marker, Elevator, Stairs, MarkerLayer
+from workspace import Workspace
+from path_optimization import format_report
+from pipeline import handle_midline_path, handle_all_midlines, handle_optimize_midlines
+from pipeline import mark_wall_crossings
+from history import History, SelectionChange, ToggleChange, ListChange, midline_key
+from autosave import FloorJournal, read_settings, settings_path
+from selection import lasso_polygon, unpack_selection
+from validation import summarize
+from annotations import detect_markers, match_marker_ids, read_annotations, assign_missing_ids, write_settings_markers
 from values import *
 import xml.etree.ElementTree as ET
 from shapely.geometry import LineString, MultiLineString
@@ -16,159 +27,310 @@ from shapely.ops import linemerge
 # def init_pygame():
     # pygame.init()
 
+# Window attributes that belong to a floor, saved while another floor is on screen
+FLOOR_STATE_ATTRIBUTES = (
+    "selected_entrances", "selected_spaces", "selected_walls", "selected_paths",
+    "midline_paths", "midline_colors", "elevators", "stairs",
+    "current_elevator_id", "current_stairs_id", "scale", "offset", "history", "journal", "confirmed_spaces",
+)
+
 class MapWindow:
-    def __init__(self, file_path, map_name, width, height, entrances, spaces, walls, paths, circles, squares, on_close):    
+    def __init__(self, file_path, map_name, width, height, entrances, spaces, walls, paths, circles, squares, on_close,
+                 workspace=None, on_open=None, on_import=None, health=None):    
         pygame.init()
-        self.file_path = file_path
-        self.map_name = map_name
         self.width = width
         self.height = height
-        self.entrances = entrances
-        self.spaces = spaces
-        self.walls = walls
-        self.paths = paths
-        self.circles = circles
-        self.squares = squares
-        self.elevators = []  # List of Elevator objects
-        self.stairs = []  # List of Stairs objects
         self.on_close = on_close
+        self.on_open = on_open  # Returns the path of another floor to open, or None
+        self.on_import = on_import  # Returns the path of a CSV/JSON marker import, or None
+        
+        # Floors share the workspace's worker pool and centerline cache
+        self.workspace = workspace if workspace is not None else Workspace()
+        self.floor = None
         
         # Create a new pygame window
         self.window_id = pygame.display.set_mode((width, height), pygame.RESIZABLE | pygame.HWSURFACE)
-        pygame.display.set_caption(f"Pather - {map_name}")
         
-        # Initial colors and selection state
-        self.entrance_colors = [ENTRANCE_COLOR] * len(entrances)
-        self.space_colors = [SPACE_COLOR] * len(spaces)
-        self.wall_colors = [WALL_COLOR] * len(walls)
-        self.path_colors = [SPACE_COLOR] * len(paths)
-        self.circle_colors = [SHAPE_COLOR] * len(circles)
-        self.square_colors = [SHAPE_COLOR] * len(squares)
-        self.selected_entrances = [False] * len(entrances)
-        self.selected_spaces = [False] * len(spaces)
-        self.selected_walls = [False] * len(walls)
-        self.selected_paths = [False] * len(paths)
-        self.midline_paths = []
-        self.midline_colors = []
+        # Change-driven rendering state
+        self.needs_redraw = True  # Repaint the whole window on the next frame
+        self.dirty_rects = []  # Screen rectangles to repaint on the next frame
+        
+        # Background jobs, each finished job wakes the event loop with JOB_DONE_EVENT
+        self.jobs = []  # (floor, future, callback) tuples applied on the main thread, floor None for any floor
+        self.last_autosave = 0  # pygame ticks of the last journal sync
+        self.mouse_pos = (0, 0)
         
         # View control variables
-        self.scale = 1.0
-        self.offset = [0, 0]
         self.dragging = False
         self.drag_start = (0, 0)
         
         # Elevator mode
         self.elevator_mode = False
-        self.current_elevator_id = 1
+        self.box_start = None  # Screen corner of a box selection in progress
+        self.lasso_points = None  # Screen points of a lasso selection in progress
 
         # Stairs mode
         self.stairs_mode = False
-        self.current_stairs_id = 1
         
-        # Load saved spaces if they exist
-        self.load_settings()
+        # Midline preview of the hovered and newly selected spaces, from speculatively computed centerlines
+        self.hovered_space = None
+        self.preview_version = None  # History version the speculative targets were last queued for
+        self.preview_paths = []
+        self.preview_bounds = []
+        self.preview_colors = []
+        
+        # Show the first floor, loading saved spaces if they exist
+        floor = self.workspace.add_floor(file_path, (width, height, entrances, spaces, walls, paths, circles, squares),
+                                         health)
+        self.show_floor(floor)
         
         # Start the rendering loop
         self.running = True
         self.run()
     
+    def show_floor(self, floor):
+        """Switch the window to another floor, keeping the current floor's annotations in the workspace"""
+        if self.floor is not None:
+            self.autosave(force=True)
+            self.floor.state = {name: getattr(self, name) for name in FLOOR_STATE_ATTRIBUTES}
+        
+        _, _, entrances, spaces, walls, paths, circles, squares = self.workspace.load(floor)
+        self.floor = floor
+        self.file_path = floor.file_path
+        self.map_name = floor.map_name
+        self.entrances = entrances
+        self.spaces = spaces
+        self.walls = walls
+        self.paths = paths
+        self.circles = circles
+        self.squares = squares
+        pygame.display.set_caption(f"Pather - {floor.map_name}")
+        
+        if floor.state is None:
+            if floor.health and summarize(floor.health):
+                print(f"Repaired geometry of {floor.map_name}: {summarize(floor.health)}")
+            
+            # Initial selection state
+            self.elevators = MarkerLayer()  # Elevator objects
+            self.stairs = MarkerLayer()  # Stairs objects
+            self.selected_entrances = [False] * len(entrances)
+            self.selected_spaces = np.zeros(len(spaces), dtype=bool)
+            self.confirmed_spaces = np.zeros(len(spaces), dtype=bool)  # Spaces whose midlines were computed
+            self.selected_walls = [False] * len(walls)
+            self.selected_paths = [False] * len(paths)
+            self.midline_paths = []
+            self.midline_colors = []
+            self.current_elevator_id = 1
+            self.current_stairs_id = 1
+            self.scale = 1.0
+            self.offset = [0, 0]
+            self.history = History()
+            self.journal = FloorJournal(floor.map_name, self.workspace.writer)
+            self.load_settings()
+        else:
+            for name, value in floor.state.items():
+                setattr(self, name, value)
+        
+        # Colors follow the selection state
+        self.entrance_colors = [ENTRANCE_COLOR] * len(entrances)
+        self.space_colors = [CLICKED_COLOR if selected else SPACE_COLOR for selected in self.selected_spaces]
+        self.wall_colors = [WALL_COLOR] * len(walls)
+        self.path_colors = [SPACE_COLOR] * len(paths)
+        self.circle_colors = [SHAPE_COLOR] * len(circles)
+        self.square_colors = [SHAPE_COLOR] * len(squares)
+        
+        # Model-space bounding boxes, used to find the screen area a shape covers
+        self.entrance_bounds = [shape_bounds(s) for s in entrances]
+        self.space_bounds = [shape_bounds(s) for s in spaces]
+        self.wall_bounds = [shape_bounds(s) for s in walls]
+        self.circle_bounds = [shape_bounds(s) for s in circles]
+        self.square_bounds = [shape_bounds(s) for s in squares]
+        self.midline_bounds = [shape_bounds(s) for s in self.midline_paths]
+        self.needs_redraw = True
+        
+        # Speculative work queued for the previous floor is no longer wanted
+        self.workspace.prefetcher.request([])
+        self.hovered_space = None
+        self.preview_version = None
+        self.refresh_preview()
+        
+        # Keep memory bounded and warm up the floors next to this one
+        for evicted in self.workspace.evict(floor):
+            print(f"Evicted floor: {evicted.map_name}")
+        for neighbour in self.workspace.neighbours(floor):
+            self.workspace.prefetch(neighbour)
+        
+        # Apply results of jobs that finished while this floor was off screen
+        self.apply_finished_jobs()
+    
+    def switch_floor(self, step):
+        """Show the floor step positions away from the current one"""
+        floors = self.workspace.floors
+        if len(floors) < 2:
+            return
+        index = (floors.index(self.floor) + step) % len(floors)
+        self.show_floor(floors[index])
+        print(f"Switched to floor {index + 1}/{len(floors)}: {self.map_name}")
+    
+    def open_floor(self, file_path):
+        """Add a floor to the workspace and show it"""
+        self.show_floor(self.workspace.add_floor(file_path))
+    
     def run(self):
-        """Main loop for the map window"""
-        clock = pygame.time.Clock()
+        """Main loop for the map window, sleeping until input or a finished job wakes it"""
         while self.running:
-            self.handle_events()
-            self.draw()
-            pygame.display.flip()
-            clock.tick(60)
+            event = pygame.event.wait(EVENT_WAIT_TIMEOUT)
+            events = pygame.event.get()
+            if event.type != pygame.NOEVENT:
+                events.insert(0, event)
+            self.handle_events(events)
+            self.apply_finished_jobs()
+            self.render()
+            self.autosave()
         
+        self.autosave(force=True)
+        self.workspace.shutdown()
         pygame.quit()
 
         # Notify the main application when this window closes
         self.on_close(self)
         
     
-    def handle_events(self):
+    def handle_events(self, events):
         """Handle pygame events for this window"""
-        mouse_pos = pygame.mouse.get_pos()
-        transformed_mouse_pos = inverse_transform_point(mouse_pos, self.scale, self.offset)
+        # Hover only needs to run once per batch, after the view or the mouse moved
+        hover_moved = False
         
-        # Handle hover effect if not in elevator mode
-        if not self.elevator_mode or self.stairs_mode:
-            handle_hover_and_click(transformed_mouse_pos, self.spaces, True, 
-                                  self.space_colors, self.selected_spaces, SPACE_COLOR)
-        
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 self.close()
 
             if event.type == pygame.K_ESCAPE:
                 self.close()
             
+            elif event.type == JOB_DONE_EVENT:
+                pass  # Finished jobs are applied after the batch
+            
             elif event.type == pygame.MOUSEBUTTONDOWN:
+                mouse_pos = event.pos
+                transformed_mouse_pos = inverse_transform_point(mouse_pos, self.scale, self.offset)
                 if event.button == 4:  # Scroll up
                     self.scale, self.offset = zoom_at(self.scale, self.offset, mouse_pos, 1.1)
+                    self.needs_redraw = True
+                    hover_moved = True
                 elif event.button == 5:  # Scroll down
                     self.scale, self.offset = zoom_at(self.scale, self.offset, mouse_pos, 1.0 / 1.1)
+                    self.needs_redraw = True
+                    hover_moved = True
                 elif event.button == 2:  # Middle click
                     self.dragging = True
                     self.drag_start = event.pos
                 elif event.button == 1:  # Left click
-                    if self.elevator_mode:
+                    if pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                        self.box_start = mouse_pos  # Shift + drag selects everything in a box
+                    elif pygame.key.get_mods() & pygame.KMOD_CTRL and not (self.elevator_mode or self.stairs_mode):
+                        self.lasso_points = [mouse_pos]  # Ctrl + drag selects the spaces inside a lasso
+                    elif self.elevator_mode:
                         # Check if clicking on existing elevator
-                        clicked_elevator = False
-                        for elevator in self.elevators:
-                            if elevator.is_clicked(mouse_pos, self.scale, self.offset):
-                                elevator.selected = not elevator.selected
-                                clicked_elevator = True
-                                break
+                        elevator = self.elevators.at(transformed_mouse_pos)
+                        if elevator is not None:
+                            elevator.selected = not elevator.selected
+                            self.history.record(ToggleChange([elevator]))
+                            self.dirty_rects.append(elevator.screen_rect(self.scale, self.offset))
                         
                         # If not clicking on existing elevator, create new one
-                        if not clicked_elevator:
+                        else:
                             new_elevator = Elevator(transformed_mouse_pos, self.current_elevator_id)
                             self.elevators.append(new_elevator)
+                            self.history.record(ListChange("elevators", [], [(len(self.elevators) - 1, new_elevator)]))
                             self.current_elevator_id += 1
+                            self.needs_redraw = True  # Mode indicator shows the new ID
                     elif self.stairs_mode:
                         # Check if clicking on existing stairs
-                        clicked_stairs = False
-                        for stairs in self.stairs:
-                            if stairs.is_clicked(mouse_pos, self.scale, self.offset):
-                                stairs.selected = not stairs.selected
-                                clicked_stairs = True
-                                break
+                        stairs = self.stairs.at(transformed_mouse_pos)
+                        if stairs is not None:
+                            stairs.selected = not stairs.selected
+                            self.history.record(ToggleChange([stairs]))
+                            self.dirty_rects.append(stairs.screen_rect(self.scale, self.offset))
                         
                         # If not clicking on existing stairs, create new one
-                        if not clicked_stairs:
+                        else:
                             new_stairs = Stairs(transformed_mouse_pos, self.current_stairs_id)
                             self.stairs.append(new_stairs)
+                            self.history.record(ListChange("stairs", [], [(len(self.stairs) - 1, new_stairs)]))
                             self.current_stairs_id += 1
+                            self.needs_redraw = True  # Mode indicator shows the new ID
                     
                     else:
                         # Normal space selection
-                        handle_click(transformed_mouse_pos, self.spaces, True, 
-                                    self.selected_spaces, self.space_colors, SPACE_COLOR)
+                        changed = handle_click(transformed_mouse_pos, self.spaces, True, 
+                                               self.selected_spaces, self.space_colors, SPACE_COLOR,
+                                               index=self.floor.picker)
+                        self.history.record(SelectionChange(changed))
+                        self.mark_shapes_dirty(self.space_bounds, changed)
             
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 2:  # Middle click
                     self.dragging = False
+                elif event.button == 1 and self.box_start is not None:
+                    if self.elevator_mode or self.stairs_mode:
+                        self.select_markers_in_box(self.box_start, event.pos)
+                    else:
+                        self.select_spaces_in_box(self.box_start, event.pos)
+                    self.box_start = None
+                elif event.button == 1 and self.lasso_points is not None:
+                    self.select_spaces_in_lasso(self.lasso_points + [event.pos])
+                    self.lasso_points = None
             
             elif event.type == pygame.MOUSEMOTION:
+                self.mouse_pos = event.pos
+                hover_moved = True
+                if self.box_start is not None:
+                    self.needs_redraw = True  # Follow the box outline
+                if self.lasso_points is not None:
+                    self.lasso_points.append(event.pos)
+                    self.needs_redraw = True
                 if self.dragging:
                     dx, dy = event.rel
                     self.offset[0] += dx
                     self.offset[1] += dy
+                    self.needs_redraw = True
             
             elif event.type == pygame.KEYDOWN:
+                # Keys change modes, IDs, midlines or loaded state, so repaint everything
+                self.needs_redraw = True
+                
                 if event.key == KEY_MIDLINE:  # Calculate midline paths for selected spaces
-                    self.midline_paths = handle_midline_path(
-                        self.selected_spaces, self.spaces, self.entrances, self.walls)
-                    self.midline_colors = [MIDLINE_COLOR] * len(self.midline_paths)
-                    print(f"Midline paths: {len(self.midline_paths)}")
+                    wall_index = self.floor.wall_index
+                    selected = self.selected_spaces.copy()
+                    def on_midlines(midline_paths):
+                        color_array = mark_wall_crossings([MIDLINE_COLOR] * len(midline_paths), midline_paths,
+                                                          wall_index)
+                        self.set_midlines(midline_paths, color_array)
+                        self.confirmed_spaces |= selected
+                        self.refresh_preview()
+                        print(f"Midline paths: {len(self.midline_paths)}")
+                    self.submit_job(on_midlines, handle_midline_path, list(self.selected_spaces), self.spaces,
+                                    self.entrances, self.walls, list(self.elevators), list(self.stairs),
+                                    self.workspace.centerline_cache, None, wall_index)
                 
                 elif event.key == KEY_ALL_MIDLINES:  # Calculate all midline paths
-                    color_array, self.midline_paths = handle_all_midlines(self.spaces, self.entrances, 
-                                                                         self.elevators, self.stairs)
-                    self.midline_colors = color_array
-                    print(f"All midline paths: {len(self.midline_paths)}")
+                    def on_all_midlines(result):
+                        color_array, midline_paths = result
+                        self.set_midlines(midline_paths, color_array)
+                        self.confirmed_spaces[:] = True
+                        self.refresh_preview()
+                        print(f"All midline paths: {len(self.midline_paths)}")
+                    self.submit_job(on_all_midlines, handle_all_midlines, self.spaces, self.entrances,
+                                    list(self.elevators), list(self.stairs), self.workspace.centerline_cache,
+                                    self.floor.wall_index)
+                
+                elif event.key == KEY_OPTIMIZE:  # Simplify and smooth the midline network
+                    def on_optimized(result):
+                        color_array, midline_paths, report = result
+                        self.set_midlines(midline_paths, color_array)
+                        print(f"Optimized midlines: {format_report(report)}")
+                    self.submit_job(on_optimized, handle_optimize_midlines, self.midline_paths)
                 
                 elif event.key == KEY_EXPORT:  # Export SVG
                     output_path = f"./output/{self.map_name}_output.svg"
@@ -187,7 +349,17 @@ class MapWindow:
                     self.save_settings()
                 
                 elif event.key == KEY_LOAD:  # Load selected spaces
+                    before = self.edit_state()
                     self.load_settings()
+                    self.record_edit(before)
+                
+                elif event.key == KEY_UNDO and event.mod & pygame.KMOD_CTRL:  # Undo the last edit
+                    if not self.history.undo(self):
+                        print("Nothing to undo")
+                
+                elif event.key == KEY_REDO and event.mod & pygame.KMOD_CTRL:  # Redo the last undone edit
+                    if not self.history.redo(self):
+                        print("Nothing to redo")
                 
                 elif event.key == KEY_ELEVATOR_MODE:  # Toggle elevator mode
                     if not self.stairs_mode:
@@ -222,12 +394,37 @@ class MapWindow:
                         print(f"Current stairs ID: {self.current_stairs_id}")
 
                 elif event.key == KEY_DELETE:  # Delete selected item
+                    before = self.edit_state()
                     if self.elevator_mode:
-                        self.elevators = [e for e in self.elevators if not e.selected]
-                        print("Deleted selected elevators")
+                        removed = self.elevators.remove_selected()
+                        print(f"Deleted {removed} selected elevators")
                     elif self.stairs_mode:
-                        self.stairs = [s for s in self.stairs if not s.selected]
-                        print("Deleted selected stairs")
+                        removed = self.stairs.remove_selected()
+                        print(f"Deleted {removed} selected stairs")
+                    self.record_edit(before)
+                
+                elif event.key == KEY_DETECT_MARKERS:  # Turn the shapes group into elevators and stairs
+                    before = self.edit_state()
+                    self.detect_markers()
+                    self.record_edit(before)
+                
+                elif event.key == KEY_IMPORT_MARKERS:  # Bulk import marker placements
+                    file_path = self.on_import() if self.on_import else None
+                    if file_path:
+                        before = self.edit_state()
+                        self.import_markers(file_path)
+                        self.record_edit(before)
+                
+                elif event.key == KEY_NEXT_FLOOR:  # Show the next open floor
+                    self.switch_floor(1)
+                
+                elif event.key == KEY_PREV_FLOOR:  # Show the previous open floor
+                    self.switch_floor(-1)
+                
+                elif event.key == KEY_OPEN_FLOOR:  # Open another floor alongside this one
+                    file_path = self.on_open() if self.on_open else None
+                    if file_path:
+                        self.open_floor(file_path)
                 
                 elif event.key == pygame.K_ESCAPE:  # Close window with ESC key
                     self.close()
@@ -235,39 +432,228 @@ class MapWindow:
             elif event.type == pygame.VIDEORESIZE:
                 self.width, self.height = event.size
                 self.window_id = pygame.display.set_mode((self.width, self.height), pygame.RESIZABLE | pygame.HWSURFACE)
+                self.needs_redraw = True
+            
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.needs_redraw = True
+        
+        # Handle hover effect if not in elevator mode
+        if hover_moved and (not self.elevator_mode or self.stairs_mode):
+            transformed_mouse_pos = inverse_transform_point(self.mouse_pos, self.scale, self.offset)
+            changed = handle_hover_and_click(transformed_mouse_pos, self.spaces, True, 
+                                             self.space_colors, self.selected_spaces, SPACE_COLOR,
+                                             index=self.floor.picker)
+            self.mark_shapes_dirty(self.space_bounds, changed)
+            hovered = self.floor.picker.innermost(transformed_mouse_pos)
+            if hovered != self.hovered_space:
+                self.hovered_space = hovered
+                self.preview_version = None
+        
+        # Precompute what the user is likely to confirm with the midline key next
+        if MIDLINE_PREVIEW and self.preview_version != self.history.version:
+            self.speculate()
+    
+    def submit_job(self, callback, function, *args):
+        """Run function in the shared pool and pass its result to callback on the main thread"""
+        future = self.workspace.executor.submit(function, *args)
+        future.add_done_callback(post_job_done)
+        self.jobs.append((self.floor, future, callback))
+    
+    def apply_finished_jobs(self):
+        """
+        Run the callbacks of finished jobs for the floor on screen, in submission order.
+        Jobs without a floor (speculative centerlines) run for whichever floor is shown.
+        """
+        remaining = []
+        for floor, future, callback in self.jobs:
+            if future.cancelled():
+                continue
+            elif not future.done() or (floor is not None and floor is not self.floor):
+                remaining.append((floor, future, callback))
+            elif future.exception() is not None:
+                print(f"Background job failed: {future.exception()}")
+            else:
+                callback(future.result())
+        self.jobs = remaining
+    
+    def preview_candidates(self):
+        """Spaces whose midline the preview shows: the hovered one and the selected ones not computed yet"""
+        indices = np.flatnonzero(self.selected_spaces & ~self.confirmed_spaces).tolist()
+        if self.hovered_space is not None and not self.confirmed_spaces[self.hovered_space]:
+            indices.insert(0, self.hovered_space)
+        return list(dict.fromkeys(indices))
+    
+    def speculate(self):
+        """
+        Queue the centerlines of the preview candidates and of the spaces nearest the cursor
+        on the low-priority prefetcher, dropping queued work for spaces no longer wanted.
+        Each finished centerline lands in the shared cache, where the midline key finds it.
+        """
+        self.preview_version = self.history.version
+        point = shapely.Point(inverse_transform_point(self.mouse_pos, self.scale, self.offset))
+        index = self.floor.space_index
+        near = index.tree.query(point, predicate="dwithin", distance=SPECULATIVE_RADIUS)
+        near = near[np.argsort(shapely.distance(index.polygons[near], point), kind="stable")]
+        targets = dict.fromkeys(self.preview_candidates() + near[:SPECULATIVE_NEIGHBOURS].tolist())
+        
+        floor = self.floor
+        for _, future in self.workspace.prefetcher.request([((floor, i), self.spaces[i]) for i in targets]):
+            future.add_done_callback(post_job_done)
+            self.jobs.append((None, future, lambda midline: self.refresh_preview()))
+        self.refresh_preview()
+    
+    def refresh_preview(self):
+        """Show the cached centerlines of the preview candidates"""
+        paths = []
+        if MIDLINE_PREVIEW:
+            cache = self.workspace.centerline_cache
+            for i in self.preview_candidates():
+                midline = cache.get(self.spaces[i])
+                if not midline:
+                    continue  # Still being computed, or a degenerate space
+                if all(isinstance(part, list) for part in midline):
+                    paths.extend(midline)
+                else:
+                    paths.append(midline)
+        if [id(p) for p in paths] == [id(p) for p in self.preview_paths]:
+            return
+        # Repaint only where the old preview was and where the new one is
+        self.mark_shapes_dirty(self.preview_bounds, range(len(self.preview_bounds)))
+        self.preview_paths = paths
+        self.preview_bounds = [shape_bounds(p) for p in paths]
+        self.preview_colors = [PREVIEW_COLOR] * len(paths)
+        self.mark_shapes_dirty(self.preview_bounds, range(len(self.preview_bounds)))
     
     def close(self):
         """Properly close the window and notify the main application"""
         print(f"Closing window: {self.map_name}")
         self.running = False
     
-    def draw(self):
-        """Draw all elements to the screen"""
-        self.window_id.fill((255, 255, 255))  # White background
-        
-        # Transform shapes
-        transformed_spaces = transform_shapes(self.spaces, self.scale, self.offset)
-        transformed_walls = transform_shapes(self.walls, self.scale, self.offset)
-        transformed_entrances = transform_shapes(self.entrances, self.scale, self.offset)
-        transformed_midline_paths = transform_shapes(self.midline_paths, self.scale, self.offset)
-        transformed_circles = transform_shapes(self.circles, self.scale, self.offset)
-        transformed_squares = transform_shapes(self.squares, self.scale, self.offset)
-        
-        # Draw shapes
-        draw_shapes(self.window_id, transformed_spaces, True, self.space_colors)
-        draw_shapes(self.window_id, transformed_walls, False, self.wall_colors)
-        draw_shapes(self.window_id, transformed_entrances, False, self.entrance_colors)
-        draw_shapes(self.window_id, transformed_midline_paths, False, self.midline_colors)        
-        draw_shapes(self.window_id, transformed_circles, False, self.circle_colors)
-        draw_shapes(self.window_id, transformed_squares, False, self.square_colors)
-
-        # Draw elevators
-        for elevator in self.elevators:
-            elevator.draw(self.window_id, self.scale, self.offset)
+    def set_midlines(self, midline_paths, midline_colors, record=True):
+        """Replace the displayed midlines and their bounding boxes"""
+        if record:
+            self.history.record(ListChange.between("midlines", self.history_list("midlines"),
+                                                   list(zip(midline_paths, midline_colors)), key=midline_key))
+        self.midline_paths = midline_paths
+        self.midline_colors = midline_colors
+        self.midline_bounds = [shape_bounds(s) for s in midline_paths]
+        self.needs_redraw = True
+    
+    def history_list(self, name):
+        """Current version of a list the undo history diffs: elevators, stairs or midlines"""
+        if name == "midlines":
+            return list(zip(self.midline_paths, self.midline_colors))
+        return list(getattr(self, name))
+    
+    def restore_list(self, name, items):
+        """Put back a version of a list from the undo history"""
+        if name == "midlines":
+            self.set_midlines([path for path, _ in items], [color for _, color in items], record=False)
+        else:
+            setattr(self, name, MarkerLayer(items))
+            self.needs_redraw = True
+    
+    def flip_spaces(self, indices):
+        """Invert the selection of the given spaces"""
+        self.selected_spaces[indices] ^= True
+        for i in np.asarray(indices).tolist():
+            self.space_colors[i] = CLICKED_COLOR if self.selected_spaces[i] else SPACE_COLOR
+        self.mark_shapes_dirty(self.space_bounds, np.asarray(indices).tolist())
+    
+    def edit_state(self):
+        """Space selection and marker lists before a bulk edit, to diff against with record_edit"""
+        return (self.selected_spaces.copy(), self.history_list("elevators"), self.history_list("stairs"),
+                [m.selected for m in self.elevators], [s.selected for s in self.stairs],
+                self.history_list("midlines"))
+    
+    def record_edit(self, before):
+        """Record everything a bulk edit changed since edit_state as one undo step"""
+        selected, elevators, stairs, elevator_flags, stairs_flags, midlines = before
+        changes = [SelectionChange(np.flatnonzero(selected != self.selected_spaces))
+                   if len(selected) == len(self.selected_spaces) else None,
+                   ListChange.between("elevators", elevators, self.history_list("elevators")),
+                   ListChange.between("stairs", stairs, self.history_list("stairs")),
+                   ListChange.between("midlines", midlines, self.history_list("midlines"), key=midline_key)]
+        # Markers kept through the edit whose selected flag changed
+        kept = {id(m) for m in self.elevators} | {id(s) for s in self.stairs}
+        changes.append(ToggleChange([m for m, flag in zip(elevators + stairs, elevator_flags + stairs_flags)
+                                     if id(m) in kept and m.selected != flag]))
+        self.history.record(*changes)
+    
+    def mark_shapes_dirty(self, bounds, indices):
+        """Queue the screen area of the shapes at indices for repainting"""
+        for i in indices:
+            if bounds[i] is None:
+                continue
+            x1, y1, x2, y2 = transform_bounds(bounds[i], self.scale, self.offset)
+            self.dirty_rects.append(pygame.Rect(int(x1) - DIRTY_RECT_PADDING, int(y1) - DIRTY_RECT_PADDING,
+                                                int(x2 - x1) + 2 * DIRTY_RECT_PADDING + 1,
+                                                int(y2 - y1) + 2 * DIRTY_RECT_PADDING + 1))
+    
+    def layers(self):
+        """Shape layers in drawing order as (shapes, bounds, is_polygon, colors) tuples"""
+        return [
+            (self.spaces, self.space_bounds, True, self.space_colors),
+            (self.walls, self.wall_bounds, False, self.wall_colors),
+            (self.entrances, self.entrance_bounds, False, self.entrance_colors),
+            (self.midline_paths, self.midline_bounds, False, self.midline_colors),
+            (self.preview_paths, self.preview_bounds, False, self.preview_colors),
+            (self.circles, self.circle_bounds, False, self.circle_colors),
+            (self.squares, self.square_bounds, False, self.square_colors),
+        ]
+    
+    def render(self):
+        """Repaint whatever changed since the last frame and push only that to the display"""
+        if self.needs_redraw:
+            self.draw()
+            pygame.display.flip()
+        elif self.dirty_rects:
+            screen_rect = self.window_id.get_rect()
+            rects = [rect.clip(screen_rect) for rect in self.dirty_rects]
+            rects = [rect for rect in rects if rect.width and rect.height]
+            for rect in rects:
+                self.draw(rect)
+            pygame.display.update(rects)
+        
+        self.needs_redraw = False
+        self.dirty_rects = []
+    
+    def draw(self, region=None):
+        """Draw all elements to the screen, or only those overlapping a screen rectangle"""
+        self.window_id.set_clip(region)
+        self.window_id.fill((255, 255, 255), region)  # White background
+        
+        # Draw shapes, skipping those outside the region
+        model_region = None
+        if region is not None:
+            model_region = inverse_transform_bounds((region.left, region.top, region.right, region.bottom),
+                                                    self.scale, self.offset)
+        for shapes, bounds, is_polygon, colors in self.layers():
+            if model_region is None:
+                indices = range(len(shapes))
+            else:
+                indices = [i for i, b in enumerate(bounds) if bounds_intersect(b, model_region)]
+            transformed_shapes = transform_shapes([shapes[i] for i in indices], self.scale, self.offset)
+            draw_shapes(self.window_id, transformed_shapes, is_polygon, [colors[i] for i in indices])
 
-        # Draw stairs
-        for stairs in self.stairs:
-            stairs.draw(self.window_id, self.scale, self.offset)
+        # Draw elevators, then stairs, looking up only the grid cells near the region
+        for layer in (self.elevators, self.stairs):
+            if model_region is None:
+                markers = layer
+            else:
+                pad = Marker.radius * 2  # Markers and their ID text reach this far from their position
+                markers = layer.in_box((model_region[0] - pad, model_region[1] - pad,
+                                        model_region[2] + pad, model_region[3] + pad))
+            for marker in markers:
+                marker.draw(self.window_id, self.scale, self.offset)
+        
+        # Draw the box selection outline
+        if self.box_start is not None:
+            (x1, y1), (x2, y2) = self.box_start, self.mouse_pos
+            pygame.draw.rect(self.window_id, BOX_SELECT_COLOR,
+                             (min(x1, x2), min(y1, y2), abs(x2 - x1), abs(y2 - y1)), 1)
+        if self.lasso_points is not None and len(self.lasso_points) > 1:
+            pygame.draw.lines(self.window_id, BOX_SELECT_COLOR, True, self.lasso_points, 1)
         
         # Draw elevator mode indicator
         if self.elevator_mode:
@@ -278,55 +664,172 @@ class MapWindow:
             font = pygame.font.SysFont('Arial', 20)
             text = font.render(f"Stairs Mode (ID: {self.current_stairs_id})", True, STAIRS_COLOR)
             self.window_id.blit(text, (10, 10))
+        
+        self.window_id.set_clip(None)
+    
+    def select_spaces(self, indices):
+        """Select the given spaces, or deselect them if they were all selected already"""
+        if not len(indices):
+            return
+        value = not self.selected_spaces[indices].all()
+        self.history.record(SelectionChange(indices[self.selected_spaces[indices] != value]))
+        self.selected_spaces[indices] = value
+        for i in indices.tolist():
+            self.space_colors[i] = CLICKED_COLOR if value else SPACE_COLOR
+        self.mark_shapes_dirty(self.space_bounds, indices.tolist())
+        print(f"{'Selected' if value else 'Deselected'} {len(indices)} spaces, "
+              f"{int(self.selected_spaces.sum())} selected in total")
+    
+    def select_spaces_in_box(self, start, end):
+        """
+        Select the spaces in a screen-space box. Dragging right takes the spaces entirely
+        inside the box, dragging left also takes the spaces it only touches.
+        """
+        (x1, y1), (x2, y2) = (inverse_transform_point(p, self.scale, self.offset) for p in (start, end))
+        region = shapely.box(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.select_spaces(self.floor.space_index.in_region(region, contained=end[0] >= start[0]))
+        self.needs_redraw = True  # Clears the box outline
+    
+    def select_spaces_in_lasso(self, points):
+        """Select the spaces entirely inside a freehand screen-space lasso"""
+        region = lasso_polygon([inverse_transform_point(p, self.scale, self.offset) for p in points])
+        self.select_spaces(self.floor.space_index.in_region(region))
+        self.needs_redraw = True  # Clears the lasso outline
+    
+    def select_markers_in_box(self, start, end):
+        """Select the markers of the current mode inside a screen-space box"""
+        (x1, y1), (x2, y2) = (inverse_transform_point(p, self.scale, self.offset) for p in (start, end))
+        layer = self.elevators if self.elevator_mode else self.stairs
+        markers = layer.in_box((min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
+        self.history.record(ToggleChange([m for m in markers if not m.selected]))
+        for marker in markers:
+            marker.selected = True
+        self.needs_redraw = True  # Clears the box outline
+        print(f"Selected {len(markers)} {'elevators' if self.elevator_mode else 'stairs'}")
+    
+    def other_floor_markers(self, key):
+        """Markers of one kind ("elevators" or "stairs") on every other open floor"""
+        markers = []
+        for floor in self.workspace.floors:
+            if floor is not self.floor and floor.state is not None:
+                markers.extend(floor.state[key])
+        return markers
+    
+    def detect_markers(self):
+        """Add elevators and stairs for the shapes group, with IDs matched to the other open floors"""
+        elevators, stairs = detect_markers(self.circles, self.squares, self.elevators, self.stairs)
+        matched = match_marker_ids(elevators, self.other_floor_markers("elevators"), [e.id for e in self.elevators])
+        matched += match_marker_ids(stairs, self.other_floor_markers("stairs"), [s.id for s in self.stairs])
+        self.elevators.extend(elevators)
+        self.stairs.extend(stairs)
+        self.needs_redraw = True
+        print(f"Detected {len(elevators)} elevators and {len(stairs)} stairs, {matched} matched to other floors")
+    
+    def import_markers(self, file_path):
+        """Apply a CSV/JSON marker import to the open floors and to the settings of the others"""
+        try:
+            floors = read_annotations(file_path)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Failed to import markers: {e}")
+            return
+        assign_missing_ids(floors)
+        
+        open_floors = {floor.map_name: floor for floor in self.workspace.floors}
+        for map_name, markers in floors.items():
+            floor = open_floors.get(map_name)
+            if floor is self.floor:
+                self.elevators, self.stairs = MarkerLayer(markers["elevators"]), MarkerLayer(markers["stairs"])
+                self.needs_redraw = True
+            elif floor is not None and floor.state is not None:
+                floor.state["elevators"] = MarkerLayer(markers["elevators"])
+                floor.state["stairs"] = MarkerLayer(markers["stairs"])
+            else:
+                write_settings_markers(map_name, markers["elevators"], markers["stairs"])
+            print(f"Imported {len(markers['elevators'])} elevators and {len(markers['stairs'])} stairs for {map_name}")
+    
+    def persisted_state(self):
+        """The parts of the floor that the settings file and its journal hold"""
+        return {"selected_spaces": self.selected_spaces, "elevators": self.elevators, "stairs": self.stairs,
+                "midlines": self.history_list("midlines")}
+    
+    def autosave(self, force=False):
+        """Journal the edits made since the last autosave, at most every AUTOSAVE_INTERVAL"""
+        now = pygame.time.get_ticks()
+        if self.journal.version == self.history.version:
+            return
+        if not force and now - self.last_autosave < AUTOSAVE_INTERVAL:
+            return
+        self.last_autosave = now
+        self.journal.version = self.history.version
+        self.journal.sync(self.persisted_state())
     
     def save_settings(self):
-        """Save selected elevators to a JSON file"""
-        file_path = f"./output/{self.map_name}_settings.json"
-        with open(file_path, 'w') as file:
-            json.dump({
-                "elevators": [{"position": e.position, "id": e.id, "selected": e.selected} 
-                             for e in self.elevators],
-                "stairs": [{"position": s.position, "id": s.id, "selected": s.selected} 
-                             for s in self.stairs],
-            }, file)
-        print(f"Selected elevators saved to {file_path}")
+        """Save selected spaces, elevators and midlines to a JSON file"""
+        self.journal.version = self.history.version
+        self.journal.compact(self.persisted_state()).result()
+        print(f"Selected spaces, elevators and midlines saved to {settings_path(self.map_name)}")
     
     def load_settings(self):
-        """Load selected elevators from a JSON file"""
-        file_path = f"./output/{self.map_name}_settings.json"
-        try:
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-                
-                # Load elevators
-                loaded_elevators = data.get("elevators", [])
-                if loaded_elevators:
-                    self.elevators = []
-                    for e_data in loaded_elevators:
-                        elevator = Elevator(
-                            position=tuple(e_data["position"]), 
-                            elevator_id=e_data.get("id", 1)
-                        )
-                        elevator.selected = e_data.get("selected", False)
-                        self.elevators.append(elevator)
-                
-                # Load stairs
-                loaded_stairs = data.get("stairs", [])
-                if loaded_stairs:
-                    self.stairs = []
-                    for e_data in loaded_stairs:
-                        staircase = Stairs(
-                            position=tuple(e_data["position"]), 
-                            stairs_id=e_data.get("id", 1)
-                        )
-                        staircase.selected = e_data.get("selected", False)
-                        self.stairs.append(staircase)
-                
-                print(f"Selected elevators loaded from {file_path}")
-        except FileNotFoundError:
+        """Load selected spaces, elevators and midlines from the JSON file and its autosave journal"""
+        file_path = settings_path(self.map_name)
+        data = read_settings(self.map_name)
+        if data is None:
             print(f"No saved file found at {file_path}")
+            return
+        
+        # Load elevators
+        loaded_elevators = data.get("elevators", [])
+        if loaded_elevators:
+            self.elevators = MarkerLayer()
+            for e_data in loaded_elevators:
+                elevator = Elevator(
+                    position=tuple(e_data["position"]), 
+                    elevator_id=e_data.get("id", 1)
+                )
+                elevator.selected = e_data.get("selected", False)
+                self.elevators.append(elevator)
+        
+        # Load stairs
+        loaded_stairs = data.get("stairs", [])
+        if loaded_stairs:
+            self.stairs = MarkerLayer()
+            for e_data in loaded_stairs:
+                staircase = Stairs(
+                    position=tuple(e_data["position"]), 
+                    stairs_id=e_data.get("id", 1)
+                )
+                staircase.selected = e_data.get("selected", False)
+                self.stairs.append(staircase)
+        
+        # Load selected spaces
+        if "selected_spaces" in data:
+            selected = unpack_selection(data["selected_spaces"], len(self.spaces))
+            if selected is None:
+                print("Saved space selection was made for a different floor plan, skipping it")
+            else:
+                self.selected_spaces = selected
+                self.space_colors = [CLICKED_COLOR if s else SPACE_COLOR for s in selected]
+                self.needs_redraw = True
+        
+        # Load midlines
+        if "midlines" in data:
+            self.set_midlines([[tuple(p) for p in m["path"]] for m in data["midlines"]],
+                              [tuple(m["color"]) for m in data["midlines"]], record=False)
+            self.confirmed_spaces = self.selected_spaces.copy()  # Their midlines are most likely among these
+        
+        self.journal.loaded(self.persisted_state(), data.get("seq", 0))
+        print(f"Selected spaces, elevators and midlines loaded from {file_path}")
 
 # Existing functions from display.py with minor modifications
+def post_job_done(future):
+    """
+    Wakes the event loop when a background job finishes. Called from the worker thread.
+    """
+    try:
+        pygame.event.post(pygame.event.Event(JOB_DONE_EVENT))
+    except pygame.error:
+        pass  # Display already closed
+
 def draw_shapes(screen, shapes, is_polygon, colors):
     """
     Draws polygons and polylines on the screen.
@@ -337,109 +840,71 @@ def draw_shapes(screen, shapes, is_polygon, colors):
         else:
             pygame.draw.lines(screen, colors[i], False, shape, 3)
 
-def handle_hover_and_click(mouse_pos, shapes, is_polygon, shape_colors, selected, base_color):
+def handle_hover_and_click(mouse_pos, shapes, is_polygon, shape_colors, selected, base_color, index=None):
     """
     Handles highlighting shapes when the mouse hovers over them.
+    
+    When a SpaceIndex or HitMap of the polygons is given, the hovered polygon is looked up in it.
+    
+    Returns the indices of shapes whose color changed.
     """
-    if is_polygon:
+    changed = []
+    if is_polygon and index is not None:
+        innermost = index.innermost(mouse_pos)
+        for i, color in enumerate(shape_colors):
+            if selected[i]:
+                continue
+            target = HIGHLIGHT_COLOR if i == innermost else base_color
+            if color != target:
+                shape_colors[i] = target
+                changed.append(i)
+    elif is_polygon:
         innermost_shape = find_innermost_polygon(mouse_pos, shapes)
         for i, shape in enumerate(shapes):
-            if shape == innermost_shape:
-                if not selected[i]:
-                    shape_colors[i] = HIGHLIGHT_COLOR
-            elif not selected[i]:
-                shape_colors[i] = base_color
+            if selected[i]:
+                continue
+            color = HIGHLIGHT_COLOR if shape == innermost_shape else base_color
+            if shape_colors[i] != color:
+                shape_colors[i] = color
+                changed.append(i)
     else:
         for i, shape in enumerate(shapes):
-            if is_point_near_line(mouse_pos, shape):
-                if not selected[i]:
-                    shape_colors[i] = HIGHLIGHT_COLOR
-            elif not selected[i]:
-                shape_colors[i] = base_color
+            if selected[i]:
+                continue
+            color = HIGHLIGHT_COLOR if is_point_near_line(mouse_pos, shape) else base_color
+            if shape_colors[i] != color:
+                shape_colors[i] = color
+                changed.append(i)
+    return changed
 
-def handle_click(mouse_pos, shapes, is_polygon, selected, shape_colors, base_color):
+def handle_click(mouse_pos, shapes, is_polygon, selected, shape_colors, base_color, index=None):
     """
     Handles selecting/deselecting shapes when clicked.
+    
+    When a SpaceIndex or HitMap of the polygons is given, the clicked polygon is looked up in it.
+    
+    Returns the indices of shapes whose selection changed.
     """
-    if is_polygon:
+    changed = []
+    if is_polygon and index is not None:
+        i = index.innermost(mouse_pos)
+        if i is not None:
+            selected[i] = not selected[i]
+            shape_colors[i] = CLICKED_COLOR if selected[i] else base_color
+            changed.append(i)
+            print(i + 1, selected[i])
+    elif is_polygon:
         innermost_shape = find_innermost_polygon(mouse_pos, shapes)
         for i, shape in enumerate(shapes):
             if shape == innermost_shape:
                 selected[i] = not selected[i]
                 shape_colors[i] = CLICKED_COLOR if selected[i] else base_color
+                changed.append(i)
                 print(i + 1, selected[i])
     else:
         for i, shape in enumerate(shapes):
             if is_point_near_line(mouse_pos, shape):
                 selected[i] = not selected[i]
                 shape_colors[i] = CLICKED_COLOR if selected[i] else base_color
-
-def handle_midline_path(selected_spaces, spaces, entrances, walls, elevators, stairs):
-    """
-    Calculates midline paths for selected spaces and connects entrances to these paths.
-    """
-    midline_paths = []
-    for i, selected in enumerate(selected_spaces):
-        if selected:
-            print("Selected space:", i + 1)
-            midline_path = find_midline_path(polygon=spaces[i])
-            if isinstance(midline_path, list) and all(isinstance(item, list) for item in midline_path):
-                midline_paths.extend(midline_path)
-            else:
-                midline_paths.append(midline_path)
-
-            if not midline_path:
-                continue
-
-            # Add paths from doors to the nearest point on the midline if it touches the space
-            for entrance in entrances:
-                midpoint = ((entrance[0][0] + entrance[1][0]) / 2, (entrance[0][1] + entrance[1][1]) / 2)
-                if is_point_inside_polygon(midpoint, spaces[i], tolerance=5):
-                    nearest_point = nearest_point_on_line(midpoint, midline_path)
-                    midline_paths.append([tuple(midpoint), tuple(nearest_point)])
-
-            # Add paths from elevators to the nearest point on the midline
-            for elevator in elevators:
-                if is_point_inside_polygon(elevator.position, spaces[i], tolerance=5):
-                    nearest_point = nearest_point_on_line(elevator.position, midline_path)
-                    midline_paths.append([tuple(elevator.position), tuple(nearest_point)])
-
-            # Add paths from stairs to the nearest point on the midline
-            for stair in stairs:
-                if is_point_inside_polygon(stair.position, spaces[i], tolerance=5):
-                    nearest_point = nearest_point_on_line(stair.position, midline_path)
-                    midline_paths.append([tuple(stair.position), tuple(nearest_point)])
-    
-    return midline_paths
-
-def handle_all_midlines(spaces, entrances, elevators=None, stairs=None):
-    """
-    Calculates midline paths for all spaces and connects them.
-    """
-    midline_paths = handle_midline_path([True] * len(spaces), spaces, entrances, [], elevators, stairs)
-    paths = midline_paths.copy()
-
-    # Merge all midlines that share coordinates
-    merged_midlines = []
-    while paths:
-        current_path = paths.pop(0)
-        overlapping_indices = [i for i, path in enumerate(merged_midlines) if any(coord in path for coord in current_path)]
-        
-        if overlapping_indices:
-            # Merge all overlapping midlines into one
-            merged_path = current_path
-            for index in sorted(overlapping_indices, reverse=True):
-                merged_path = list(set(merged_path + merged_midlines.pop(index)))
-            merged_midlines.append(merged_path)
-        else:
-            merged_midlines.append(current_path)
-
-    # Find the largest midline
-    largest_midline = max(merged_midlines, key=len, default=[])
-    largest_midline_set = set(map(tuple, largest_midline))
-
-    color_array = []
-    for midline in midline_paths:
-        color_array.append((0, 255, 0) if any(point in largest_midline_set for point in midline) else (255, 0, 0))
-
-    return color_array, midline_paths
\ No newline at end of file
+                changed.append(i)
+    return changed
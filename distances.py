@@ -0,0 +1,277 @@
+"""
+Room-to-room travel distances over the midline network, within a floor and across floors.
+
+Usage:
+    python distances.py floors/level1.svg floors/level2.svg -o output/building_distances.npz
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import shapely
+from shapely import STRtree
+from annotations import read_settings_markers
+from collision import WallIndex
+from geometry_utils import snap_point
+from pipeline import handle_all_midlines
+from validation import load_svg
+from network import entrance_midpoint
+from values import ENTRANCE_DISTANCE, ELEVATOR_FLOOR_COST, STAIRS_FLOOR_COST, DISTANCE_BLOCK_SIZE, WORKER_COUNT
+
+def build_graph(floors):
+    """
+    Builds one weighted graph over the midline networks of several floors.
+
+    Nodes are midline vertices snapped to the tolerance grid, so connectors meet the
+    midlines they end on. Elevators and stairs with the same ID on consecutive floors
+    are joined by an edge costing ELEVATOR_FLOOR_COST or STAIRS_FLOOR_COST.
+
+    Parameters:
+        floors: List of dictionaries with "midlines", "elevators" and "stairs", in floor order
+
+    Returns:
+        (adjacency, nodes) tuple: adjacency[i] is a list of (neighbour, length) pairs, and
+        nodes maps (floor index, snapped point) to the node index
+    """
+    nodes = {}
+    adjacency = []
+
+    def node(key):
+        if key not in nodes:
+            nodes[key] = len(adjacency)
+            adjacency.append([])
+        return nodes[key]
+
+    def connect(a, b, length):
+        if a != b:
+            adjacency[a].append((b, length))
+            adjacency[b].append((a, length))
+
+    for f, floor in enumerate(floors):
+        for path in floor["midlines"]:
+            for p, q in zip(path, path[1:]):
+                connect(node((f, snap_point(p))), node((f, snap_point(q))), math.dist(p, q))
+
+    # Vertical links between markers sharing an ID on consecutive floors
+    for key, cost in (("elevators", ELEVATOR_FLOOR_COST), ("stairs", STAIRS_FLOOR_COST)):
+        for f in range(len(floors) - 1):
+            upper = {m.id: m for m in floors[f + 1][key]}
+            for marker in floors[f][key]:
+                other = upper.get(marker.id)
+                if other is None:
+                    continue
+                a = nodes.get((f, snap_point(marker.position)))
+                b = nodes.get((f + 1, snap_point(other.position)))
+                if a is not None and b is not None:
+                    connect(a, b, cost)
+    return adjacency, nodes
+
+def space_nodes(floors, nodes, distance=ENTRANCE_DISTANCE):
+    """
+    Finds the nodes each space is entered through: its door midpoints on the network, or
+    when it has none, every network node inside it.
+
+    Returns:
+        (labels, node_lists) tuple: labels are (floor name, space index) pairs, node_lists
+        the node indices of each space in the same order
+    """
+    labels, node_lists = [], []
+    for f, floor in enumerate(floors):
+        spaces = floor["spaces"]
+        polygons = [shapely.Polygon(s) if len(s) >= 3 else shapely.MultiPoint(s) for s in spaces]
+        tree = STRtree(polygons)
+        doors = {}
+        door_points = [entrance_midpoint(e) for e in floor["entrances"] if len(e) >= 2]
+        if door_points:
+            door_indices, space_indices = tree.query(shapely.points(door_points), predicate="dwithin",
+                                                     distance=distance)
+            for d, s in zip(door_indices.tolist(), space_indices.tolist()):
+                n = nodes.get((f, snap_point(door_points[d])))
+                if n is not None:
+                    doors.setdefault(s, set()).add(n)
+
+        inside = {}
+        floor_nodes = [(point, n) for (node_floor, point), n in nodes.items() if node_floor == f]
+        missing = [s for s in range(len(spaces)) if s not in doors]
+        if missing and floor_nodes:
+            point_indices, space_indices = tree.query(shapely.points([p for p, _ in floor_nodes]),
+                                                      predicate="intersects")
+            for p, s in zip(point_indices.tolist(), space_indices.tolist()):
+                inside.setdefault(s, set()).add(floor_nodes[p][1])
+
+        for s in range(len(spaces)):
+            labels.append((floor["name"], s))
+            node_lists.append(sorted(doors.get(s) or inside.get(s) or ()))
+    return labels, node_lists
+
+def dijkstra(adjacency, sources):
+    """Multi-source Dijkstra: distance from the nearest source to every node (inf if unreachable)"""
+    dist = [math.inf] * len(adjacency)
+    heap = [(0.0, s) for s in sources]
+    for s in sources:
+        dist[s] = 0.0
+    heapq.heapify(heap)
+    while heap:
+        d, n = heapq.heappop(heap)
+        if d > dist[n]:
+            continue
+        for m, length in adjacency[n]:
+            nd = d + length
+            if nd < dist[m]:
+                dist[m] = nd
+                heapq.heappush(heap, (nd, m))
+    return dist
+
+# Graph and space nodes of the matrix being computed, set once per worker process
+_adjacency = None
+_node_lists = None
+_targets = None  # (spaces with nodes, their nodes flattened, offset of each space's run)
+
+def _init_worker(adjacency, node_lists):
+    global _adjacency, _node_lists, _targets
+    _adjacency, _node_lists = adjacency, node_lists
+    if node_lists is not None:
+        columns = np.array([i for i, n in enumerate(node_lists) if n], dtype=np.intp)
+        flat = np.array([t for n in node_lists for t in n], dtype=np.intp)
+        offsets = np.cumsum([0] + [len(node_lists[i]) for i in columns[:-1]], dtype=np.intp)
+        _targets = (columns, flat, offsets)
+
+def _distance_rows(rows):
+    # One matrix row per source space: the distance to the closest entrance node of every space
+    columns, flat, offsets = _targets
+    result = np.full((len(rows), len(_node_lists)), np.inf, dtype=np.float32)
+    for r, row in enumerate(rows):
+        if not _node_lists[row] or not len(columns):
+            continue
+        dist = np.asarray(dijkstra(_adjacency, _node_lists[row]))
+        result[r, columns] = np.minimum.reduceat(dist[flat], offsets)
+    return rows, result
+
+def compute_distance_matrix(floors, workers=WORKER_COUNT):
+    """
+    Computes travel distances between every pair of spaces on the given floors.
+
+    Parameters:
+        floors: List of dictionaries with "name", "spaces", "entrances", "midlines" (the
+                network from handle_all_midlines), "elevators" and "stairs", in floor order
+        workers: Processes running the Dijkstra searches in parallel
+
+    Returns:
+        DistanceMatrix
+    """
+    adjacency, nodes = build_graph(floors)
+    labels, node_lists = space_nodes(floors, nodes)
+    matrix = np.full((len(labels), len(labels)), np.inf, dtype=np.float32)
+    chunks = [list(range(i, len(labels), max(workers, 1) * 4)) for i in range(min(len(labels), max(workers, 1) * 4))]
+
+    if workers > 1 and len(labels) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(adjacency, node_lists)) as executor:
+            for rows, result in executor.map(_distance_rows, chunks):
+                matrix[rows] = result
+    else:
+        _init_worker(adjacency, node_lists)
+        for rows, result in map(_distance_rows, chunks):
+            matrix[rows] = result
+        _init_worker(None, None)
+    return DistanceMatrix(labels, matrix)
+
+
+class DistanceMatrix:
+    """
+    Travel distances between spaces as a float32 matrix (inf where no route exists).
+
+    Saved matrices can be split into square blocks that are compressed separately; a
+    loaded blocked matrix decompresses each block the first time a pair in it is queried.
+    """
+    def __init__(self, labels, matrix=None, blocks=None, block_size=None):
+        self.labels = [tuple(label) for label in labels]
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        self.matrix = matrix
+        self.blocks = blocks  # Lazily loaded npz archive of blocks
+        self.block_size = block_size
+        self.loaded_blocks = {}
+
+    def distance(self, a, b):
+        """
+        Travel distance between two spaces.
+
+        Parameters:
+            a, b: (floor name, space index) labels
+
+        Returns:
+            Distance in model units, inf when b cannot be reached from a
+        """
+        i, j = self.index[tuple(a)], self.index[tuple(b)]
+        if self.matrix is not None:
+            return float(self.matrix[i, j])
+        key = (i // self.block_size, j // self.block_size)
+        block = self.loaded_blocks.get(key)
+        if block is None:
+            block = self.loaded_blocks[key] = self.blocks[f"block_{key[0]}_{key[1]}"]
+        return float(block[i % self.block_size, j % self.block_size])
+
+    def save(self, file_path, block_size=DISTANCE_BLOCK_SIZE, compressed=True):
+        """
+        Writes the matrix to an .npz archive.
+
+        Parameters:
+            file_path: Output path
+            block_size: Side of the stored blocks, or None to store the matrix whole
+            compressed: Whether to deflate the archive
+        """
+        arrays = {"labels": np.array(json.dumps(self.labels))}
+        if block_size:
+            arrays["block_size"] = np.array(block_size)
+            n = len(self.labels)
+            for bi in range(0, n, block_size):
+                for bj in range(0, n, block_size):
+                    arrays[f"block_{bi // block_size}_{bj // block_size}"] = \
+                        self.matrix[bi:bi + block_size, bj:bj + block_size]
+        else:
+            arrays["matrix"] = self.matrix
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        (np.savez_compressed if compressed else np.savez)(file_path, **arrays)
+
+    @classmethod
+    def load(cls, file_path):
+        archive = np.load(file_path)
+        labels = json.loads(str(archive["labels"]))
+        if "matrix" in archive.files:
+            return cls(labels, matrix=archive["matrix"])
+        return cls(labels, blocks=archive, block_size=int(archive["block_size"]))
+
+
+def floor_networks(svg_paths, cache=None):
+    """
+    Computes the midline network of each floor the way the a key does, with the floor's
+    saved elevators and stairs, ready for compute_distance_matrix.
+    """
+    floors = []
+    for svg_path in svg_paths:
+        name = os.path.splitext(os.path.basename(svg_path))[0]
+        (_, _, entrances, spaces, walls, _, _, _), _ = load_svg(svg_path)
+        elevators, stairs = read_settings_markers(name)
+        _, midlines = handle_all_midlines(spaces, entrances, elevators, stairs, cache, WallIndex(walls), verbose=False)
+        floors.append({"name": name, "spaces": spaces, "entrances": entrances, "midlines": midlines,
+                       "elevators": elevators, "stairs": stairs})
+    return floors
+
+def main():
+    parser = argparse.ArgumentParser(description="Room-to-room distance matrix")
+    parser.add_argument("files", nargs="+", help="SVG floors, in floor order")
+    parser.add_argument("-o", "--output", default="./output/distances.npz")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--block-size", type=int, default=DISTANCE_BLOCK_SIZE, help="0 stores the matrix whole")
+    args = parser.parse_args()
+
+    matrix = compute_distance_matrix(floor_networks(args.files), args.workers)
+    matrix.save(args.output, args.block_size or None)
+    reachable = np.isfinite(matrix.matrix)
+    print(f"{len(matrix.labels)} spaces, {reachable.mean() * 100:.0f}% of pairs connected, saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
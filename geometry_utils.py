@@ -1,6 +1,9 @@
 import numpy as np
 from shapely.geometry import Polygon, LineString, MultiLineString, Point, GeometryCollection
 import pygeoops
+from values import SNAP_TOLERANCE, MIDLINE_FAST_PATH, MIDLINE_DENSIFY_FACTOR
+from values import MIDLINE_DENSIFY_MIN, MIDLINE_DENSIFY_MAX, MIDLINE_DENSIFY_FALLBACK, MIDLINE_RIGHT_ANGLE_TOLERANCE
+from values import MIDLINE_SQUARE_TOLERANCE
 
 def shapely_to_pygame(shape):
     """
@@ -22,27 +25,138 @@ def shapely_to_pygame(shape):
         raise TypeError("Input must be a LineString, MultiLineString, or GeometryCollection")
 
 
-def find_midline_path(polygon):
+def find_midline_path(polygon, fast_path=MIDLINE_FAST_PATH):
     """
-    Finds the midline path of a polygon using pygeoops.centerline.
+    Finds the midline path of a polygon.
+    
+    Elongated rectangular rooms have a trivial medial axis and are solved analytically.
+    Every other polygon goes through pygeoops.centerline with a densify distance
+    chosen from its width.
     
     Parameters:
         polygon: A list of (x, y) tuples representing polygon vertices
+        fast_path: Solve rectangles analytically instead of with pygeoops
         
     Returns:
         A list of points representing the midline path
     """
+    if fast_path:
+        midline_points = rectangle_midline(polygon)
+        if midline_points is not None:
+            return midline_points
+
     # Convert the polygon to a shapely Polygon object
     shapely_polygon = Polygon(polygon)
     
     # Calculate the centerline using pygeoops
-    centerline = pygeoops.centerline(shapely_polygon, extend=False, densify_distance=5, simplifytolerance=0.5, min_branch_length=-1)
+    distance = densify_distance(shapely_polygon)
+    centerline = pygeoops.centerline(shapely_polygon, extend=False, densify_distance=distance,
+                                     simplifytolerance=0.5, min_branch_length=-1)
+    
+    # Voronoi output can collapse on symmetric shapes for some distances, retry with the fixed one
+    if centerline.length < distance and distance != MIDLINE_DENSIFY_FALLBACK:
+        centerline = pygeoops.centerline(shapely_polygon, extend=False, densify_distance=MIDLINE_DENSIFY_FALLBACK,
+                                         simplifytolerance=0.5, min_branch_length=-1)
     
     # Extract the coordinates of the centerline
     midline_points = shapely_to_pygame(centerline)
     
     return midline_points
 
+def densify_distance(shapely_polygon):
+    """
+    Chooses the pygeoops densify distance from the size of a polygon.
+    
+    Uses 2 * area / perimeter, which is the width of long thin shapes. Narrow
+    corridors keep the former fixed distance, MIDLINE_DENSIFY_MIN, and only wider
+    halls are densified more coarsely, up to MIDLINE_DENSIFY_MAX.
+    
+    Parameters:
+        shapely_polygon: A Shapely Polygon
+        
+    Returns:
+        Densify distance in model units
+    """
+    if shapely_polygon.length == 0:
+        return MIDLINE_DENSIFY_MIN
+    width = 2 * shapely_polygon.area / shapely_polygon.length
+    return min(max(width * MIDLINE_DENSIFY_FACTOR, MIDLINE_DENSIFY_MIN), MIDLINE_DENSIFY_MAX)
+
+def simplify_ring(polygon):
+    """
+    Removes repeated and collinear vertices from a polygon ring.
+    
+    Parameters:
+        polygon: A list of (x, y) tuples, optionally closed
+        
+    Returns:
+        List of the corner (x, y) tuples of the ring
+    """
+    points = []
+    for point in polygon:
+        if not points or point != points[-1]:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+
+    corners = []
+    n = len(points)
+    for i in range(n):
+        (x0, y0), (x1, y1), (x2, y2) = points[i - 1], points[i], points[(i + 1) % n]
+        cross = (x1 - x0) * (y2 - y1) - (y1 - y0) * (x2 - x1)
+        scale = ((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5 * ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+        if scale == 0 or abs(cross) > MIDLINE_RIGHT_ANGLE_TOLERANCE * scale:
+            corners.append(points[i])
+    return corners
+
+def rectangle_midline(polygon):
+    """
+    Computes the midline of a rectangle (of any rotation) analytically.
+    
+    The medial axis of a w x h rectangle with w >= h is the segment along its long
+    axis that stops h / 2 from each short side, which is what pygeoops returns.
+    For squares and near-squares that segment shrinks to (almost) a point, so they
+    are left to pygeoops like any other polygon.
+    
+    Parameters:
+        polygon: A list of (x, y) tuples representing polygon vertices
+        
+    Returns:
+        A list of two points, or None if the polygon is not an elongated rectangle
+    """
+    corners = simplify_ring(polygon)
+    if len(corners) != 4:
+        return None
+
+    edges = [(corners[(i + 1) % 4][0] - corners[i][0], corners[(i + 1) % 4][1] - corners[i][1]) for i in range(4)]
+    lengths = [(dx * dx + dy * dy) ** 0.5 for dx, dy in edges]
+    for i in range(4):
+        (ax, ay), (bx, by) = edges[i], edges[(i + 1) % 4]
+        if abs(ax * bx + ay * by) > MIDLINE_RIGHT_ANGLE_TOLERANCE * lengths[i] * lengths[(i + 1) % 4]:
+            return None
+
+    cx = sum(x for x, _ in corners) / 4
+    cy = sum(y for _, y in corners) / 4
+    long_index = 0 if lengths[0] >= lengths[1] else 1
+    if lengths[long_index] <= lengths[1 - long_index] * (1 + MIDLINE_SQUARE_TOLERANCE):
+        return None
+    half_trunk = (lengths[long_index] - lengths[1 - long_index]) / 2
+    ux, uy = edges[long_index][0] / lengths[long_index], edges[long_index][1] / lengths[long_index]
+    return [(cx - ux * half_trunk, cy - uy * half_trunk), (cx + ux * half_trunk, cy + uy * half_trunk)]
+
+def snap_point(point, tolerance=SNAP_TOLERANCE):
+    """
+    Snaps a point onto a grid so that near-identical points compare equal.
+    
+    Parameters:
+        point: An (x, y) tuple
+        tolerance: Grid spacing, points closer than this usually share a key
+        
+    Returns:
+        Integer (x, y) grid key
+    """
+    return (round(point[0] / tolerance), round(point[1] / tolerance))
+
 def transform_point(point, scale, offset):
     """
     Transforms a single point by scaling and offsetting.
@@ -73,6 +187,65 @@ def inverse_transform_point(point, scale, offset):
     x, y = point
     return ((x - offset[0]) / scale, (y - offset[1]) / scale)
 
+def shape_bounds(shape):
+    """
+    Calculates the bounding box of a shape.
+    
+    Parameters:
+        shape: List of (x, y) tuples
+        
+    Returns:
+        (min_x, min_y, max_x, max_y) tuple, or None for an empty shape
+    """
+    if not shape:
+        return None
+    xs = [p[0] for p in shape]
+    ys = [p[1] for p in shape]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def bounds_intersect(a, b):
+    """
+    Checks if two bounding boxes overlap.
+    
+    Parameters:
+        a: (min_x, min_y, max_x, max_y) tuple or None
+        b: (min_x, min_y, max_x, max_y) tuple or None
+        
+    Returns:
+        Boolean indicating if the boxes overlap
+    """
+    if a is None or b is None:
+        return False
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def transform_bounds(bounds, scale, offset):
+    """
+    Transforms a bounding box by scaling and offsetting.
+    
+    Parameters:
+        bounds: (min_x, min_y, max_x, max_y) tuple
+        scale: Scale factor
+        offset: (offset_x, offset_y) tuple
+        
+    Returns:
+        Transformed (min_x, min_y, max_x, max_y) tuple
+    """
+    return (*transform_point(bounds[:2], scale, offset), *transform_point(bounds[2:], scale, offset))
+
+def inverse_transform_bounds(bounds, scale, offset):
+    """
+    Inverse transforms a bounding box by scaling and offsetting.
+    
+    Parameters:
+        bounds: (min_x, min_y, max_x, max_y) tuple
+        scale: Scale factor
+        offset: (offset_x, offset_y) tuple
+        
+    Returns:
+        Original (min_x, min_y, max_x, max_y) tuple
+    """
+    return (*inverse_transform_point(bounds[:2], scale, offset), *inverse_transform_point(bounds[2:], scale, offset))
+
 def transform_shapes(shapes, scale, offset):
     """
     Transforms multiple shapes by scaling and offsetting.
@@ -0,0 +1,163 @@
+from collections import deque
+import numpy as np
+from values import HISTORY_LIMIT, HISTORY_ITEM_BUDGET
+
+def occurrence_keys(items, key):
+    # Number repeated keys so an item listed twice is matched twice
+    seen = {}
+    keys = []
+    for item in items:
+        k = key(item)
+        seen[k] = seen.get(k, -1) + 1
+        keys.append((k, seen[k]))
+    return keys
+
+def midline_key(item):
+    # A midline is unchanged when it is the same path object drawn in the same color
+    path, color = item
+    return (id(path), color)
+
+class SelectionChange:
+    """Spaces whose selection flipped; flipping the same indices again undoes it"""
+    __slots__ = ("indices",)
+
+    def __init__(self, indices):
+        self.indices = np.asarray(indices, dtype=np.int32)
+
+    @property
+    def size(self):
+        return len(self.indices)
+
+    def undo(self, window):
+        window.flip_spaces(self.indices)
+
+    def redo(self, window):
+        window.flip_spaces(self.indices)
+
+
+class ToggleChange:
+    """Markers whose selected flag flipped"""
+    __slots__ = ("markers",)
+
+    def __init__(self, markers):
+        self.markers = tuple(markers)
+
+    @property
+    def size(self):
+        return len(self.markers)
+
+    def undo(self, window):
+        for marker in self.markers:
+            marker.selected = not marker.selected
+        window.needs_redraw = True
+
+    def redo(self, window):
+        self.undo(window)
+
+
+class ListChange:
+    """
+    Items removed from and added to one of the window's lists (elevators, stairs or
+    midlines). Only the differing items are stored; items kept between the two versions
+    are shared with the live list and never copied.
+    """
+    __slots__ = ("name", "removed", "added")
+
+    def __init__(self, name, removed, added):
+        self.name = name
+        self.removed = removed  # (index in the old list, item) pairs, ascending
+        self.added = added  # (index in the new list, item) pairs, ascending
+
+    @classmethod
+    def between(cls, name, old, new, key=id):
+        """
+        Diffs two versions of a list, assuming kept items keep their relative order
+        (true for appends, deletes and replacements).
+
+        Parameters:
+            name: Name of the list, passed back to the window on undo and redo
+            old: List before the edit
+            new: List after the edit
+            key: Identity of an item, by default the object itself
+
+        Returns:
+            ListChange, or None when nothing changed
+        """
+        old_keys, new_keys = occurrence_keys(old, key), occurrence_keys(new, key)
+        new_set, old_set = set(new_keys), set(old_keys)
+        removed = [(i, item) for i, (item, k) in enumerate(zip(old, old_keys)) if k not in new_set]
+        added = [(i, item) for i, (item, k) in enumerate(zip(new, new_keys)) if k not in old_set]
+        if not removed and not added:
+            return None
+        return cls(name, removed, added)
+
+    @property
+    def size(self):
+        return len(self.removed) + len(self.added)
+
+    @staticmethod
+    def apply(items, removed, added):
+        # Take out the removed items by index, then put the added ones in at theirs
+        taken = {i for i, _ in removed}
+        result = [item for i, item in enumerate(items) if i not in taken]
+        for i, item in added:
+            result.insert(i, item)
+        return result
+
+    def undo(self, window):
+        window.restore_list(self.name, self.apply(window.history_list(self.name), self.added, self.removed))
+
+    def redo(self, window):
+        window.restore_list(self.name, self.apply(window.history_list(self.name), self.removed, self.added))
+
+
+class History:
+    """
+    Undo and redo stacks of edit steps, each step a tuple of compact changes.
+
+    Memory stays bounded: the oldest steps are dropped once there are more than limit
+    of them or they hold more than item_budget items in total.
+    """
+    def __init__(self, limit=HISTORY_LIMIT, item_budget=HISTORY_ITEM_BUDGET):
+        self.limit = limit
+        self.item_budget = item_budget
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.items = 0  # Items held by the undo stack
+        self.version = 0  # Bumped by every record, undo and redo, so savers can tell the state changed
+
+    def record(self, *changes):
+        """Adds one undoable step made of the given changes, ignoring empty ones"""
+        step = tuple(change for change in changes if change is not None and change.size)
+        if not step:
+            return
+        self.undo_steps.append(step)
+        self.items += sum(change.size for change in step)
+        self.redo_steps.clear()
+        self.version += 1
+        while self.undo_steps and (len(self.undo_steps) > self.limit or self.items > self.item_budget):
+            self.items -= sum(change.size for change in self.undo_steps.popleft())
+
+    def undo(self, window):
+        """Reverts the last step, returning False if there is nothing to undo"""
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        self.items -= sum(change.size for change in step)
+        for change in reversed(step):
+            change.undo(window)
+        self.redo_steps.append(step)
+        self.version += 1
+        return True
+
+    def redo(self, window):
+        """Reapplies the last undone step, returning False if there is nothing to redo"""
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        for change in step:
+            change.redo(window)
+        self.undo_steps.append(step)
+        self.items += sum(change.size for change in step)
+        self.version += 1
+        return True
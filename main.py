@@ -3,7 +3,7 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import pygame
 import threading
-from svg_parser import parse_svg
+from validation import load_svg
 from display import MapWindow
 from values import *
 
@@ -42,25 +42,33 @@ class MainApplication:
         # Check for output directory
         os.makedirs("./output", exist_ok=True)
         
-    def open_svg(self):
-        # If there's an existing window, close it first
-        if self.current_window and self.current_window.running:
-            self.current_window.close()
-            self.current_window = None
-
-        file_path = filedialog.askopenfilename(
+    def ask_svg_path(self):
+        """Ask the user for an SVG file, returning its path or an empty string"""
+        return filedialog.askopenfilename(
             initialdir="./",
             title="Select SVG file",
             filetypes=(("SVG files", "*.svg"), ("all files", "*.*"))
         )
         
+    def ask_annotation_path(self):
+        """Ask the user for a CSV/JSON marker import, returning its path or an empty string"""
+        return filedialog.askopenfilename(
+            initialdir="./",
+            title="Select marker import",
+            filetypes=(("Marker files", "*.csv *.json"), ("all files", "*.*"))
+        )
+        
+    def open_svg(self):
+        file_path = self.ask_svg_path()
+        
         if file_path:
             try:
                 # Get map name from file path
                 map_name = os.path.splitext(os.path.basename(file_path))[0]
                 
-                # Parse the SVG file
-                width, height, entrances, spaces, walls, paths, elevators, stairs = parse_svg(file_path)
+                # Parse the SVG file, repairing broken shapes
+                geometry, health = load_svg(file_path)
+                width, height, entrances, spaces, walls, paths, elevators, stairs = geometry
                 
                 # Create a new map window
                 self.current_window = MapWindow(
@@ -74,7 +82,10 @@ class MainApplication:
                     paths=paths,
                     circles=elevators,
                     squares=stairs,
-                    on_close=self.on_window_close
+                    on_close=self.on_window_close,
+                    on_open=self.ask_svg_path,
+                    on_import=self.ask_annotation_path,
+                    health=health
                 )
                 
             except Exception as e:
@@ -95,6 +106,7 @@ class MainApplication:
         - Generate centerline/midline paths
         - Connect doors to paths
         - Connect floors via elevators
+        - Edit several floors in one window
         - Export updated SVG files
         
         Released under GNU GPL v3
@@ -0,0 +1,148 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+from geometry_utils import snap_point
+from collision import route_connectors, nearest_vertices
+from values import CONNECTOR_DISTANCE, STITCH_DOOR_FRACTION, STITCH_ENDPOINT_DISTANCE
+
+class UnionFind:
+    """Disjoint sets over hashable keys, with path halving and union by size"""
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def add(self, key):
+        if key not in self.parent:
+            self.parent[key] = key
+            self.size[key] = 1
+
+    def find(self, key):
+        parent = self.parent
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(self, a, b):
+        # Returns False when a and b were already connected
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return False
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return True
+
+def midline_components(midline_paths):
+    """
+    Groups midline vertices into connected networks by their snapped coordinates.
+
+    Parameters:
+        midline_paths: List of polylines (each polyline is a list of points)
+
+    Returns:
+        UnionFind over snapped points
+    """
+    components = UnionFind()
+    for path in midline_paths:
+        keys = [snap_point(p) for p in path]
+        for key in keys:
+            components.add(key)
+        for key in keys[1:]:
+            components.union(keys[0], key)
+    return components
+
+def entrance_midpoint(entrance):
+    # Same door point handle_midline_path connects from
+    return ((entrance[0][0] + entrance[1][0]) / 2, (entrance[0][1] + entrance[1][1]) / 2)
+
+def door_tolerances(entrances, door_fraction=STITCH_DOOR_FRACTION):
+    """
+    How far each door midpoint may lie from a space and still open into it.
+
+    The reach is relative to the door's width, so it spans a wall as thick as
+    door_fraction of the door whatever units the floor was normalized from, and does
+    not reach across a corridor wider than that.
+
+    Parameters:
+        entrances: List of entrance polylines with at least two points
+        door_fraction: Reach as a fraction of the door's width
+
+    Returns:
+        Float numpy array, one tolerance per entrance
+    """
+    ends = np.array([(e[0], e[1]) for e in entrances], dtype=float).reshape(-1, 2, 2)
+    return np.hypot(*(ends[:, 1] - ends[:, 0]).T) * door_fraction
+
+def stitch_networks(midline_paths, spaces, entrances, space_midlines, connector_distance=CONNECTOR_DISTANCE,
+                    endpoint_distance=STITCH_ENDPOINT_DISTANCE, wall_index=None, door_fraction=STITCH_DOOR_FRACTION):
+    """
+    Joins the per-space midline networks into one walkable network.
+
+    handle_midline_path connects each door to the spaces within connector_distance of
+    it. A door drawn on one face of a thick wall is farther than that from the space on
+    the other face, so each space within the door's reach (see door_tolerances) that it
+    did not connect gets a connector from the door midpoint too, and the two spaces
+    meet at the door. Remaining networks whose connector endpoints lie within
+    endpoint_distance are then bridged by their closest endpoint pair. When a
+    wall_index is given, doorway connectors are rerouted around walls and any
+    connector or bridge that would still cross a wall is skipped.
+
+    Parameters:
+        midline_paths: List of midlines and connectors from handle_midline_path
+        spaces: List of space polygons
+        entrances: List of entrance polylines
+        space_midlines: Dictionary of space index to its midline path
+        connector_distance: Distance under which handle_midline_path already connected a door to a space
+        endpoint_distance: Distance under which loose connector endpoints are bridged
+        wall_index: WallIndex of the floor (default: walls are not checked)
+        door_fraction: Reach of a door as a fraction of its width
+
+    Returns:
+        (stitched_paths, added_count) tuple
+    """
+    stitched_paths = list(midline_paths)
+    added_count = 0
+
+    # Door and space pairs beyond the connectors' reach, found with one bulk spatial query
+    entrances = [e for e in entrances if len(e) >= 2]
+    indices = [i for i, midline in space_midlines.items() if midline and len(spaces[i]) >= 3]
+    if entrances and indices:
+        doors = shapely.points([entrance_midpoint(e) for e in entrances])
+        polygons = np.array([shapely.Polygon(spaces[i]) for i in indices])
+        door_indices, tree_indices = STRtree(polygons).query(doors, predicate="dwithin",
+                                                             distance=door_tolerances(entrances, door_fraction))
+        beyond = shapely.distance(doors[door_indices], polygons[tree_indices]) > connector_distance
+        pairs = sorted({(indices[i], d) for d, i in zip(door_indices[beyond].tolist(), tree_indices[beyond].tolist())})
+        starts = [entrance_midpoint(entrances[d]) for _, d in pairs]
+        ends = nearest_vertices(starts, [i for i, _ in pairs], space_midlines)
+        connector_paths, flagged = route_connectors([(start, space_midlines[i]) for start, (i, _) in zip(starts, pairs)],
+                                                    wall_index, ends)
+
+        # Unlike the connectors of a space's own doors, these are optional, so drop blocked ones
+        flagged = set(flagged)
+        connector_paths = [path for i, path in enumerate(connector_paths) if i not in flagged]
+        stitched_paths.extend(connector_paths)
+        added_count += len(connector_paths)
+
+    # Bridge networks whose loose ends nearly touch, closest pairs first
+    components = midline_components(stitched_paths)
+    endpoints = list({tuple(p) for path in stitched_paths if path for p in (path[0], path[-1])})
+    if len(endpoints) > 1:
+        endpoint_tree = STRtree(shapely.points(endpoints))
+        left, right = endpoint_tree.query(shapely.points(endpoints), predicate="dwithin", distance=endpoint_distance)
+        keep = left < right
+        left, right = left[keep], right[keep]
+        coords = np.asarray(endpoints)
+        lengths = np.hypot(*(coords[left] - coords[right]).T)
+        blocked = np.zeros(len(left), dtype=bool)
+        if wall_index is not None:
+            blocked = wall_index.crossing_mask([[endpoints[a], endpoints[b]] for a, b in zip(left, right)])
+        for i in np.argsort(lengths, kind="stable").tolist():
+            a, b = endpoints[left[i]], endpoints[right[i]]
+            if not blocked[i] and components.union(snap_point(a), snap_point(b)):
+                stitched_paths.append([a, b])
+                added_count += 1
+
+    return stitched_paths, added_count
@@ -0,0 +1,144 @@
+import shapely
+from shapely.geometry import MultiLineString
+from values import PATH_SIMPLIFY_TOLERANCE, JUNCTION_SNAP_TOLERANCE
+
+def snap_vertices(midline_paths, tolerance=JUNCTION_SNAP_TOLERANCE):
+    """
+    Snaps vertices closer than tolerance onto a single representative point.
+
+    Parameters:
+        midline_paths: List of polylines (each polyline is a list of points)
+        tolerance: Distance under which two vertices are the same junction
+
+    Returns:
+        (snapped_paths, snapped_count) tuple
+    """
+    cells = {}  # Grid cell to representative points in it
+    snapped_count = 0
+
+    def representative(point):
+        nonlocal snapped_count
+        cx, cy = int(point[0] // tolerance), int(point[1] // tolerance)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other in cells.get((cx + dx, cy + dy), ()):
+                    if (other[0] - point[0]) ** 2 + (other[1] - point[1]) ** 2 <= tolerance * tolerance:
+                        if other != point:
+                            snapped_count += 1
+                        return other
+        cells.setdefault((cx, cy), []).append(point)
+        return point
+
+    snapped_paths = [[representative(tuple(p)) for p in path] for path in midline_paths]
+    return snapped_paths, snapped_count
+
+def build_graph(midline_paths):
+    """
+    Builds an undirected adjacency map from polylines, dropping repeated edges and self loops.
+
+    Parameters:
+        midline_paths: List of polylines with snapped vertices
+
+    Returns:
+        Dictionary mapping each point to the set of its neighbouring points
+    """
+    graph = {}
+    for path in midline_paths:
+        for a, b in zip(path, path[1:]):
+            if a == b:
+                continue
+            graph.setdefault(a, set()).add(b)
+            graph.setdefault(b, set()).add(a)
+    return graph
+
+def collapse_chains(graph):
+    """
+    Collapses every run of degree-2 vertices into a single polyline between junctions or ends.
+
+    Parameters:
+        graph: Adjacency map from build_graph
+
+    Returns:
+        List of polylines, one per edge of the collapsed graph
+    """
+    chains = []
+    visited = set()  # Edges already part of a chain, as frozensets of their endpoints
+
+    def walk(start, neighbour):
+        chain = [start, neighbour]
+        visited.add(frozenset((start, neighbour)))
+        previous, current = start, neighbour
+        while len(graph[current]) == 2 and current != start:
+            following = next(p for p in graph[current] if p != previous)
+            edge = frozenset((current, following))
+            if edge in visited:
+                break
+            visited.add(edge)
+            chain.append(following)
+            previous, current = current, following
+        return chain
+
+    # Chains start at junctions and dead ends
+    for node, neighbours in graph.items():
+        if len(neighbours) != 2:
+            for neighbour in neighbours:
+                if frozenset((node, neighbour)) not in visited:
+                    chains.append(walk(node, neighbour))
+
+    # Whatever is left are closed loops made only of degree-2 vertices
+    for node, neighbours in graph.items():
+        for neighbour in neighbours:
+            if frozenset((node, neighbour)) not in visited:
+                chains.append(walk(node, neighbour))
+
+    return chains
+
+def count_edges(midline_paths):
+    # Number of segments across all polylines
+    return sum(max(len(path) - 1, 0) for path in midline_paths)
+
+def optimize_midlines(midline_paths, tolerance=PATH_SIMPLIFY_TOLERANCE, snap_tolerance=JUNCTION_SNAP_TOLERANCE):
+    """
+    Shrinks a midline network: snaps near-duplicate junctions, collapses degree-2 chains
+    into single polylines and simplifies them without changing the network topology.
+
+    Parameters:
+        midline_paths: List of polylines (each polyline is a list of points)
+        tolerance: Maximum distance a simplified chain may move from the original
+        snap_tolerance: Distance under which vertices are merged into one junction
+
+    Returns:
+        (optimized_paths, report) tuple, report holds vertex/edge counts before and after
+    """
+    midline_paths = [path for path in midline_paths if path]
+    snapped_paths, snapped_count = snap_vertices(midline_paths, snap_tolerance)
+    chains = collapse_chains(build_graph(snapped_paths))
+
+    # Simplify all chains together so no chain is moved across another. Chain ends are
+    # never moved, which keeps junctions and door connector endpoints in place.
+    optimized_paths = []
+    if chains:
+        simplified = shapely.simplify(MultiLineString(chains), tolerance, preserve_topology=True)
+        optimized_paths = [list(line.coords) for line in getattr(simplified, "geoms", [simplified])]
+
+    report = {
+        "vertices_before": sum(len(path) for path in midline_paths),
+        "vertices_after": sum(len(path) for path in optimized_paths),
+        "edges_before": count_edges(midline_paths),
+        "edges_after": count_edges(optimized_paths),
+        "polylines_before": len(midline_paths),
+        "polylines_after": len(optimized_paths),
+        "junctions_snapped": snapped_count,
+    }
+    return optimized_paths, report
+
+def format_report(report):
+    """
+    Formats an optimize_midlines report as a single line.
+    """
+    def reduction(before, after):
+        return f"{before} -> {after} ({(1 - after / before) * 100 if before else 0:.0f}% fewer)"
+    return (f"vertices {reduction(report['vertices_before'], report['vertices_after'])}, "
+            f"edges {reduction(report['edges_before'], report['edges_after'])}, "
+            f"polylines {reduction(report['polylines_before'], report['polylines_after'])}, "
+            f"{report['junctions_snapped']} junction points snapped")
@@ -0,0 +1,140 @@
+import time
+import numpy as np
+import shapely
+from shapely import STRtree
+from geometry_utils import find_midline_path, snap_point, polygon_area
+from path_optimization import optimize_midlines
+from network import stitch_networks, midline_components, entrance_midpoint
+from collision import WallIndex, route_connectors, nearest_vertices
+from values import WALL_CROSSING_COLOR, CONNECTOR_DISTANCE
+
+def space_midline_path(polygon, cache=None):
+    """
+    Calculates the midline of one space, through cache (a CenterlineCache) when one is given.
+    Spaces left degenerate by the load-time repair have no midline.
+    """
+    if len(polygon) < 3 or polygon_area(polygon) == 0:
+        return []
+    if cache is not None:
+        return cache.midline_path(polygon)
+    return find_midline_path(polygon=polygon)
+
+def match_connectors(points, spaces, space_midlines, tolerance=CONNECTOR_DISTANCE):
+    """
+    Matches connector start points (doors, elevators, stairs) to every space they lie in
+    or within tolerance of, and to the nearest vertex of that space's midline, in one
+    spatial query for the whole floor.
+
+    Parameters:
+        points: List of (x, y) start points
+        spaces: List of space polygons
+        space_midlines: Dictionary of space index to its midline path; spaces without a
+                        midline get no connectors
+        tolerance: Distance from a space's outline at which a point still belongs to it
+
+    Returns:
+        List of (start_point, midline_path, end_point) tuples, ordered by space and then
+        by point
+    """
+    indices = [i for i, midline in space_midlines.items() if midline]
+    if not points or not indices:
+        return []
+    tree = STRtree([shapely.Polygon(spaces[i]) for i in indices])
+    point_indices, tree_indices = tree.query(shapely.points(points), predicate="dwithin", distance=tolerance)
+    space_indices = np.asarray(indices)[tree_indices]
+    order = np.lexsort((point_indices, space_indices))
+    point_indices, space_indices = point_indices[order].tolist(), space_indices[order].tolist()
+    starts = [points[i] for i in point_indices]
+    ends = nearest_vertices(starts, space_indices, space_midlines)
+    return [(start, space_midlines[i], end) for start, i, end in zip(starts, space_indices, ends)]
+
+def handle_midline_path(selected_spaces, spaces, entrances, walls, elevators, stairs, cache=None, space_midlines=None,
+                        wall_index=None, verbose=True):
+    """
+    Calculates midline paths for selected spaces and connects entrances to these paths.
+    Midlines already computed can be passed in space_midlines, keyed by space index; the
+    ones computed here are added to it.
+    Connectors are made in one batch once every midline is done, checked against the walls
+    (or a prebuilt wall_index) and rerouted around them. Without verbose nothing is printed.
+    """
+    if wall_index is None and walls:
+        wall_index = WallIndex(walls)
+    if space_midlines is None:
+        space_midlines = {}
+    start = time.perf_counter()
+    midline_paths = []
+    selected_midlines = {}
+    for i, selected in enumerate(selected_spaces):
+        if selected:
+            if verbose:
+                print("Selected space:", i + 1)
+            if i not in space_midlines:
+                space_midlines[i] = space_midline_path(spaces[i], cache)
+            midline_path = selected_midlines[i] = space_midlines[i]
+            if isinstance(midline_path, list) and all(isinstance(item, list) for item in midline_path):
+                midline_paths.extend(midline_path)
+            else:
+                midline_paths.append(midline_path)
+    midline_time = time.perf_counter() - start
+
+    # Paths from doors, elevators and stairs to the nearest point on the midline of each space they touch
+    start = time.perf_counter()
+    points = [entrance_midpoint(e) for e in entrances] + [m.position for m in (*(elevators or ()), *(stairs or ()))]
+    matches = match_connectors(points, spaces, selected_midlines)
+    connector_paths, flagged = route_connectors([(p, midline) for p, midline, _ in matches], wall_index,
+                                                [end for _, _, end in matches])
+    if flagged and verbose:
+        print(f"{len(flagged)} connectors cross a wall and could not be rerouted")
+    midline_paths.extend(connector_paths)
+    if verbose:
+        print(f"Midlines for {len(selected_midlines)} spaces in {midline_time:.2f}s, "
+              f"{len(connector_paths)} connectors in {time.perf_counter() - start:.2f}s")
+    return midline_paths
+
+def handle_all_midlines(spaces, entrances, elevators=None, stairs=None, cache=None, wall_index=None, verbose=True):
+    """
+    Calculates midline paths for all spaces and stitches them into one network.
+    Without verbose nothing is printed.
+    """
+    space_midlines = {}
+    midline_paths = handle_midline_path([True] * len(spaces), spaces, entrances, [], elevators, stairs,
+                                        cache, space_midlines, wall_index, verbose)
+    midline_paths, added_count = stitch_networks(midline_paths, spaces, entrances, space_midlines,
+                                                 wall_index=wall_index)
+    if verbose:
+        print(f"Stitched networks with {added_count} connectors")
+    return mark_wall_crossings(connectivity_colors(midline_paths), midline_paths, wall_index), midline_paths
+
+def mark_wall_crossings(color_array, midline_paths, wall_index):
+    """
+    Recolors midlines and connectors that still pass through a wall.
+    """
+    if wall_index is not None:
+        for i in np.flatnonzero(wall_index.crossing_mask(midline_paths)).tolist():
+            color_array[i] = WALL_CROSSING_COLOR
+    return color_array
+
+def connectivity_colors(midline_paths):
+    """
+    Colors midlines green when they belong to the largest connected network and red otherwise.
+    """
+    # Midlines sharing a coordinate (snapped to the tolerance grid) are one network
+    components = midline_components(midline_paths)
+    roots = [components.find(snap_point(midline[0])) if midline else None for midline in midline_paths]
+
+    # Find the largest network
+    largest_root = max((root for root in roots if root is not None), key=lambda root: components.size[root],
+                       default=None)
+
+    color_array = []
+    for root in roots:
+        color_array.append((0, 255, 0) if root is not None and root == largest_root else (255, 0, 0))
+
+    return color_array
+
+def handle_optimize_midlines(midline_paths):
+    """
+    Simplifies the midline network and recomputes its connectivity colors.
+    """
+    optimized_paths, report = optimize_midlines(midline_paths)
+    return connectivity_colors(optimized_paths), optimized_paths, report
\ No newline at end of file
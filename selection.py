@@ -0,0 +1,197 @@
+import base64
+import numpy as np
+import shapely
+from shapely import STRtree
+from geometry_utils import is_point_inside_polygon, polygon_area
+from values import HIT_MAP_CELL, HIT_MAP_TILE
+
+class SpaceIndex:
+    """Space polygons in an STRtree, built once per floor for picking and bulk selection"""
+    def __init__(self, spaces):
+        self.spaces = spaces
+        self.polygons = np.array([shapely.Polygon(s) if len(s) >= 3 else shapely.MultiPoint(s) for s in spaces],
+                                 dtype=object)
+        self.areas = np.array([polygon_area(s) for s in spaces], dtype=float)
+        self.tree = STRtree(self.polygons)
+
+    def innermost(self, point):
+        """
+        Finds the smallest space containing a point, like find_innermost_polygon but only
+        testing the spaces whose bounding box holds the point.
+
+        Parameters:
+            point: (x, y) in model coordinates
+
+        Returns:
+            Index of the space, or None if no space contains the point
+        """
+        candidates = self.tree.query(shapely.Point(point))
+        hits = [i for i in candidates.tolist() if is_point_inside_polygon(point, self.spaces[i])]
+        if not hits:
+            return None
+        return min(hits, key=lambda i: (self.areas[i], i))
+
+    def in_region(self, region, contained=True):
+        """
+        Finds the spaces inside or touching a region in one bulk query.
+
+        Parameters:
+            region: Shapely geometry in model coordinates (a box or a lasso polygon)
+            contained: True for spaces entirely inside the region, False for any overlap
+
+        Returns:
+            Sorted numpy array of space indices
+        """
+        if region.is_empty or not len(self.polygons):
+            return np.empty(0, dtype=int)
+        if not region.is_valid:
+            region = shapely.make_valid(region)  # A lasso that crosses itself
+        return np.sort(self.tree.query(region, predicate="contains" if contained else "intersects"))
+
+class HitMap:
+    """
+    Space ids rasterized into square model-space tiles, so hover and click are one array
+    lookup at any zoom. Each tile is built the first time a point in it is looked up:
+    spaces are painted largest first so the innermost space wins, and cells an outline
+    passes through are marked so their lookups fall back to the exact SpaceIndex test.
+    Tiles only depend on the geometry, so panning and zooming never rebuild them.
+    """
+    EMPTY = -1  # No space at this cell
+    EDGE = -2  # An outline crosses this cell
+
+    def __init__(self, space_index, cell_size=HIT_MAP_CELL, tile_cells=HIT_MAP_TILE):
+        self.space_index = space_index
+        self.cell_size = cell_size
+        self.tile_cells = tile_cells
+        self.tile_size = cell_size * tile_cells
+        self.tiles = {}  # (column, row) of a tile to its int32 label array
+
+    def tile(self, key):
+        labels = self.tiles.get(key)
+        if labels is None:
+            labels = self.tiles[key] = self.build_tile(key)
+        return labels
+
+    def build_tile(self, key):
+        x0, y0 = key[0] * self.tile_size, key[1] * self.tile_size
+        labels = np.full((self.tile_cells, self.tile_cells), self.EMPTY, dtype=np.int32)
+        index = self.space_index
+        candidates = index.tree.query(shapely.box(x0, y0, x0 + self.tile_size, y0 + self.tile_size))
+        if not len(candidates):
+            return labels
+
+        centers = (np.arange(self.tile_cells) + 0.5) * self.cell_size
+        xs, ys = np.meshgrid(x0 + centers, y0 + centers)
+        for i in sorted(candidates.tolist(), key=lambda i: (-index.areas[i], -i)):
+            polygon = index.polygons[i]
+            if not isinstance(polygon, shapely.Polygon):
+                continue  # Degenerate space, never hit
+            # Fill the cells under the polygon's bounding box whose centers it contains
+            bounds = (np.array(polygon.bounds) - (x0, y0, x0, y0)) / self.cell_size
+            c0, r0 = np.clip(np.floor(bounds[:2]).astype(int), 0, self.tile_cells)
+            c1, r1 = np.clip(np.ceil(bounds[2:]).astype(int) + 1, 0, self.tile_cells)
+            window = labels[r0:r1, c0:c1]
+            window[shapely.contains_xy(polygon, xs[r0:r1, c0:c1], ys[r0:r1, c0:c1])] = i
+            self.mark_edges(labels, shapely.get_coordinates(polygon.exterior), x0, y0)
+        return labels
+
+    def mark_edges(self, labels, ring, x0, y0):
+        # Sample every edge at half-cell steps and mark the cells around each sample, which
+        # covers every cell the outline passes through, corners included. Edges are first
+        # clipped to the tile grown by one cell, so long outlines cost only their part here.
+        starts, deltas = ring[:-1], ring[1:] - ring[:-1]
+        low = np.array((x0, y0)) - self.cell_size
+        high = low + self.tile_size + 2 * self.cell_size
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_low, t_high = (low - starts) / deltas, (high - starts) / deltas
+        parallel = deltas == 0  # Inside the slab for every t, or for none
+        outside = parallel & ((starts < low) | (starts > high))
+        t_low = np.where(parallel, np.where(outside, np.inf, -np.inf), t_low)
+        t_high = np.where(parallel, np.where(outside, -np.inf, np.inf), t_high)
+        t0 = np.maximum(np.minimum(t_low, t_high).max(axis=1), 0)
+        t1 = np.minimum(np.maximum(t_low, t_high).min(axis=1), 1)
+        crossing = t1 >= t0
+        if not crossing.any():
+            return
+        a = starts[crossing] + deltas[crossing] * t0[crossing, None]
+        d = deltas[crossing] * (t1 - t0)[crossing, None]
+
+        counts = np.ceil(np.hypot(*d.T) / (self.cell_size / 2)).astype(int) + 1
+        segment = np.repeat(np.arange(len(counts)), counts)
+        t = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(
+            np.maximum(counts - 1, 1), counts)
+        cells = np.floor((a[segment] + d[segment] * t[:, None] - (x0, y0)) / self.cell_size).astype(int)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                shifted = cells + (dx, dy)
+                shifted = shifted[((shifted >= 0) & (shifted < self.tile_cells)).all(axis=1)]
+                labels[shifted[:, 1], shifted[:, 0]] = self.EDGE
+
+    def innermost(self, point):
+        """
+        Finds the smallest space containing a point, with the same result as
+        SpaceIndex.innermost.
+
+        Parameters:
+            point: (x, y) in model coordinates
+
+        Returns:
+            Index of the space, or None if no space contains the point
+        """
+        column, row = int(point[0] // self.tile_size), int(point[1] // self.tile_size)
+        labels = self.tile((column, row))
+        cell_x = min(int((point[0] - column * self.tile_size) // self.cell_size), self.tile_cells - 1)
+        cell_y = min(int((point[1] - row * self.tile_size) // self.cell_size), self.tile_cells - 1)
+        label = labels[cell_y, cell_x]
+        if label == self.EDGE:
+            return self.space_index.innermost(point)
+        return None if label == self.EMPTY else int(label)
+
+    def invalidate(self, bounds=None):
+        """
+        Drops the tiles covering bounds, or every tile, after the geometry there changed.
+
+        Parameters:
+            bounds: (min_x, min_y, max_x, max_y) in model coordinates, or None for all
+        """
+        if bounds is None:
+            self.tiles.clear()
+            return
+        for column in range(int(bounds[0] // self.tile_size), int(bounds[2] // self.tile_size) + 1):
+            for row in range(int(bounds[1] // self.tile_size), int(bounds[3] // self.tile_size) + 1):
+                self.tiles.pop((column, row), None)
+
+def lasso_polygon(points):
+    """Closes a freehand lasso into a polygon, or returns an empty geometry if it encloses nothing"""
+    if len(points) < 3:
+        return shapely.Polygon()
+    return shapely.Polygon(points)
+
+def pack_selection(selected):
+    """
+    Encodes a selection mask as a bitset for the settings file.
+
+    Parameters:
+        selected: Boolean sequence, one entry per shape
+
+    Returns:
+        Dictionary with the shape count and the base64 encoded packed bits
+    """
+    selected = np.asarray(selected, dtype=bool)
+    return {"count": int(len(selected)), "bits": base64.b64encode(np.packbits(selected).tobytes()).decode("ascii")}
+
+def unpack_selection(data, count):
+    """
+    Decodes a bitset written by pack_selection.
+
+    Parameters:
+        data: Dictionary from pack_selection
+        count: Number of shapes on the floor now
+
+    Returns:
+        Boolean numpy array, or None if the saved selection was made for a different shape count
+    """
+    if data.get("count") != count:
+        return None
+    bits = np.frombuffer(base64.b64decode(data["bits"]), dtype=np.uint8)
+    return np.unpackbits(bits, count=count).astype(bool)
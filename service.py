@@ -0,0 +1,295 @@
+"""
+Local navigation service: parse_svg, the midline pipeline and export behind an asyncio API.
+
+Requests and responses are single JSON lines over a localhost TCP socket, so the
+navigation app (or the ServiceClient below) needs nothing but Python.
+
+Usage:
+    python service.py serve [--port PORT]
+    python service.py floor floors/level1.svg
+    python service.py midlines floors/level1.svg [--spaces 0 4 7]
+    python service.py export floors/level1.svg output/level1.svg [--spaces 0 4 7]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+from collections import OrderedDict
+from annotations import read_settings_markers
+from autosave import settings_path, journal_path
+from collision import WallIndex
+from pipeline import handle_midline_path, handle_all_midlines, connectivity_colors, mark_wall_crossings
+from svg_parser import export_svg
+from validation import summarize
+from workspace import Workspace
+from values import SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_PENDING, SERVICE_RESULT_CACHE_SIZE
+
+def floor_stamp(floor):
+    # Modification times of the SVG and the settings its markers come from
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None
+                 for path in (floor.file_path, settings_path(floor.map_name), journal_path(floor.map_name)))
+
+class ServiceBusy(Exception):
+    """Raised when a request would start more work than the service accepts at once"""
+
+
+class PatherService:
+    """
+    Runs floor requests on the workspace's bounded worker pool.
+
+    Identical requests for the same floor share one computation while it is in flight,
+    and finished midline networks are kept until the floor or its settings change. Space
+    midlines come from the workspace's centerline cache, and new work is refused with
+    ServiceBusy once max_pending computations are queued or running.
+    """
+    def __init__(self, workspace=None, max_pending=SERVICE_MAX_PENDING, max_results=SERVICE_RESULT_CACHE_SIZE):
+        self.workspace = workspace if workspace is not None else Workspace()
+        self.max_pending = max_pending
+        self.max_results = max_results
+        self.pending = 0  # Computations queued or running on the pool
+        self.in_flight = {}  # Request key to the future all its callers await
+        self.results = OrderedDict()  # Request key to a finished midline network, least recently used first
+        self.operations = {
+            "floor": self.floor_summary,
+            "midlines": self.midlines,
+            "export": self.export,
+            "stats": self.stats,
+        }
+
+    async def request(self, operation, **params):
+        """
+        Runs one request.
+
+        Parameters:
+            operation: "floor", "midlines", "export" or "stats"
+            params: Arguments of the operation
+
+        Returns:
+            JSON-serializable result
+        """
+        if operation not in self.operations:
+            raise ValueError(f"Unknown operation '{operation}'")
+        return await self.operations[operation](**params)
+
+    async def shared(self, key, function, *args, keep=False):
+        """
+        Awaits the in-flight computation for key, or starts function(*args) on the pool for it.
+        With keep, the result is also remembered for later requests with the same key.
+        """
+        if key in self.results:
+            self.results.move_to_end(key)
+            return self.results[key]
+        future = self.in_flight.get(key)
+        if future is None:
+            if self.pending >= self.max_pending:
+                raise ServiceBusy(f"{self.pending} jobs pending, try again later")
+            self.pending += 1
+            future = asyncio.get_running_loop().run_in_executor(self.workspace.executor, function, *args)
+            self.in_flight[key] = future
+
+            def finished(done):
+                self.pending -= 1
+                self.in_flight.pop(key, None)
+                if keep and not done.cancelled() and done.exception() is None:
+                    self.results[key] = done.result()
+                    while len(self.results) > self.max_results:
+                        self.results.popitem(last=False)
+            future.add_done_callback(finished)
+        return await asyncio.shield(future)
+
+    async def load(self, file_path):
+        """Parsed floor geometry, parsing each file at most once at a time"""
+        floor = self.workspace.add_floor(file_path)
+        geometry = floor.geometry
+        if geometry is None:
+            geometry = await self.shared(("floor", os.path.abspath(floor.file_path)), self.workspace.load, floor)
+        self.workspace.evict(floor)
+        return floor, geometry
+
+    async def floor_summary(self, file):
+        floor, geometry = await self.load(file)
+        width, height, entrances, spaces, walls, paths, circles, squares = geometry
+        return {"map_name": floor.map_name, "width": width, "height": height, "spaces": len(spaces),
+                "entrances": len(entrances), "walls": len(walls), "elevator_shapes": len(circles),
+                "stairs_shapes": len(squares), "repairs": summarize(floor.health or [])}
+
+    def compute_midlines(self, floor, geometry, spaces=None):
+        # Same pipeline as the a and m keys, with the floor's saved elevators and stairs
+        _, _, entrances, all_spaces, walls, _, _, _ = geometry
+        elevators, stairs = read_settings_markers(floor.map_name)
+        cache = self.workspace.centerline_cache
+        wall_index = floor.wall_index if floor.geometry is geometry else WallIndex(walls)  # Evicted meanwhile
+        if spaces is None:
+            colors, paths = handle_all_midlines(all_spaces, entrances, elevators, stairs, cache, wall_index,
+                                                verbose=False)
+        else:
+            selected = [False] * len(all_spaces)
+            for i in spaces:
+                selected[i] = True
+            paths = handle_midline_path(selected, all_spaces, entrances, walls, elevators, stairs, cache, None,
+                                        wall_index, verbose=False)
+            colors = mark_wall_crossings(connectivity_colors(paths), paths, wall_index)
+        return paths, colors
+
+    async def floor_midlines(self, file, spaces=None):
+        floor, geometry = await self.load(file)
+        if spaces is not None:
+            spaces = tuple(sorted(set(int(i) for i in spaces)))
+            if any(not 0 <= i < len(geometry[3]) for i in spaces):
+                raise ValueError(f"Space indices must be between 0 and {len(geometry[3]) - 1}")
+        key = ("midlines", os.path.abspath(floor.file_path), spaces, floor_stamp(floor))
+        return floor, geometry, key, await self.shared(key, self.compute_midlines, floor, geometry, spaces, keep=True)
+
+    async def midlines(self, file, spaces=None):
+        _, _, _, (paths, colors) = await self.floor_midlines(file, spaces)
+        return {"paths": [[list(p) for p in path] for path in paths], "colors": [list(c) for c in colors]}
+
+    async def export(self, file, output, spaces=None, debug=False):
+        floor, geometry, midlines_key, (paths, colors) = await self.floor_midlines(file, spaces)
+        _, _, entrances, all_spaces, walls, _, _, _ = geometry
+        elevators, stairs = read_settings_markers(floor.map_name)
+        # Only identical requests share a write; the midlines key holds the floor, selection and stamp
+        key = ("export", os.path.abspath(output), midlines_key, bool(debug))
+        await self.shared(key, export_svg, output, entrances, all_spaces, walls, paths, debug, colors, elevators, stairs)
+        return {"output": output, "midlines": len(paths)}
+
+    async def stats(self):
+        cache = self.workspace.centerline_cache
+        return {"pending": self.pending, "in_flight": len(self.in_flight), "results": len(self.results),
+                "cache_hits": cache.hits,
+                "cache_misses": cache.misses, "floors": [f.map_name for f in self.workspace.floors]}
+
+    async def handle_connection(self, reader, writer):
+        """Answers every JSON line on a connection, concurrently, tagging responses with the request id"""
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def answer(message):
+            request_id = message.get("id")
+            try:
+                result = await self.request(message.pop("op"), **message.get("params", {}))
+                response = {"id": request_id, "ok": True, "result": result}
+            except ServiceBusy as e:
+                response = {"id": request_id, "ok": False, "busy": True, "error": str(e)}
+            except Exception as e:
+                response = {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+            async with lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    message = {"op": "invalid"}
+                if not isinstance(message, dict):
+                    message = {"op": "invalid"}
+                task = asyncio.create_task(answer(message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=2 ** 20)
+        print(f"Pather service listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+class ServiceClient:
+    """Client for a running PatherService; several requests can be awaited at once"""
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        self.host = host
+        self.port = port
+        self.ids = itertools.count(1)
+        self.waiting = {}  # Request id to the future of its response
+        self.reader = None
+        self.writer = None
+        self.listener = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=2 ** 26)
+        self.listener = asyncio.create_task(self.listen())
+        return self
+
+    async def listen(self):
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            future = self.waiting.pop(response["id"], None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError("Service closed the connection"))
+
+    async def request(self, operation, **params):
+        """
+        Sends one request and waits for its result.
+
+        Raises ServiceBusy when the service refused the work and RuntimeError when it failed.
+        """
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        self.writer.write((json.dumps({"id": request_id, "op": operation, "params": params}) + "\n").encode())
+        await self.writer.drain()
+        response = await future
+        if response["ok"]:
+            return response["result"]
+        if response.get("busy"):
+            raise ServiceBusy(response["error"])
+        raise RuntimeError(response["error"])
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.listener.cancel()
+
+
+async def run_client(args):
+    client = await ServiceClient(args.host, args.port).connect()
+    try:
+        if args.command == "floor":
+            result = await client.request("floor", file=os.path.abspath(args.file))
+        elif args.command == "midlines":
+            result = await client.request("midlines", file=os.path.abspath(args.file), spaces=args.spaces)
+            result = {"midlines": len(result["paths"]), "vertices": sum(len(p) for p in result["paths"])}
+        else:
+            result = await client.request("export", file=os.path.abspath(args.file), output=os.path.abspath(args.output),
+                                          spaces=args.spaces)
+        print(json.dumps(result, indent=2))
+    finally:
+        await client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Pather navigation service")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="Run the service")
+    commands.add_parser("floor", help="Summarize a floor").add_argument("file")
+    midlines = commands.add_parser("midlines", help="Compute a floor's midline network")
+    midlines.add_argument("file")
+    midlines.add_argument("--spaces", type=int, nargs="+", help="Space indices (default: all, stitched)")
+    export = commands.add_parser("export", help="Export a floor with its midline network")
+    export.add_argument("file")
+    export.add_argument("output")
+    export.add_argument("--spaces", type=int, nargs="+", help="Space indices (default: all, stitched)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = PatherService()
+        try:
+            asyncio.run(service.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.workspace.shutdown()
+    else:
+        asyncio.run(run_client(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,28 @@
+import re
+import uuid
 import xml.etree.ElementTree as ET
+import numpy as np
 from values import *
 import itertools
 
-def parse_svg(file_path, screen_width=800, screen_height=600):
+SVG_NAMESPACE = "{http://www.w3.org/2000/svg}"
+GROUP_TAG = SVG_NAMESPACE + "g"
+PATH_TAG = SVG_NAMESPACE + "path"
+PATH_COMMAND = re.compile(r'[MLHVCSQTAZmlhvcsqtaz][^MLHVCSQTAZmlhvcsqtaz]*')
+PATH_NUMBER = re.compile(r'-?\d+\.?\d*')
+
+# Layer of a shape by the id of the nearest layer group around it and its tag; paths are read from anywhere
+LAYER_GROUPS = ("entrances", "spaces", "walls", "shapes")
+LAYER_TARGETS = {
+    ("entrances", SVG_NAMESPACE + "polyline"): "entrances",
+    ("spaces", SVG_NAMESPACE + "polygon"): "spaces",
+    ("walls", SVG_NAMESPACE + "polyline"): "walls",
+    ("shapes", SVG_NAMESPACE + "polygon"): "elevators",
+    ("shapes", SVG_NAMESPACE + "polyline"): "stairs",
+}
+LAYERS = ("entrances", "spaces", "walls", "paths", "elevators", "stairs")
+
+def parse_svg(file_path, screen_width=800, screen_height=600, precise=PRECISE_COORDINATES):
     """
     Extracts polylines under 'entrances' and 'walls', polygons under 'spaces', paths, and elevators.
     
@@ -10,71 +30,103 @@ def parse_svg(file_path, screen_width=800, screen_height=600):
         file_path: Path to the SVG file
         screen_width: Width of the display window
         screen_height: Height of the display window
+        precise: Keep normalized coordinates as floats instead of truncating them to ints
         
     Returns:
         Tuple containing (screen_width, screen_height, entrances, spaces, walls, paths, elevators)
     """
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    namespace = {'svg': 'http://www.w3.org/2000/svg'}
+    root_attributes, layers = extract_layers(file_path)
 
     # Default SVG dimensions
-    svg_width = int(root.get('width', screen_width))
-    svg_height = int(root.get('height', screen_height))
-
-    entrances = extract_shapes(root, namespace, "entrances", "polyline")
-    spaces = extract_shapes(root, namespace, "spaces", "polygon")
-    walls = extract_shapes(root, namespace, "walls", "polyline")
-    paths = extract_shapes(root, namespace, "*", "path")
-    elevators = extract_shapes(root, namespace, "shapes", "polygon")
-    stairs = extract_shapes(root, namespace, "shapes", "polyline")
+    svg_width = int(root_attributes.get('width', screen_width))
+    svg_height = int(root_attributes.get('height', screen_height))
+
+    # Normalize the points of every layer at once
+    coords = np.concatenate([layers[layer][0] for layer in LAYERS])
+    max_x, max_y = coords.max(axis=0).tolist() if len(coords) else (svg_width, svg_height)
+    normalized = normalize(coords, max_x, max_y, screen_width, screen_height, precise)
+    points = list(zip(normalized[:, 0].tolist(), normalized[:, 1].tolist()))
+
+    # Split the points back into shapes, layer by layer
+    ends = itertools.accumulate(count for layer in LAYERS for count in layers[layer][1])
+    shapes, start = [], 0
+    for layer in LAYERS:
+        layer_shapes = []
+        for end in itertools.islice(ends, len(layers[layer][1])):
+            layer_shapes.append(points[start:end])
+            start = end
+        shapes.append(layer_shapes)
+    return (screen_width, screen_height, *shapes)
+
+def extract_layers(file_path):
+    """
+    Reads every shape of an SVG in one walk over the document.
     
-    # Normalize points
-    all_shapes = entrances + spaces + walls + paths + elevators + stairs
-    max_x = max((p[0] for shape in all_shapes for p in shape), default=svg_width)
-    max_y = max((p[1] for shape in all_shapes for p in shape), default=svg_height)
+    Each polyline and polygon goes to the layer of the nearest enclosing group whose id
+    is a layer group, however deeply it is nested; every path goes to the paths layer.
+    Shapes without points are skipped.
     
-    return (
-        screen_width, 
-        screen_height, 
-        [normalize(s, max_x, max_y, screen_width, screen_height) for s in entrances],
-        [normalize(s, max_x, max_y, screen_width, screen_height) for s in spaces],
-        [normalize(s, max_x, max_y, screen_width, screen_height) for s in walls],
-        [normalize(s, max_x, max_y, screen_width, screen_height) for s in paths],
-        [normalize(s, max_x, max_y, screen_width, screen_height) for s in elevators],
-        [normalize(s, max_x, max_y, screen_width, screen_height) for s in stairs]
-    )
-
-def extract_shapes(root, namespace, group_id, tag):
+    Parameters:
+        file_path: Path to the SVG file
+        
+    Returns:
+        (root_attributes, layers) tuple: the attributes of the svg element, and a dictionary
+        of layer name ("entrances", "spaces", "walls", "paths", "elevators" or "stairs") to
+        a (coords, counts) tuple as returned by parse_points, shapes in document order
+    """
+    root = ET.parse(file_path).getroot()
+    points_attrs = {layer: [] for layer in LAYERS}
+    paths = []
+
+    def walk(parent, group):
+        for element in parent:
+            tag = element.tag
+            if tag == GROUP_TAG:
+                group_id = element.get('id')
+                walk(element, group_id if group_id in LAYER_GROUPS else group)
+                continue
+            if tag == PATH_TAG:
+                points = parse_path(element.get('d', ''), paths)
+                if points:
+                    paths.append(points)
+            else:
+                layer = LAYER_TARGETS.get((group, tag))
+                if layer is not None:
+                    points_attrs[layer].append(element.get('points', ''))
+            if len(element):
+                walk(element, group)  # Shapes inside <a>, <switch> and the like
+
+    walk(root, None)
+    layers = {layer: parse_points(attrs, f"{file_path}, {layer}") for layer, attrs in points_attrs.items()}
+    layers["paths"] = (np.array([p for path in paths for p in path], dtype=float).reshape(-1, 2),
+                       [len(path) for path in paths])
+    return root.attrib, layers
+
+def parse_points(points_attrs, source="points"):
     """
-    Extracts either polylines, polygons, or paths from a specific group.
+    Parses the 'points' attributes of many polylines or polygons with one numeric conversion.
+    An attribute with an odd number of coordinates raises a ValueError naming its source
+    and shape, rather than losing its last vertex.
     
     Parameters:
-        root: Root element of the SVG tree
-        namespace: XML namespace
-        group_id: ID of the group to extract from (or "*" for all)
-        tag: Type of element to extract ("polyline", "polygon", or "path")
+        points_attrs: List of attribute values, coordinates separated by commas and/or
+                      whitespace, e.g. "0,0 10,0 10,5"
+        source: Where the attributes come from, for error messages
         
     Returns:
-        List of shapes, where each shape is a list of (x, y) tuples
+        (coords, counts) tuple: (n, 2) float array of every point, and the point count of
+        each shape that has any, in order
     """
-    if group_id == "*":
-        group = root
-    else:
-        group = root.find(f".//{{http://www.w3.org/2000/svg}}g[@id='{group_id}']", namespace)
-        
-    shapes = []
-    if group is not None:
-        for element in group.findall(f"{{http://www.w3.org/2000/svg}}{tag}", namespace):
-            if tag == 'path':
-                d_attr = element.get('d', '')
-                points = parse_path(d_attr, shapes)
-            else:
-                points_attr = element.get('points', '')
-                points = [(float(x), float(y)) for x, y in (p.split(',') for p in points_attr.split())]
-            if points:
-                shapes.append(points)
-    return shapes
+    values, counts = [], []
+    for i, points_attr in enumerate(points_attrs):
+        tokens = points_attr.replace(',', ' ').split()
+        if len(tokens) % 2:
+            shown = points_attr if len(points_attr) <= 60 else points_attr[:57] + "..."
+            raise ValueError(f"{source} shape {i + 1}: odd number of coordinates in points=\"{shown}\"")
+        if tokens:
+            counts.append(len(tokens) // 2)
+            values.extend(tokens)
+    return np.array(values, dtype=float).reshape(-1, 2), counts
 
 def parse_path(d_attr, shapes):
     """
@@ -87,14 +139,13 @@ def parse_path(d_attr, shapes):
     Returns:
         List of (x, y) tuples representing the path
     """
-    import re
-    path_commands = re.findall(r'[MLHVCSQTAZmlhvcsqtaz][^MLHVCSQTAZmlhvcsqtaz]*', d_attr)
+    path_commands = PATH_COMMAND.findall(d_attr)
     points = []
     current_pos = (0, 0)
     start_pos = (0, 0)
     for (n, command) in enumerate(path_commands):
         cmd_type = command[0]
-        cmd_values = list(map(float, re.findall(r'-?\d+\.?\d*', command[1:])) )
+        cmd_values = list(map(float, PATH_NUMBER.findall(command[1:])))
         if cmd_type in 'Mm':
             if (len(points) != 0):
                 shapes.append(points)
@@ -134,26 +185,36 @@ def parse_path(d_attr, shapes):
             points.append(current_pos)
     return points
 
-def normalize(shape, max_x, max_y, screen_width, screen_height):
+def normalize(coords, max_x, max_y, screen_width, screen_height, precise=PRECISE_COORDINATES):
     """
-    Normalizes shape coordinates to fit within screen dimensions.
+    Normalizes coordinates to fit within screen dimensions.
+    
+    The normalized coordinates are the model space: panning and zooming are applied
+    on top of them by the window's view transform only, so precise mode never rounds
+    them again.
     
     Parameters:
-        shape: List of (x, y) tuples
+        coords: (n, 2) array of points
         max_x: Maximum x-coordinate in the original SVG
         max_y: Maximum y-coordinate in the original SVG
         screen_width: Width of the display window
         screen_height: Height of the display window
+        precise: Keep float coordinates instead of truncating them to ints
         
     Returns:
-        List of normalized (x, y) tuples
+        (n, 2) array of normalized points, float or int
     """
-    return [(int(x / max_x * screen_width), int(y / max_y * screen_height)) for x, y in shape]
+    normalized = np.asarray(coords, dtype=float) / (max_x, max_y) * (screen_width, screen_height)
+    return normalized if precise else normalized.astype(int)
 
-def export_svg(file_path, entrances, spaces, walls, midlines, debug=False, midline_colors=None, elevators=None, stairs=None):
+def export_svg(file_path, entrances, spaces, walls, midlines, debug=False, midline_colors=None, elevators=None, stairs=None,
+               midline_chunks=None):
     """
     Exports shapes to an SVG file.
     
+    With midline_chunks, the midlines are streamed into the midlines group one chunk at
+    a time as the file is written, so they are never all in the document at once.
+    
     Parameters:
         file_path: Path where the SVG will be saved
         entrances: List of entrance polylines
@@ -163,6 +224,8 @@ def export_svg(file_path, entrances, spaces, walls, midlines, debug=False, midli
         debug: Whether to include debug information (default: False)
         midline_colors: Colors for midlines if in debug mode (default: None)
         elevators: List of Elevator objects (default: None)
+        stairs: List of Stairs objects (default: None)
+        midline_chunks: Iterable of lists of midline paths, written after midlines (default: None)
     """
     svg = ET.Element('svg', xmlns="http://www.w3.org/2000/svg", width="800", height="600")
     
@@ -245,5 +308,18 @@ def export_svg(file_path, entrances, spaces, walls, midlines, debug=False, midli
     if debug:
         svg.append(debug_group)
 
-    tree = ET.ElementTree(svg)
-    tree.write(file_path)
\ No newline at end of file
+    if midline_chunks is None:
+        tree = ET.ElementTree(svg)
+        tree.write(file_path)
+        return
+
+    # Serialize the document around a marker in the midlines group and stream the chunks in its place
+    marker = uuid.uuid4().hex
+    midlines_group.text = marker
+    head, tail = ET.tostring(svg, encoding="unicode").split(marker)
+    with open(file_path, "w", encoding="us-ascii", errors="xmlcharrefreplace") as file:
+        file.write(head)
+        for paths in midline_chunks:
+            file.write("".join(ET.tostring(create_polyline(path, MIDLINE_COLOR), encoding="unicode")
+                               for path in paths))
+        file.write(tail)
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Validation and repair of parsed floor geometry, run once when a floor is loaded.
+
+CAD exports often repeat vertices, wind polygons either way, cross their own edges
+or contain doors collapsed to a point. Spaces are cleaned here so the midline
+pipeline only ever sees valid polygons, and every change is written to a per-shape
+health report. Repaired geometry is cached on disk by SVG file hash.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+from autosave import atomic_write_json
+from svg_parser import parse_svg, LAYERS
+from values import PRECISE_COORDINATES, GEOMETRY_CACHE_DIR
+
+REPAIR_VERSION = 1  # Bump when repairs change, so cached results made by older code are ignored
+
+def flatten(shapes):
+    """
+    Packs shapes into one coordinate array for vectorized checks.
+
+    Returns:
+        (coords, starts, counts) tuple: coords is an (n, 2) float array of every point,
+        starts and counts the offset and length of each shape's run
+    """
+    counts = np.fromiter((len(s) for s in shapes), dtype=np.intp, count=len(shapes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+    coords = np.array([p for s in shapes for p in s], dtype=float).reshape(-1, 2)
+    return coords, starts, counts
+
+def duplicate_mask(coords, starts, counts, closed):
+    """
+    Marks points equal to the point before them in the same shape, and for closed
+    shapes a last point repeating the first.
+
+    Returns:
+        Boolean array, True for points to drop
+    """
+    drop = np.zeros(len(coords), dtype=bool)
+    if len(coords) > 1:
+        drop[1:] = (coords[1:] == coords[:-1]).all(axis=1)
+    drop[starts[counts > 0]] = False  # The first point of a shape has no predecessor
+    if closed:
+        kept = np.add.reduceat(~drop, starts) if len(coords) else counts
+        kept = np.where(counts > 0, kept, 0)
+        # Last kept point of each shape with at least two of them
+        last = np.flatnonzero(~drop)
+        shape_of = np.repeat(np.arange(len(counts)), counts)[last]
+        ends = np.full(len(counts), -1, dtype=np.intp)
+        ends[shape_of] = last
+        closing = (kept > 1) & (ends >= 0)
+        closing[closing] = (coords[ends[closing]] == coords[starts[closing]]).all(axis=1)
+        drop[ends[closing]] = True
+    return drop
+
+def signed_areas(coords, starts, counts):
+    """Shoelace area of each ring, positive when counter-clockwise in model coordinates"""
+    if not len(coords):
+        return np.zeros(len(counts))
+    following = np.arange(1, len(coords) + 1)
+    ends = starts + counts - 1
+    nonempty = counts > 0
+    following[ends[nonempty]] = starts[nonempty]  # Wrap around to the start of the same ring
+    following[following == len(coords)] = 0
+    cross = coords[:, 0] * coords[following, 1] - coords[following, 0] * coords[:, 1]
+    areas = np.zeros(len(counts))
+    areas[nonempty] = np.add.reduceat(cross, starts[nonempty]) / 2
+    return areas
+
+def duplicates_issue(count):
+    return f"{count} duplicate point" + ("s" if count > 1 else "")
+
+def largest_ring(geometry):
+    # Exterior of the biggest polygon that make_valid produced, without the closing point
+    polygons = [g for g in shapely.get_parts(geometry) if isinstance(g, shapely.Polygon) and not g.is_empty]
+    if not polygons:
+        return None, 0
+    polygon = max(polygons, key=lambda g: g.area)
+    return list(orient(polygon).exterior.coords)[:-1], len(polygons)  # Counter-clockwise, any shapely 2
+
+def repair_lines(shapes, layer, report):
+    """Drops repeated points from polylines and the polylines left with fewer than two points"""
+    if not shapes:
+        return []
+    coords, starts, counts = flatten(shapes)
+    drop = duplicate_mask(coords, starts, counts, closed=False)
+    dropped = np.add.reduceat(drop, starts) if len(coords) else counts
+    repaired = []
+    for i, shape in enumerate(shapes):
+        issues = []
+        if counts[i] and dropped[i]:
+            issues.append(duplicates_issue(dropped[i]))
+            keep = ~drop[starts[i]:starts[i] + counts[i]]
+            shape = [p for p, k in zip(shape, keep) if k]
+        if len(shape) < 2:
+            issues.append("degenerate, removed")
+        else:
+            repaired.append(shape)
+        if issues:
+            report.append({"layer": layer, "index": i, "issues": issues})
+    return repaired
+
+def repair_polygons(shapes, report):
+    """
+    Dedupes, orients and validates space polygons. Spaces are never removed, so saved
+    selections keep matching; those that cannot be repaired are kept as parsed and
+    reported as degenerate.
+    """
+    if not shapes:
+        return []
+    coords, starts, counts = flatten(shapes)
+    drop = duplicate_mask(coords, starts, counts, closed=True)
+    dropped = np.add.reduceat(drop, starts) if len(coords) else counts
+    repaired, issues = [], []
+    for i, shape in enumerate(shapes):
+        shape_issues = []
+        if counts[i] and dropped[i]:
+            shape_issues.append(duplicates_issue(dropped[i]))
+            keep = ~drop[starts[i]:starts[i] + counts[i]]
+            shape = [p for p, k in zip(shape, keep) if k]
+        repaired.append(shape)
+        issues.append(shape_issues)
+
+    # Orientation and validity of all deduped rings at once
+    coords, starts, counts = flatten(repaired)
+    areas = signed_areas(coords, starts, counts)
+    rings = counts >= 3
+    polygons = np.full(len(repaired), None, dtype=object)
+    polygons[rings] = [shapely.Polygon(repaired[i]) for i in np.flatnonzero(rings)]
+    valid = np.zeros(len(repaired), dtype=bool)
+    valid[rings] = shapely.is_valid(polygons[rings])
+
+    for i in range(len(repaired)):
+        if not rings[i] or (valid[i] and areas[i] == 0):
+            issues[i].append("degenerate")
+        elif not valid[i]:
+            reason = shapely.is_valid_reason(polygons[i]).split("[")[0]
+            ring, parts = largest_ring(shapely.make_valid(polygons[i]))
+            if ring is None:
+                issues[i].append(f"{reason}, degenerate")
+            else:
+                repaired[i] = ring
+                issues[i].append(f"{reason}, repaired" + (f" keeping 1 of {parts} parts" if parts > 1 else ""))
+        elif areas[i] < 0:
+            repaired[i] = repaired[i][::-1]
+            issues[i].append("reversed")
+        if any("degenerate" in issue for issue in issues[i]):
+            repaired[i] = shapes[i]  # Kept as parsed so it still draws; it gets no midline
+        if issues[i]:
+            report.append({"layer": "spaces", "index": i, "issues": issues[i]})
+    return repaired
+
+def repair_geometry(geometry):
+    """
+    Repairs a parse_svg result.
+
+    Spaces lose repeated vertices, are wound counter-clockwise and made valid (keeping the
+    largest part of a self-intersecting outline). Entrances and walls lose repeated
+    vertices, and those reduced to a single point are removed.
+
+    Parameters:
+        geometry: Tuple returned by parse_svg
+
+    Returns:
+        (geometry, report) tuple: the repaired tuple in the same layout, and a list of
+        {"layer", "index", "issues"} entries, one per changed shape, indexed as parsed
+    """
+    width, height, entrances, spaces, walls, paths, elevators, stairs = geometry
+    report = []
+    entrances = repair_lines(entrances, "entrances", report)
+    spaces = repair_polygons(spaces, report)
+    walls = repair_lines(walls, "walls", report)
+    report.sort(key=lambda entry: LAYERS.index(entry["layer"]))
+    return (width, height, entrances, spaces, walls, paths, elevators, stairs), report
+
+def summarize(report):
+    """
+    One-line summary of a health report, e.g. "spaces: 2 repaired, 1 degenerate".
+
+    Orientation fixes alone are not counted as problems.
+    """
+    counts = {}
+    for entry in report:
+        issues = [issue for issue in entry["issues"] if issue != "reversed"]
+        if not issues:
+            continue
+        if any("degenerate" in issue for issue in issues):
+            kind = "removed" if any("removed" in issue for issue in issues) else "degenerate"
+        else:
+            kind = "repaired"
+        layer = counts.setdefault(entry["layer"], {})
+        layer[kind] = layer.get(kind, 0) + 1
+    return "; ".join(f"{layer}: " + ", ".join(f"{n} {kind}" for kind, n in kinds.items())
+                     for layer, kinds in counts.items())
+
+def file_digest(file_path, *options):
+    """SHA-256 of a file's bytes together with the options it was parsed with"""
+    digest = hashlib.sha256(json.dumps([REPAIR_VERSION, *options]).encode())
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(2 ** 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_svg(file_path, screen_width=800, screen_height=600, precise=PRECISE_COORDINATES,
+             cache_dir=GEOMETRY_CACHE_DIR):
+    """
+    Parses and repairs an SVG floor, reusing the cached result for a file with the same contents.
+
+    Parameters:
+        file_path: Path to the SVG file
+        screen_width, screen_height, precise: As for parse_svg
+        cache_dir: Directory of the repaired geometry cache, or None to always parse
+
+    Returns:
+        (geometry, report) tuple as returned by repair_geometry
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, file_digest(file_path, screen_width, screen_height, precise) + ".json")
+        try:
+            with open(cache_path) as file:
+                data = json.load(file)
+            layers = [[[tuple(p) for p in shape] for shape in data[layer]] for layer in LAYERS]
+            return (data["width"], data["height"], *layers), data["report"]
+        except (OSError, ValueError, KeyError):
+            pass  # Not cached yet, or a cache file from an interrupted write
+
+    geometry, report = repair_geometry(parse_svg(file_path, screen_width, screen_height, precise))
+    if cache_path is not None:
+        data = {"width": geometry[0], "height": geometry[1], "report": report}
+        data.update(zip(LAYERS, geometry[2:]))
+        try:
+            atomic_write_json(cache_path, data)
+        except OSError as e:
+            print(f"Could not cache repaired geometry: {e}")
+    return geometry, report
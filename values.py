@@ -7,11 +7,87 @@ WALL_COLOR = (200, 200, 200)  # Gray
 HIGHLIGHT_COLOR = (50, 50, 50)  # Darker
 CLICKED_COLOR = (0, 150, 150)  # Orange
 MIDLINE_COLOR = (255, 0, 0)  # Red
+WALL_CROSSING_COLOR = (255, 128, 0)  # Orange, midlines that pass through a wall
 ELEVATOR_COLOR = (255, 0, 255)  # Magenta
 ELEVATOR_SELECTED_COLOR = (255, 150, 255)  # Light Magenta
 STAIRS_COLOR = (200, 200, 0)  # Yellow
 STAIRS_SELECTED_COLOR = (255, 255, 0)  # Light Yellow
 SHAPE_COLOR = (0, 0, 0)  # Black
+BOX_SELECT_COLOR = (255, 255, 255)  # White, outline of a box selection
+PREVIEW_COLOR = (255, 170, 170)  # Light red, midline preview of hovered and newly selected spaces
+
+# Geometry Constants
+PRECISE_COORDINATES = True  # Keep parsed coordinates as floats instead of truncating them to ints
+SNAP_TOLERANCE = 0.01  # Midline points closer than this are treated as the same network node
+
+# Midline Constants
+MIDLINE_FAST_PATH = True  # Solve rectangular rooms analytically instead of with pygeoops
+MIDLINE_DENSIFY_FACTOR = 0.25  # Densify distance as a fraction of the polygon width
+MIDLINE_DENSIFY_MIN = 5  # Smallest densify distance passed to pygeoops, the former fixed distance
+MIDLINE_DENSIFY_MAX = 20  # Largest densify distance passed to pygeoops
+MIDLINE_DENSIFY_FALLBACK = 5  # Fixed densify distance used when the adaptive one collapses
+MIDLINE_RIGHT_ANGLE_TOLERANCE = 1e-3  # Cosine tolerance for right angles and collinear vertices
+MIDLINE_SQUARE_TOLERANCE = 0.1  # Rectangles whose sides differ by less than this fraction go through pygeoops
+
+# Network Stitching Constants
+CONNECTOR_DISTANCE = 5  # Doors, elevators and stairs this close to a space connect to its midline
+STITCH_DOOR_FRACTION = 0.5  # A door also opens into spaces this far away, as a fraction of its width (thick walls)
+STITCH_ENDPOINT_DISTANCE = 2  # Loose connector ends this close are bridged
+
+# Path Optimization Constants
+PATH_SIMPLIFY_TOLERANCE = 1.0  # Maximum distance a simplified midline may move
+JUNCTION_SNAP_TOLERANCE = 0.5  # Midline vertices closer than this become one junction
+
+# Rendering Constants
+DIRTY_RECT_PADDING = 3  # Extra pixels repainted around changed shapes to cover line width
+
+# Picking Constants
+PICKING_BACKEND = "hitmap"  # "hitmap" for the tiled raster lookup, "index" for point-in-polygon tests
+HIT_MAP_CELL = 1.0  # Side of a hit-map cell in model units
+HIT_MAP_TILE = 64  # Cells along the side of a hit-map tile, built when first hovered
+
+# Event Loop Constants
+EVENT_WAIT_TIMEOUT = 1000  # Milliseconds the idle loop sleeps before waking without input
+JOB_DONE_EVENT = pygame.USEREVENT + 1  # Posted when a background job finishes
+
+# Workspace Constants
+WORKER_COUNT = 2  # Background workers shared by all open floors
+CENTERLINE_CACHE_SIZE = 20000  # Space midlines kept in the shared centerline cache
+MAX_LOADED_FLOORS = 4  # Parsed floors kept in memory, the rest are re-parsed when shown
+FLOOR_VERTEX_BUDGET = 2000000  # Parsed vertices kept in memory across all floors
+
+# Speculative Centerline Constants
+MIDLINE_PREVIEW = True  # Precompute and preview centerlines of hovered and newly selected spaces
+SPECULATIVE_RADIUS = 100  # Spaces this close to the cursor, in model units, are precomputed too
+SPECULATIVE_NEIGHBOURS = 8  # Most spaces near the cursor queued at once
+SPECULATIVE_NICENESS = 10  # Nice value of the speculative worker thread (Linux only)
+
+# Validation Constants
+GEOMETRY_CACHE_DIR = "./output/cache"  # Repaired floor geometry, one file per SVG content hash
+
+# Chunked Processing Constants
+CHUNK_TILE_SIZE = 100  # Side of the spatial tiles spaces are processed in, in model units
+CHUNK_BUCKETS = 64  # Vertex hash buckets joined one at a time to connect tiles
+
+# Distance Matrix Constants
+ENTRANCE_DISTANCE = 5  # Door midpoints this close to a space open into it
+ELEVATOR_FLOOR_COST = 20  # Travel cost of riding an elevator one floor, in model units
+STAIRS_FLOOR_COST = 60  # Travel cost of climbing one flight of stairs, in model units
+DISTANCE_BLOCK_SIZE = 256  # Side of the separately compressed blocks of a saved distance matrix
+
+# Service Constants
+SERVICE_HOST = "127.0.0.1"  # The navigation service only listens locally
+SERVICE_PORT = 8765
+SERVICE_MAX_PENDING = 16  # Computations queued or running before new requests are refused
+SERVICE_RESULT_CACHE_SIZE = 32  # Finished midline networks kept for repeated requests
+
+# Autosave Constants
+AUTOSAVE_INTERVAL = 5000  # Milliseconds between journal writes while editing
+AUTOSAVE_COMPACT_RECORDS = 50  # Journal records folded into a new settings snapshot
+
+# Undo History Constants
+HISTORY_LIMIT = 200  # Undo steps kept per floor
+HISTORY_ITEM_BUDGET = 1000000  # Changed indices, markers and midlines held by a floor's undo steps
 
 # Path Constants
 INPUT_PATH = "./ver-0.0.4-svgs/three.svg"  # Replace with your SVG file path
@@ -20,6 +96,7 @@ OUTPUT_PATH = "./output/output.svg"  # Replace with your output SVG file path
 # Keyboard Shortcuts
 KEY_MIDLINE = pygame.K_m  # Calculate midline paths for selected spaces
 KEY_ALL_MIDLINES = pygame.K_a  # Calculate all midline paths
+KEY_OPTIMIZE = pygame.K_p  # Simplify and smooth midline paths
 KEY_EXPORT = pygame.K_e  # Export SVG
 KEY_EXPORT_DEBUG = pygame.K_r  # Export SVG with debug info
 KEY_SAVE = pygame.K_s  # Save selected spaces
@@ -29,9 +106,20 @@ KEY_ELEVATOR_MODE = pygame.K_v  # Toggle elevator mode
 KEY_ID_UP = pygame.K_UP  # Increment elevator ID
 KEY_ID_DOWN = pygame.K_DOWN  # Decrement elevator ID
 KEY_DELETE = pygame.K_DELETE  # Delete selected elevator
+KEY_DETECT_MARKERS = pygame.K_t  # Create elevators and stairs from the shapes group
+KEY_IMPORT_MARKERS = pygame.K_i  # Import elevator and stairs placements from CSV/JSON
+KEY_NEXT_FLOOR = pygame.K_PAGEDOWN  # Show the next open floor
+KEY_PREV_FLOOR = pygame.K_PAGEUP  # Show the previous open floor
+KEY_OPEN_FLOOR = pygame.K_o  # Open another floor in the same window
+KEY_UNDO = pygame.K_z  # With Ctrl, undo the last edit
+KEY_REDO = pygame.K_y  # With Ctrl, redo the last undone edit
 
 # Elevator Constants
 MAX_ELEVATOR_ID = 99  # Maximum elevator ID
 
+# Marker Detection Constants
+MARKER_MATCH_DISTANCE = 10  # Markers this close on different floors are the same shaft
+MARKER_GRID_CELL = 32  # Cell size of the marker hit-test grid, at least the largest click radius
+
 # Stairs Constants
 MAX_STAIRS_ID = 99  # Maximum stairs ID
\ No newline at end of file
@@ -0,0 +1,262 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from validation import load_svg
+from geometry_utils import find_midline_path
+from collision import WallIndex
+from selection import SpaceIndex, HitMap
+from pipeline import space_midline_path
+from values import WORKER_COUNT, CENTERLINE_CACHE_SIZE, MAX_LOADED_FLOORS, FLOOR_VERTEX_BUDGET, PICKING_BACKEND
+from values import SPECULATIVE_NICENESS
+
+class CenterlineCache:
+    """Thread-safe LRU cache of midline paths keyed by polygon geometry, shared by all floors"""
+    def __init__(self, max_entries=CENTERLINE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, polygon, count=False):
+        # Return the cached midline of a polygon or None, with count also tallying the hit or miss
+        key = tuple(map(tuple, polygon))
+        with self.lock:
+            midline = self.entries.get(key)
+            if midline is not None:
+                self.entries.move_to_end(key)
+            if count:
+                if midline is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return midline
+
+    def put(self, polygon, midline):
+        key = tuple(map(tuple, polygon))
+        with self.lock:
+            self.entries[key] = midline
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def midline_path(self, polygon):
+        # Same result as find_midline_path, computed at most once per polygon
+        midline = self.get(polygon, count=True)
+        if midline is None:
+            midline = find_midline_path(polygon)
+            self.put(polygon, midline)
+        return midline
+
+
+def lower_thread_priority():
+    # Best effort: Linux gives every thread its own nice value, elsewhere the worker keeps normal priority
+    if sys.platform.startswith("linux"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SPECULATIVE_NICENESS)
+        except OSError:
+            pass
+
+
+class CenterlinePrefetcher:
+    """
+    Speculative centerlines for spaces the user is likely to ask for next, computed into
+    the centerline cache on a single low-priority worker of their own, so they never
+    hold up jobs in the shared pool. Each request cancels the queued work the previous
+    one asked for and no longer wants.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=1, initializer=lower_thread_priority)
+        self.pending = {}  # Key to Future of the targets queued or running
+
+    def request(self, targets):
+        """
+        Queues the centerlines of targets that are not cached yet.
+
+        Parameters:
+            targets: List of (key, polygon) pairs, most wanted first; keys are hashable,
+                     e.g. (floor, space index)
+
+        Returns:
+            List of (key, future) pairs for the newly queued targets; each future's result
+            is the midline path, and it is cancelled if a later request drops its key
+            before the worker starts on it
+        """
+        wanted = {key for key, _ in targets}
+        for key, future in list(self.pending.items()):
+            if future.done() or (key not in wanted and future.cancel()):
+                del self.pending[key]
+
+        queued = []
+        for key, polygon in targets:
+            if key in self.pending or self.cache.get(polygon) is not None:
+                continue
+            future = self.pending[key] = self.executor.submit(space_midline_path, polygon, self.cache)
+            queued.append((key, future))
+        return queued
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Floor:
+    """A floor loaded into the workspace: parsed geometry that can be evicted, plus annotation state that is kept"""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.map_name = os.path.splitext(os.path.basename(file_path))[0]
+        self.geometry = None  # parse_svg result after repair, None while evicted
+        self.health = None  # Repair report of the geometry, kept when it is evicted
+        self.pending = None  # Future of a background parse
+        self.state = None  # Window attributes saved while the floor is off screen
+        self.last_used = 0
+        self._wall_index = None
+        self._space_index = None
+        self._hit_map = None
+
+    @property
+    def wall_index(self):
+        # Indexed walls, built on first use and dropped with the geometry
+        if self._wall_index is None and self.geometry is not None:
+            self._wall_index = WallIndex(self.geometry[4])
+        return self._wall_index
+
+    @property
+    def space_index(self):
+        # Indexed spaces for picking and bulk selection, built on first use and dropped with the geometry
+        if self._space_index is None and self.geometry is not None:
+            self._space_index = SpaceIndex(self.geometry[3])
+        return self._space_index
+
+    @property
+    def picker(self):
+        # Hover and click lookup: the hit map, or the space index itself with PICKING_BACKEND = "index"
+        if PICKING_BACKEND != "hitmap" or self.geometry is None:
+            return self.space_index
+        if self._hit_map is None:
+            self._hit_map = HitMap(self.space_index)
+        return self._hit_map
+
+    def unload(self):
+        # The indexes and hit map describe this geometry, so they go with it
+        self.geometry = None
+        self._wall_index = None
+        self._space_index = None
+        self._hit_map = None
+
+    @property
+    def loaded(self):
+        return self.geometry is not None
+
+    @property
+    def vertex_count(self):
+        # Rough memory footprint of the parsed geometry
+        if self.geometry is None:
+            return 0
+        return sum(len(shape) for layer in self.geometry[2:] for shape in layer)
+
+
+class Workspace:
+    """Keeps several floors open at once with one worker pool and one centerline cache"""
+    def __init__(self, max_workers=WORKER_COUNT):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.writer = ThreadPoolExecutor(max_workers=1)  # Settings writes, kept in order
+        self.centerline_cache = CenterlineCache()
+        self.prefetcher = CenterlinePrefetcher(self.centerline_cache)
+        self.floors = []
+        self.clock = 0
+        self.lock = threading.Lock()
+
+    def add_floor(self, file_path, geometry=None, health=None):
+        """
+        Adds a floor to the workspace, or returns the existing one for the same file.
+
+        Parameters:
+            file_path: Path to the SVG file
+            geometry: Already parsed and repaired geometry (default: parsed on demand)
+            health: Repair report of that geometry
+
+        Returns:
+            The Floor object
+        """
+        for floor in self.floors:
+            if os.path.abspath(floor.file_path) == os.path.abspath(file_path):
+                return floor
+        floor = Floor(file_path)
+        floor.geometry = geometry
+        floor.health = health
+        self.floors.append(floor)
+        return floor
+
+    def load(self, floor):
+        """Makes sure the floor's geometry is parsed, waiting for a prefetch if one is running"""
+        with self.lock:
+            pending = floor.pending
+        if pending is not None:
+            pending.result()
+        if floor.geometry is None:
+            floor.geometry, floor.health = load_svg(floor.file_path)
+        with self.lock:
+            self.clock += 1
+            floor.last_used = self.clock
+        return floor.geometry
+
+    def prefetch(self, floor):
+        """Parses an evicted floor in the background so switching to it is instant"""
+        with self.lock:
+            if floor.loaded or floor.pending is not None:
+                return
+            floor.pending = self.executor.submit(self._parse, floor)
+
+    def _parse(self, floor):
+        try:
+            geometry, health = load_svg(floor.file_path)
+        except BaseException:
+            with self.lock:
+                floor.pending = None
+            raise
+        # Publish the geometry and clear pending together, so load() never finds neither
+        with self.lock:
+            floor.geometry, floor.health = geometry, health
+            floor.pending = None
+            self.clock += 1
+            floor.last_used = self.clock  # Count as recently used so eviction keeps it
+        return geometry
+
+    def neighbours(self, floor):
+        """Returns the floors before and after the given one"""
+        index = self.floors.index(floor)
+        return [self.floors[i] for i in (index - 1, index + 1) if 0 <= i < len(self.floors)]
+
+    def evict(self, active):
+        """
+        Drops the parsed geometry of least recently used floors until the loaded floors
+        fit in MAX_LOADED_FLOORS and FLOOR_VERTEX_BUDGET. The active floor is never evicted,
+        and annotation state is kept so evicted floors reopen unchanged.
+
+        Parameters:
+            active: The floor currently on screen
+
+        Returns:
+            List of evicted floors
+        """
+        evicted = []
+        with self.lock:
+            loaded = sorted((f for f in self.floors if f.loaded and f is not active), key=lambda f: f.last_used)
+            count = len(loaded) + (1 if active.loaded else 0)
+            vertices = sum(f.vertex_count for f in loaded) + active.vertex_count
+            for floor in loaded:
+                if count <= MAX_LOADED_FLOORS and vertices <= FLOOR_VERTEX_BUDGET:
+                    break
+                count -= 1
+                vertices -= floor.vertex_count
+                floor.unload()
+                evicted.append(floor)
+        return evicted
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.prefetcher.shutdown()
+        self.writer.shutdown(wait=True)  # Let pending autosaves reach the disk